@@ -24,6 +24,14 @@ class ProfileRepository(metaclass=abc.ABCMeta):
     def update_user_app_metadata(self, obj):
         pass
 
+    @abc.abstractmethod
+    def get_user_app_metadata(self):
+        pass
+
+    @abc.abstractmethod
+    def get_auth0_app_metadata(self):
+        pass
+
     @abc.abstractmethod
     def delete_profile(self):
         pass
@@ -58,6 +66,10 @@ class SupplierRepository(metaclass=abc.ABCMeta):
     def get_all_users_in_supplier(self, supplier_id):
         pass
 
+    @abc.abstractmethod
+    def remove_supplier_from_users_app_metadata(self, supplier_id, user_ids):
+        pass
+
 
 class BrandRepository(metaclass=abc.ABCMeta):
     @abc.abstractmethod
@@ -100,6 +112,10 @@ class ProductRepository(metaclass=abc.ABCMeta):
     def save_product(self, obj):
         pass
 
+    @abc.abstractmethod
+    def save_products(self, objs):
+        pass
+
     @abc.abstractmethod
     def get_product_by_id(self, supplier_id, entity_id):
         pass
@@ -109,7 +125,7 @@ class ProductRepository(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def get_all_products(self, supplier_id):
+    def get_all_products(self, supplier_id, fields=None):
         pass
 
 
@@ -127,11 +143,21 @@ class OnHandRepository(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def get_all_on_hands(self, supplier_id):
+    def get_all_on_hands(self, supplier_id, fields=None):
         pass
 
     @abc.abstractmethod
-    def process_projections_queue(self, supplier_id, brand_id, package_type_id, start_date, request_id):
+    def process_projections_queue(self, supplier_id, brand_id, package_type_id, start_date, request_id,
+                                  incremental=True):
+        pass
+
+    @abc.abstractmethod
+    def process_supplier_projections_queue(self, supplier_id, start_date, request_id, products=None,
+                                           incremental=True):
+        pass
+
+    @abc.abstractmethod
+    def requeue_projections(self, obj, attempt):
         pass
 
     # Methods like ones below can be added in future
@@ -250,7 +276,7 @@ class CountRepository(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def get_all_counts(self, supplier_id):
+    def get_all_counts(self, supplier_id, fields=None):
         pass
 
     @abc.abstractmethod
@@ -378,6 +404,10 @@ class DistributorsRepository(metaclass=abc.ABCMeta):
     def get_all_users_in_distributor(self, distributor_id):
         pass
 
+    @abc.abstractmethod
+    def remove_distributor_from_users_app_metadata(self, distributor_id, user_ids):
+        pass
+
 
 class MerchandiseRepository(metaclass=abc.ABCMeta):
     @abc.abstractmethod
@@ -397,6 +427,20 @@ class MerchandiseRepository(metaclass=abc.ABCMeta):
         pass
 
 
+class BulkRepository(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    def save_many(self, obj_type, objs, attributes, notification):
+        pass
+
+    @abc.abstractmethod
+    def save_brands(self, objs):
+        pass
+
+    @abc.abstractmethod
+    def save_merchandises(self, objs):
+        pass
+
+
 class Repository(ProfileRepository,
                  SupplierRepository,
                  BrandRepository,
@@ -413,6 +457,7 @@ class Repository(ProfileRepository,
                  InventoryRepository,
                  SupplierDistributorsRepository,
                  DistributorsRepository,
+                 BulkRepository,
                  BaseRepository,
                  metaclass=abc.ABCMeta):
     pass
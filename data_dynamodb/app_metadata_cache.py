@@ -0,0 +1,60 @@
+"""
+Short lived cache of users' app_metadata, shared by insert_repo() and the repositories, so that a request
+reads it once from each of its sources:
+
+- PROFILE, the copy kept on the user profile in dynamodb, read by get_user_app_metadata()
+- AUTH0, the Auth0 user, read by Auth0.get_app_metadata()
+
+The two are written one after the other and can disagree, so they are cached apart. Only successful,
+non-empty reads are cached, and read-modify-write paths read Auth0 fresh before writing it back.
+
+Entries live in the module, so a warm lambda container keeps them across requests for at most
+APP_METADATA_TTL_SECONDS. Writers call invalidate() right after updating app_metadata, which only clears
+the cache of the container serving the write: every other warm container keeps authorizing a revoked
+supplier or distributor membership until its entry expires. The TTL is that revocation window, keep it
+to a few seconds, long enough to share the reads of a request and of a burst of requests, no longer.
+
+Always import it as data_dynamodb.app_metadata_cache, a second import path would be a second cache.
+"""
+import copy
+import time
+
+
+# revocation window of the memberships in the other warm containers, see above
+APP_METADATA_TTL_SECONDS = 5
+
+PROFILE = 'profile'
+AUTH0 = 'auth0'
+
+# (source, user_id) -> (app_metadata, cached_at)
+_app_metadata = {}
+
+
+def get(source, user_id):
+    """
+    :return: a copy of the app_metadata of user_id cached from source, None when missing or expired
+    """
+    entry = _app_metadata.get((source, user_id))
+    if entry is None:
+        return None
+
+    app_metadata, cached_at = entry
+    if time.time() - cached_at > APP_METADATA_TTL_SECONDS:
+        _app_metadata.pop((source, user_id), None)
+        return None
+
+    # callers modify app_metadata before writing it back
+    return copy.deepcopy(app_metadata)
+
+
+def put(source, user_id, app_metadata):
+    if not app_metadata:
+        # an empty app_metadata is more likely a failed read than a user without memberships
+        return
+    _app_metadata[(source, user_id)] = (copy.deepcopy(app_metadata), time.time())
+
+
+def invalidate(user_id):
+    """Drop the app_metadata of user_id cached from every source"""
+    for source in (PROFILE, AUTH0):
+        _app_metadata.pop((source, user_id), None)
@@ -0,0 +1,182 @@
+"""
+Named Aurora statements, run with ExtendedAuroraStorage.execute_named(), query_named() and
+batch_execute_named(). Values are bound as Data API parameters (:name), never formatted into the sql.
+"""
+
+# Source rows of the projections, read with projections.sources then projections.sources_after.
+# :skus lists the products to read, "<brand_id>:<package_type_id>" comma separated.
+# The leases taken by :request_id at :timestamp come back in the same round trip, as 'lease' rows.
+# Pages of :count rows follow the unique (brand_id, package_type_id, source, day, actual) order, none of them
+# NULL, the next page starts right after the last row of the previous one.
+_PROJECTION_SOURCES = """
+        SELECT source, brand_id, package_type_id, day, quantity, actual
+        FROM (
+            SELECT 'on_hand' AS source, brand_id, package_type_id, created_on AS day, quantity, actual
+            FROM on_hand
+            USE INDEX (by_created_on_and_supplier_id)
+            WHERE supplier_id = :supplier_id
+                AND FIND_IN_SET(CONCAT(brand_id, ':', package_type_id), :skus)
+                AND (created_on BETWEEN :start_date_minus_one AND :end_date)
+            UNION ALL
+            SELECT 'production' AS source, brand_id, package_type_id, production_date AS day, CAST(SUM(quantity) AS SIGNED) AS quantity, false AS actual
+            FROM production
+            USE INDEX (by_production_date_and_supplier_id)
+            WHERE supplier_id = :supplier_id
+                AND FIND_IN_SET(CONCAT(brand_id, ':', package_type_id), :skus)
+                AND (production_date BETWEEN :start_date AND :end_date)
+            GROUP BY brand_id, package_type_id, production_date
+            UNION ALL
+            SELECT 'sales' AS source, brand_id, package_type_id, sale_date AS day, CAST(SUM(quantity) AS SIGNED) AS quantity, false AS actual
+            FROM sales
+            USE INDEX (by_sale_date_and_supplier_id)
+            WHERE supplier_id = :supplier_id
+                AND FIND_IN_SET(CONCAT(brand_id, ':', package_type_id), :skus)
+                AND (sale_date BETWEEN :start_date AND :end_date)
+            GROUP BY brand_id, package_type_id, sale_date
+            UNION ALL
+            SELECT 'adjustments' AS source, brand_id, package_type_id, adjustment_date AS day, CAST(SUM(quantity) AS SIGNED) AS quantity, false AS actual
+            FROM adjustments
+            USE INDEX (by_adjustment_date_and_supplier_id)
+            WHERE supplier_id = :supplier_id
+                AND FIND_IN_SET(CONCAT(brand_id, ':', package_type_id), :skus)
+                AND (adjustment_date BETWEEN :start_date AND :end_date)
+            GROUP BY brand_id, package_type_id, adjustment_date
+            UNION ALL
+            SELECT 'lease' AS source, brand_id, package_type_id, CAST(:start_date_minus_one AS DATE) AS day, fencing_token AS quantity, false AS actual
+            FROM projection_locks
+            WHERE request_id = :request_id AND timestamp = :timestamp
+                AND FIND_IN_SET(CONCAT(brand_id, ':', package_type_id), :skus)
+        ) AS sources{AFTER}
+        ORDER BY brand_id, package_type_id, source, day, actual
+        LIMIT :count"""
+
+QUERIES = {
+    # PROJECTIONS
+    'projections.sources': _PROJECTION_SOURCES.format(AFTER=''),
+
+    'projections.sources_after': _PROJECTION_SOURCES.format(AFTER="""
+        WHERE (brand_id, package_type_id, source, day, actual)
+            > (:after_brand_id, :after_package_type_id, :after_source, :after_day, :after_actual)"""),
+
+    # Fenced writes: a row is only written while :request_id still holds the lease of its product with
+    # :fencing_token. The lease row is read and locked by the statement itself, the fencing does not depend
+    # on the transaction the writes run in
+    'projections.upsert_theoretical': """
+        INSERT INTO on_hand (supplier_id, created_on, brand_id, package_type_id, quantity, actual)
+        SELECT :supplier_id, :created_on, :brand_id, :package_type_id, :quantity, false
+        FROM projection_locks
+        WHERE brand_id = :brand_id AND package_type_id = :package_type_id
+            AND request_id = :request_id AND fencing_token = :fencing_token AND timestamp > 0
+        ON DUPLICATE KEY UPDATE supplier_id = VALUES(supplier_id), quantity = VALUES(quantity)""",
+
+    'projections.delete_theoretical': """
+        DELETE on_hand
+        FROM on_hand
+        JOIN projection_locks
+            ON projection_locks.brand_id = on_hand.brand_id AND projection_locks.package_type_id = on_hand.package_type_id
+        WHERE on_hand.supplier_id = :supplier_id AND on_hand.brand_id = :brand_id
+            AND on_hand.package_type_id = :package_type_id AND on_hand.created_on = :created_on AND on_hand.actual = false
+            AND projection_locks.request_id = :request_id AND projection_locks.fencing_token = :fencing_token
+            AND projection_locks.timestamp > 0""",
+
+    # Leases are taken over when older than :expired_before. Assignments are evaluated left to right,
+    # `timestamp` has to be updated last
+    'projections.acquire_lease': """
+        INSERT INTO projection_locks (brand_id, package_type_id, request_id, timestamp, fencing_token)
+        VALUES (:brand_id, :package_type_id, :request_id, :timestamp, 1)
+        ON DUPLICATE KEY UPDATE
+            fencing_token = IF(timestamp < :expired_before, fencing_token + 1, fencing_token),
+            request_id = IF(timestamp < :expired_before, VALUES(request_id), request_id),
+            timestamp = IF(timestamp < :expired_before, VALUES(timestamp), timestamp)""",
+
+    'projections.release_leases': """
+        UPDATE projection_locks
+        SET timestamp = 0
+        WHERE request_id = :request_id""",
+
+    # ON HAND
+    # Keyset pagination in by_supplier_id_and_primary_key order (deployment script 53): on_hand.details_page reads
+    # the first page, on_hand.details_page_after the next ones, starting right after the last row of the previous
+    # page. The row constructor starts with supplier_id so that it covers a prefix of the index, MySQL then seeks
+    # to the row after the cursor on all its columns instead of scanning the supplier's rows from the start
+    'on_hand.details_page': """
+        SELECT created_on, brand_id, package_type_id, quantity, actual
+        FROM on_hand
+        WHERE supplier_id = :supplier_id AND (created_on BETWEEN :start_date AND :end_date) AND (quantity <> 0)
+        ORDER BY supplier_id, brand_id, package_type_id, created_on, actual
+        LIMIT :count""",
+
+    'on_hand.details_page_after': """
+        SELECT created_on, brand_id, package_type_id, quantity, actual
+        FROM on_hand
+        WHERE supplier_id = :supplier_id AND (created_on BETWEEN :start_date AND :end_date) AND (quantity <> 0)
+            AND (supplier_id, brand_id, package_type_id, created_on, actual)
+                > (:supplier_id, :after_brand_id, :after_package_type_id, :after_created_on, :after_actual)
+        ORDER BY supplier_id, brand_id, package_type_id, created_on, actual
+        LIMIT :count""",
+
+    # COUNTS
+    'counts.delete_actual_on_hand': """
+        DELETE
+        FROM on_hand
+        WHERE brand_id = :brand_id AND package_type_id = :package_type_id AND created_on = :created_on AND actual = true""",
+
+    # INVENTORY
+    # One row per product seen in any of the sources. MySQL has neither FULL OUTER JOIN nor, before 8.0,
+    # CTEs, so every source is a derived table LEFT JOINed onto the union of their keys.
+    # When a day has both an actual and a theoretical on_hand row, the actual count wins.
+    'inventory.report': """
+        SELECT products.brand_id, products.package_type_id,
+            IFNULL(on_hand_start.quantity, 0) AS on_hand_start,
+            IFNULL(produced.quantity, 0) AS produced,
+            IFNULL(adjustments.quantity, 0) AS adjustments,
+            IFNULL(on_hand_end.quantity, 0) AS on_hand_end,
+            IFNULL(sales.quantity, 0) AS sales
+        FROM (
+            SELECT brand_id, package_type_id
+            FROM on_hand
+            WHERE supplier_id = :supplier_id AND created_on IN (:on_hand_start_date, :end_date)
+            UNION
+            SELECT brand_id, package_type_id
+            FROM production
+            WHERE supplier_id = :supplier_id AND production_date BETWEEN :start_date AND :end_date
+            UNION
+            SELECT brand_id, package_type_id
+            FROM sales
+            WHERE supplier_id = :supplier_id AND sale_date BETWEEN :start_date AND :end_date
+            UNION
+            SELECT brand_id, package_type_id
+            FROM adjustments
+            WHERE supplier_id = :supplier_id AND adjustment_date BETWEEN :start_date AND :end_date
+        ) AS products
+        LEFT JOIN (
+            SELECT brand_id, package_type_id, CAST(IFNULL(MAX(IF(actual, quantity, NULL)), MAX(quantity)) AS SIGNED) AS quantity
+            FROM on_hand
+            WHERE supplier_id = :supplier_id AND created_on = :on_hand_start_date
+            GROUP BY brand_id, package_type_id
+        ) AS on_hand_start USING (brand_id, package_type_id)
+        LEFT JOIN (
+            SELECT brand_id, package_type_id, CAST(IFNULL(MAX(IF(actual, quantity, NULL)), MAX(quantity)) AS SIGNED) AS quantity
+            FROM on_hand
+            WHERE supplier_id = :supplier_id AND created_on = :end_date
+            GROUP BY brand_id, package_type_id
+        ) AS on_hand_end USING (brand_id, package_type_id)
+        LEFT JOIN (
+            SELECT brand_id, package_type_id, CAST(SUM(quantity) AS SIGNED) AS quantity
+            FROM production
+            WHERE supplier_id = :supplier_id AND production_date BETWEEN :start_date AND :end_date
+            GROUP BY brand_id, package_type_id
+        ) AS produced USING (brand_id, package_type_id)
+        LEFT JOIN (
+            SELECT brand_id, package_type_id, CAST(SUM(quantity) AS SIGNED) AS quantity
+            FROM sales
+            WHERE supplier_id = :supplier_id AND sale_date BETWEEN :start_date AND :end_date
+            GROUP BY brand_id, package_type_id
+        ) AS sales USING (brand_id, package_type_id)
+        LEFT JOIN (
+            SELECT brand_id, package_type_id, CAST(SUM(quantity) AS SIGNED) AS quantity
+            FROM adjustments
+            WHERE supplier_id = :supplier_id AND adjustment_date BETWEEN :start_date AND :end_date
+            GROUP BY brand_id, package_type_id
+        ) AS adjustments USING (brand_id, package_type_id)""",
+}
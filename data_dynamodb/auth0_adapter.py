@@ -1,7 +1,94 @@
-import requests
 import os
 import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
 from data_common.exceptions import Auth0UnableToAccess, Auth0AccessDenied
+from data_dynamodb import app_metadata_cache, clients
+
+
+# a cached token is renewed this many seconds before it expires
+TOKEN_EXPIRY_MARGIN = 300
+
+# management API requests of a fan-out in flight at once, the API is rate limited per tenant
+AUTH0_MAX_WORKERS = 5
+
+# rounds of update_app_metadata_many(), each retrying the users whose update was refused (e.g. 429),
+# and the delay before the second one, doubled every round
+AUTH0_UPDATE_MAX_ATTEMPTS = 3
+AUTH0_UPDATE_RETRY_DELAY = 0.5
+
+# management API tokens by scope, {"body": token response body, "expires_at": epoch seconds}.
+# Module level, so that a warm lambda container keeps reusing them.
+_tokens = {}
+
+# SSM parameter path the tokens are shared under, between lambda containers, when the AUTH0_TOKEN_PARAMETER
+# environment variable sets it: one SecureString parameter per scope, holding the _tokens entry as json.
+# A cold container then reads the token there instead of requesting one from /oauth/token. Unset, the
+# tokens are kept in process only.
+TOKEN_PARAMETER = 'AUTH0_TOKEN_PARAMETER'
+
+
+def _is_fresh(token):
+    return token is not None and token['expires_at'] - TOKEN_EXPIRY_MARGIN > time.time()
+
+
+def _token_parameter_name(scope):
+    """SSM parameter of `scope`, e.g. /brewoptix/dev/auth0-token/read_users. None when not shared"""
+    path = os.environ.get(TOKEN_PARAMETER)
+    if not path:
+        return None
+    return '{PATH}/{SCOPE}'.format(PATH=path.rstrip('/'), SCOPE=re.sub(r'[^a-zA-Z0-9_.-]', '_', scope))
+
+
+def _load_shared_token(scope):
+    """_tokens entry of `scope` kept in SSM by another container, None when there is none"""
+    name = _token_parameter_name(scope)
+    if not name:
+        return None
+
+    try:
+        resp = clients.client('ssm', region_name=os.environ.get('REGION')).get_parameter(
+            Name=name, WithDecryption=True)
+        return json.loads(resp['Parameter']['Value'])
+    except ClientError as ex:
+        if ex.response.get('Error', {}).get('Code') != 'ParameterNotFound':
+            # the store is only a shortcut, request a token instead
+            print('Reading the shared Auth0 token failed: {ERR}'.format(ERR=str(ex)))
+        return None
+
+
+def _store_shared_token(scope, token):
+    name = _token_parameter_name(scope)
+    if not name:
+        return
+
+    try:
+        clients.client('ssm', region_name=os.environ.get('REGION')).put_parameter(
+            Name=name, Value=json.dumps(token), Type='SecureString', Overwrite=True)
+    except ClientError as ex:
+        print('Sharing the Auth0 token failed: {ERR}'.format(ERR=str(ex)))
+
+
+def _fan_out(fn, args):
+    """
+    [fn(arg) for arg in args], AUTH0_MAX_WORKERS calls at a time on a thread pool.
+    The threads share the http session, its connection pool is thread safe. requests is blocking, threads
+    overlap its calls without an async http client in the lambda package.
+    """
+    if len(args) <= 1:
+        return [fn(arg) for arg in args]
+
+    with ThreadPoolExecutor(max_workers=min(AUTH0_MAX_WORKERS, len(args))) as executor:
+        return list(executor.map(fn, args))
+
+
+def updated(status_code):
+    """Whether a management API update answered status_code succeeded"""
+    return 200 <= status_code < 300
 
 
 class Auth0:
@@ -11,7 +98,7 @@ class Auth0:
     @staticmethod
     def _get_token(scope):
         # get Auth0 user profile object (in order to get app_metadata)
-        resp = requests.post(
+        resp = clients.http_session().post(
             os.environ['AUTH0_DOMAIN'] + '/oauth/token',
             json={
                 'grant_type': 'client_credentials',
@@ -27,15 +114,43 @@ class Auth0:
         )
         return resp
 
-    def get_app_metadata(self, user_id=None):
+    @staticmethod
+    def get_token_body(scope):
+        """
+        Management API token response body of `scope`. Taken from the module cache, then from the shared
+        store (see TOKEN_PARAMETER), and only requested from /oauth/token when neither has a fresh one.
+        Error bodies (e.g. access_denied) are returned as they are and never cached.
+        """
+        token = _tokens.get(scope)
+        if _is_fresh(token):
+            return token['body']
+
+        token = _load_shared_token(scope)
+        if _is_fresh(token):
+            _tokens[scope] = token
+            return token['body']
+
+        body = Auth0._get_token(scope).json()
+        if 'access_token' in body:
+            _tokens[scope] = {'body': body, 'expires_at': int(time.time()) + int(body.get('expires_in', 0))}
+            _store_shared_token(scope, _tokens[scope])
+
+        return body
+
+    def get_app_metadata(self, user_id=None, fresh=False):
         """
         Gets auth0 account app_metadata
         If user_id is provided, that user's account is retreived
-        """
 
-        resp = self._get_token('read:users')
+        :param fresh: bypass the cache, and raise Auth0UnableToAccess on an error response instead of
+        returning {}. For reads whose result is written back with update_app_metadata().
+        """
+        if not fresh:
+            app_metadata = app_metadata_cache.get(app_metadata_cache.AUTH0, user_id or self._user_id)
+            if app_metadata is not None:
+                return app_metadata
 
-        users_token_body = resp.json()
+        users_token_body = self.get_token_body('read:users')
 
         if "error" in users_token_body and users_token_body["error"] == "access_denied":
             raise Auth0AccessDenied
@@ -48,7 +163,7 @@ class Auth0:
             else:
                 _auth0_user_id = 'auth0|' + self._user_id
 
-            resp = requests.get(
+            resp = clients.http_session().get(
                 os.environ['AUTH0_DOMAIN'] + '/api/v2/users/{ID}'.format(ID=_auth0_user_id),
                 headers={
                     'content-type': "application/json",
@@ -58,11 +173,14 @@ class Auth0:
             )
 
             users_body = resp.json()
-            if "app_metadata" not in users_body:
-                app_metadata = {}
-            else:
-                app_metadata = users_body["app_metadata"]
-
+            if resp.status_code != 200:
+                # e.g. rate limited, writing {} back would drop every membership of the user
+                if fresh:
+                    raise Auth0UnableToAccess
+                return {}
+
+            app_metadata = users_body.get("app_metadata", {})
+            app_metadata_cache.put(app_metadata_cache.AUTH0, user_id or self._user_id, app_metadata)
             return app_metadata
         else:
             raise Auth0UnableToAccess
@@ -74,9 +192,7 @@ class Auth0:
         """
         app_metadata = app_metadata.copy()    # avoid mutation. Security risk
 
-        resp = self._get_token('update:users')
-
-        users_token_body = resp.json()
+        users_token_body = self.get_token_body('update:users')
 
         if "error" in users_token_body and users_token_body["error"] == "access_denied":
             raise Auth0AccessDenied
@@ -90,7 +206,7 @@ class Auth0:
                 _auth0_user_id = 'auth0|' + self._user_id
 
             payload = json.dumps({"app_metadata": app_metadata})
-            resp = requests.patch(
+            resp = clients.http_session().patch(
                 os.environ['AUTH0_DOMAIN'] + '/api/v2/users/{ID}'.format(ID=_auth0_user_id),
                 payload,
                 headers={
@@ -100,6 +216,8 @@ class Auth0:
 
             )
 
+            app_metadata_cache.invalidate(user_id or self._user_id)
+
             print("After auth0 metadata update")
             print(resp.json())
 
@@ -107,6 +225,44 @@ class Auth0:
         else:
             raise Auth0UnableToAccess
 
+    def get_app_metadata_many(self, user_ids, fresh=False):
+        """
+        get_app_metadata() of many users, the requests run concurrently, see _fan_out()
+
+        :return: dict user_id -> app_metadata
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        # requested once up front, the threads all find it in the cache
+        self.get_token_body('read:users')
+
+        return dict(zip(user_ids, _fan_out(lambda user_id: self.get_app_metadata(user_id, fresh=fresh), user_ids)))
+
+    def update_app_metadata_many(self, app_metadata_by_user):
+        """
+        update_app_metadata() of many users, the requests run concurrently, see _fan_out().
+        The users whose update got a non 2xx status are updated again, up to AUTH0_UPDATE_MAX_ATTEMPTS
+        rounds in all, with a backoff in between.
+
+        :param app_metadata_by_user: dict user_id -> app_metadata
+        :return: dict user_id -> status code of the last attempt, see updated()
+        """
+        self.get_token_body('update:users')
+
+        statuses = {}
+        user_ids = list(app_metadata_by_user)
+        for attempt in range(AUTH0_UPDATE_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(AUTH0_UPDATE_RETRY_DELAY * 2 ** (attempt - 1))
+
+            statuses.update(zip(user_ids, _fan_out(
+                lambda user_id: self.update_app_metadata(app_metadata_by_user[user_id], user_id), user_ids)))
+
+            user_ids = [user_id for user_id in user_ids if not updated(statuses[user_id])]
+            if not user_ids:
+                break
+
+        return statuses
+
     def update_profile(self, profile):
         """
         Updates auth0 account app_metadata
@@ -114,9 +270,7 @@ class Auth0:
         https://auth0.com/docs/api/management/v2#!/Users/patch_users_by_id
         """
 
-        resp = self._get_token('update:users')
-
-        users_token_body = resp.json()
+        users_token_body = self.get_token_body('update:users')
 
         if "error" in users_token_body and users_token_body["error"] == "access_denied":
             raise Auth0AccessDenied
@@ -127,7 +281,7 @@ class Auth0:
             _auth0_user_id = 'auth0|' + self._user_id
 
             payload = json.dumps(profile)
-            resp = requests.patch(
+            resp = clients.http_session().patch(
                 os.environ['AUTH0_DOMAIN'] + '/api/v2/users/{ID}'.format(ID=_auth0_user_id),
                 payload,
                 headers={
@@ -146,9 +300,7 @@ class Auth0:
 
     def trigger_password_reset(self, email):
 
-        resp = self._get_token('update:users')
-
-        users_token_body = resp.json()
+        users_token_body = self.get_token_body('update:users')
 
         if "error" in users_token_body and users_token_body["error"] == "access_denied":
             raise Auth0AccessDenied
@@ -157,7 +309,7 @@ class Auth0:
         if 'access_token' in users_token_body:
             _access_token = users_token_body['access_token']
 
-            resp = requests.post(
+            resp = clients.http_session().post(
                 os.environ['AUTH0_DOMAIN'] + "/dbconnections/change_password",
                 json={
                     'email': email,
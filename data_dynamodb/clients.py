@@ -0,0 +1,61 @@
+"""
+Process wide pool of boto3 clients/resources and of the Auth0 http session.
+
+insert_repo() and get_repo() build a repository per request / SQS record. Borrowing the clients from
+here, a warm lambda container reuses them (and their credentials and open connections) instead of
+building new ones every time. Only the user context lives on the repository.
+
+Always import it as data_dynamodb.clients, a second import path would be a second pool.
+"""
+import threading
+
+import boto3
+import requests
+
+
+_lock = threading.Lock()
+
+# (service, region_name, endpoint_url) -> client / resource
+_clients = {}
+_resources = {}
+
+_http_session = None
+
+
+def client(service, region_name=None, endpoint_url=None):
+    """Shared boto3 client, e.g. client('dynamodb'). Clients are thread safe."""
+    key = (service, region_name, endpoint_url)
+    if key not in _clients:
+        with _lock:
+            if key not in _clients:
+                _clients[key] = boto3.client(service, **_kwargs(region_name, endpoint_url))
+    return _clients[key]
+
+
+def resource(service, region_name=None, endpoint_url=None):
+    """Shared boto3 resource, e.g. resource('dynamodb').Table(name)"""
+    key = (service, region_name, endpoint_url)
+    if key not in _resources:
+        with _lock:
+            if key not in _resources:
+                _resources[key] = boto3.resource(service, **_kwargs(region_name, endpoint_url))
+    return _resources[key]
+
+
+def http_session():
+    """Shared requests session, keeps the connection to Auth0 open between calls"""
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                _http_session = requests.Session()
+    return _http_session
+
+
+def _kwargs(region_name, endpoint_url):
+    kwargs = {}
+    if region_name:
+        kwargs['region_name'] = region_name
+    if endpoint_url:
+        kwargs['endpoint_url'] = endpoint_url
+    return kwargs
@@ -70,6 +70,24 @@ class Brewoptix(BaseModel):
         range_key='obj_type'
     )
 
+    # sparse, only set on the latest active version of an entity
+    latest_supplier_id = Column(UUID)
+
+    by_latest_supplier_id_and_obj_type = GlobalSecondaryIndex(
+        projection='all',
+        hash_key='latest_supplier_id',
+        range_key='obj_type'
+    )
+
+    # "<obj_type>#<date>" of dated entities (counts, production, adjustments), set with latest_supplier_id
+    obj_type_date = Column(String)
+
+    by_latest_supplier_id_and_obj_type_date = GlobalSecondaryIndex(
+        projection='all',
+        hash_key='latest_supplier_id',
+        range_key='obj_type_date'
+    )
+
 
 class PurchaseOrderNumber(BaseModel):
     class Meta:
@@ -107,6 +125,7 @@ class OnHandAurora:
         ") ENGINE=InnoDB")
     indices = [
         "CREATE INDEX by_created_on_and_supplier_id ON on_hand (created_on, supplier_id)",
+        "CREATE INDEX by_supplier_id_and_primary_key ON on_hand (supplier_id, brand_id, package_type_id, created_on, actual)",
     ]
 
 
@@ -173,6 +192,7 @@ class ProjectionLocksAurora:
         "  `package_type_id` CHAR(36) NOT NULL,"
         "  `request_id` CHAR(36) NOT NULL,"
         "  `timestamp` int(11) NOT NULL,"
+        "  `fencing_token` BIGINT NOT NULL DEFAULT 0,"
         "  PRIMARY KEY (`brand_id`, `package_type_id`)"
         ") ENGINE=InnoDB")
 
@@ -1,6 +1,6 @@
-from data_adapter import DynamoStorage
 from auth0_adapter import Auth0
-from aurora_adapter import AuroraStorage
+from extended_aurora_adapter import ExtendedAuroraStorage
+from extended_data_adapter import ExtendedDynamoStorage
 
 from data_common.repository import Repository
 from repository.profile \
@@ -39,6 +39,8 @@ from repository.merchandise \
     import DynamoMerchandiseRepository
 from repository.distributors \
     import DynamoDistributorsRepository
+from repository.bulk \
+    import DynamoBulkRepository
 
 
 class DynamoRepository(Repository,
@@ -59,7 +61,8 @@ class DynamoRepository(Repository,
                        DynamoSupplierDistributorsRepository,
                        DynamoDistributorSuppliersRepository,
                        DynamoMerchandiseRepository,
-                       DynamoDistributorsRepository
+                       DynamoDistributorsRepository,
+                       DynamoBulkRepository
                        ):
     def __init__(self,
                  region_name,
@@ -76,10 +79,12 @@ class DynamoRepository(Repository,
         super(Repository, self).__init__(region_name, user_id, email)
 
         if dynamodb_local_endpoint:
-            self._storage = DynamoStorage(table=table, user_id=user_id, endpoint_url=dynamodb_local_endpoint)
+            self._storage = ExtendedDynamoStorage(table=table, user_id=user_id, endpoint_url=dynamodb_local_endpoint,
+                                                  region_name=region_name)
         else:
-            self._storage = DynamoStorage(table=table, user_id=user_id, )
+            self._storage = ExtendedDynamoStorage(table=table, user_id=user_id, region_name=region_name)
 
         self._auth0 = Auth0(user_id)
 
-        self._aurora_storage = AuroraStorage(aurora_db_arn, aurora_db_secret_arn, aurora_db_name)
+        self._aurora_storage = ExtendedAuroraStorage(aurora_db_arn, aurora_db_secret_arn, aurora_db_name,
+                                                     region_name=region_name)
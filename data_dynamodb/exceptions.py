@@ -0,0 +1,22 @@
+"""
+Exceptions raised by the storage adapters of data_dynamodb.
+
+Kept free of imports so that handlers can catch them without loading boto3. Always import it as
+data_dynamodb.exceptions, a second import path would define a second set of classes.
+"""
+
+
+class VersionConflict(Exception):
+    """
+    The version being superseded is no longer the latest one, another writer saved the entity first.
+    `saved` lists the versions a multi entity save did write before giving up on the entity_ids.
+    """
+    def __init__(self, entity_ids, saved=()):
+        super().__init__(', '.join(entity_ids))
+        self.entity_ids = list(entity_ids)
+        self.saved = list(saved)
+
+
+class BatchIncomplete(Exception):
+    """DynamoDB kept returning unprocessed keys/items of a batch, the table is throttled"""
+    pass
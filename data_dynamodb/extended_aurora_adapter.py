@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from decimal import Decimal
+
+from aurora_adapter import AuroraStorage
+from aurora_queries import QUERIES
+from data_dynamodb import clients
+
+
+BATCH_CHUNK_SIZE = 500
+
+
+def _parameter(name, val):
+    """Encode a python value as a Data API named parameter"""
+    if val is None:
+        value = {'isNull': True}
+    elif isinstance(val, bool):
+        value = {'booleanValue': val}
+    elif isinstance(val, int):
+        value = {'longValue': val}
+    elif isinstance(val, float):
+        value = {'doubleValue': val}
+    else:
+        value = {'stringValue': str(val)}
+
+    return {'name': name, 'value': value}
+
+
+def _parameters(parameters):
+    return [_parameter(name, val) for name, val in (parameters or {}).items()]
+
+
+def _field_value(field, type_name=None):
+    """Decode a Data API field, e.g. {'stringValue': 'abc'} -> 'abc'"""
+    if field.get('isNull'):
+        return None
+
+    val = next(iter(field.values()))
+
+    # SUM() and friends come back as DECIMAL strings
+    if type_name in ('DECIMAL', 'NUMERIC') and isinstance(val, str):
+        val = Decimal(val)
+        return int(val) if val == val.to_integral_value() else float(val)
+    if type_name == 'BIT':
+        return bool(val)
+
+    return val
+
+
+class ExtendedAuroraStorage(AuroraStorage):
+    """
+    AuroraStorage with Data API transactions, bound parameters and the named statements of aurora_queries.
+
+    Values are always sent as parameters, never formatted into the sql text, so every call of a named
+    statement sends the exact same sql.
+    """
+    def __init__(self, db_arn, db_secret_arn, db_name, region_name=None):
+        # AuroraStorage.__init__ is not called, it builds an rds-data client for every repository,
+        # its attributes are set here from the clients pool instead
+        self._resource_arn = db_arn
+        self._secret_arn = db_secret_arn
+        self._database = db_name
+        self._rds_client = clients.client('rds-data', region_name=region_name)
+
+    def execute(self, sql, parameters=None, transaction_id=None, include_result_metadata=False):
+        kwargs = {
+            'resourceArn': self._resource_arn,
+            'secretArn': self._secret_arn,
+            'database': self._database,
+            'sql': sql,
+            'parameters': _parameters(parameters),
+            'includeResultMetadata': include_result_metadata,
+        }
+        if transaction_id:
+            kwargs['transactionId'] = transaction_id
+
+        return self._rds_client.execute_statement(**kwargs)
+
+    @staticmethod
+    def _decode(resp):
+        """
+        :return: (column labels, rows), each row a list of values decoded according to the column types
+        """
+        columns = resp.get('columnMetadata', [])
+        labels = [column.get('label') or column.get('name') for column in columns]
+        type_names = [column.get('typeName') for column in columns]
+
+        if not type_names:
+            return labels, [[_field_value(field) for field in record] for record in resp.get('records', [])]
+
+        return labels, [[_field_value(field, type_name) for field, type_name in zip(record, type_names)]
+                        for record in resp.get('records', [])]
+
+    def query(self, sql, parameters=None, transaction_id=None):
+        """
+        Run a select with bound parameters. Can take part in a transaction.
+
+        :return: list of rows, each a list of column values
+        """
+        resp = self.execute(sql, parameters, transaction_id, include_result_metadata=True)
+        return self._decode(resp)[1]
+
+    def get_rows(self, sql, parameters=None, transaction_id=None):
+        """
+        :return: list of rows, each a dict of column label -> value
+        """
+        resp = self.execute(sql, parameters, transaction_id, include_result_metadata=True)
+        labels, rows = self._decode(resp)
+        return [dict(zip(labels, row)) for row in rows]
+
+    def get_columns(self, sql, parameters=None, transaction_id=None, as_numpy=False):
+        """
+        Columnar variant of get_rows() for large results, no dict is allocated per row.
+
+        :param as_numpy: return numpy arrays instead of lists. Columns containing NULLs
+        or strings end up with an object/str dtype.
+        :return: dict of column label -> list (or array) of values, in row order
+        """
+        resp = self.execute(sql, parameters, transaction_id, include_result_metadata=True)
+        labels, rows = self._decode(resp)
+
+        columns = list(zip(*rows)) if rows else [()] * len(labels)
+        if as_numpy:
+            # numpy is only needed here, keep it off the import path of every other lambda
+            import numpy as np
+            return {label: np.array(values) for label, values in zip(labels, columns)}
+        return {label: list(values) for label, values in zip(labels, columns)}
+
+    def batch_execute(self, sql, parameter_sets, transaction_id=None):
+        """
+        Run the same statement once for every parameter set, BATCH_CHUNK_SIZE sets per round trip
+        """
+        resp = None
+        for i in range(0, len(parameter_sets), BATCH_CHUNK_SIZE):
+            kwargs = {
+                'resourceArn': self._resource_arn,
+                'secretArn': self._secret_arn,
+                'database': self._database,
+                'sql': sql,
+                'parameterSets': [_parameters(parameters) for parameters in parameter_sets[i:i + BATCH_CHUNK_SIZE]],
+            }
+            if transaction_id:
+                kwargs['transactionId'] = transaction_id
+
+            resp = self._rds_client.batch_execute_statement(**kwargs)
+
+        return resp
+
+    def execute_named(self, name, parameters=None, transaction_id=None):
+        return self.execute(QUERIES[name], parameters, transaction_id)
+
+    def query_named(self, name, parameters=None, transaction_id=None):
+        return self.query(QUERIES[name], parameters, transaction_id)
+
+    def get_rows_named(self, name, parameters=None, transaction_id=None):
+        return self.get_rows(QUERIES[name], parameters, transaction_id)
+
+    def get_columns_named(self, name, parameters=None, transaction_id=None, as_numpy=False):
+        return self.get_columns(QUERIES[name], parameters, transaction_id, as_numpy)
+
+    def batch_execute_named(self, name, parameter_sets, transaction_id=None):
+        if not parameter_sets:
+            return None
+        return self.batch_execute(QUERIES[name], parameter_sets, transaction_id)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Usage:
+
+        with self._aurora_storage.transaction() as transaction_id:
+            self._aurora_storage.execute_named(name, parameters, transaction_id)
+            ...
+
+        Commits when the block exits, rolls back if it raises
+        """
+        resp = self._rds_client.begin_transaction(resourceArn=self._resource_arn,
+                                                  secretArn=self._secret_arn,
+                                                  database=self._database)
+        transaction_id = resp['transactionId']
+
+        try:
+            yield transaction_id
+        except Exception:
+            self._rds_client.rollback_transaction(resourceArn=self._resource_arn,
+                                                  secretArn=self._secret_arn,
+                                                  transactionId=transaction_id)
+            raise
+
+        self._rds_client.commit_transaction(resourceArn=self._resource_arn,
+                                            secretArn=self._secret_arn,
+                                            transactionId=transaction_id)
@@ -0,0 +1,670 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+import os
+import queue
+import threading
+import time
+import uuid
+
+from boto3.dynamodb.conditions import ConditionExpressionBuilder, Key, Attr
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from data_adapter import DynamoStorage
+from data_dynamodb import clients
+from data_dynamodb.exceptions import BatchIncomplete, VersionConflict
+
+
+# queries of a query_many() in flight at once
+QUERY_MANY_MAX_WORKERS = 10
+
+# segments of a scan_items() read concurrently, unless told otherwise
+SCAN_TOTAL_SEGMENTS = 4
+
+# BatchGetItem takes up to 100 keys
+BATCH_GET_CHUNK_SIZE = 100
+
+# calls per batch before giving up on unprocessed keys, and the longest backoff between them
+BATCH_MAX_ATTEMPTS = 8
+BATCH_MAX_BACKOFF = 5
+
+# entities per TransactWriteItems call, each takes up to three actions (put new version,
+# update previous one, put latest pointer) and a call takes up to 25
+TRANSACT_CHUNK_SIZE = 8
+
+# transactions per save of an object sent without version, whose latest version is looked up again
+# when another writer superseded it in the meantime
+SAVE_MAX_ATTEMPTS = 3
+
+# Sort key of the latest version pointer of an entity, (entity_id, "latest"). It is rewritten in the
+# transaction saving every version and holds the version id, under LATEST_POINTER_VERSION, so that
+# BatchGetItem finds the latest version of many entities without a query each. It stays a few dozen
+# bytes whatever the size of the entity. It has no obj_type, latest nor index attribute: no index and
+# no query filtering on latest == True sees it. The reads of ExtendedDynamoStorage drop it from what a
+# query on the table's key returns, see _is_latest_pointer().
+LATEST_POINTER = 'latest'
+LATEST_POINTER_VERSION = 'latest_version'
+
+# The pointer of a user profile also carries the memberships_version of its app_metadata, the one
+# thing the authorization of a request checks, see get_memberships_version()
+LATEST_POINTER_MEMBERSHIPS_VERSION = 'memberships_version'
+
+# Sparse attribute of the by_latest_supplier_id_and_obj_type index, only the latest active
+# version of an entity carries it
+LATEST_SUPPLIER_ID = 'latest_supplier_id'
+LATEST_SUPPLIER_INDEX = 'by_latest_supplier_id_and_obj_type'
+LATEST_SUPPLIER_DATE_INDEX = 'by_latest_supplier_id_and_obj_type_date'
+
+# Deployment script backfilling each sparse index. The services are deployed before it runs, until
+# it is recorded in the deployment table the index misses older entities and readers keep to the
+# previous query. A missing record is looked up again after INDEX_BACKFILL_RECHECK_SECONDS.
+INDEX_BACKFILL_SCRIPTS = {
+    LATEST_SUPPLIER_INDEX: 54,
+    LATEST_SUPPLIER_DATE_INDEX: 55,
+}
+INDEX_BACKFILL_RECHECK_SECONDS = 300
+DEPLOYMENT_TABLE = 'brewoptix-deployment'
+
+# Range key of the by_latest_supplier_id_and_obj_type_date index, "<obj_type>#<date>".
+# Set together with latest_supplier_id on the entity types below, from their date attribute.
+OBJ_TYPE_DATE = 'obj_type_date'
+OBJ_TYPE_DATE_ATTRIBUTES = {
+    'counts': 'count_date',
+    'production': 'production_date',
+    'adjustments': 'adjustment_date',
+}
+
+# index name -> monotonic time of the last lookup that did not find its backfill (None before the
+# first lookup), removed once found
+_index_backfill_pending = dict.fromkeys(INDEX_BACKFILL_SCRIPTS)
+
+_deserializer = TypeDeserializer()
+_serializer = TypeSerializer()
+
+
+def _deserialize(item):
+    """Convert a low level client item, e.g. {'name': {'S': 'abc'}} -> {'name': 'abc'}"""
+    return {key: _deserializer.deserialize(val) for key, val in item.items()}
+
+
+def _to_dynamo(val):
+    """floats are not accepted by the serializer, store them as Decimal"""
+    if isinstance(val, float):
+        return Decimal(str(val))
+    if isinstance(val, dict):
+        return {k: _to_dynamo(v) for k, v in val.items()}
+    if isinstance(val, list):
+        return [_to_dynamo(v) for v in val]
+    return val
+
+
+def _serialize(item):
+    return {key: _serializer.serialize(_to_dynamo(val)) for key, val in item.items()}
+
+
+def _client_query(table_name, query):
+    """
+    Convert Table.query() kwargs, conditions built with Key() / Attr(), to the low level client kwargs
+    """
+    query = dict(query)
+    builder = ConditionExpressionBuilder()
+    names = dict(query.pop('ExpressionAttributeNames', {}))
+    values = {}
+
+    for param, is_key_condition in (('KeyConditionExpression', True), ('FilterExpression', False)):
+        condition = query.get(param)
+        if condition is None or isinstance(condition, str):
+            continue
+
+        built = builder.build_expression(condition, is_key_condition=is_key_condition)
+        query[param] = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+
+    if names:
+        query['ExpressionAttributeNames'] = names
+    if values:
+        query['ExpressionAttributeValues'] = _serialize(values)
+    if 'ExclusiveStartKey' in query:
+        query['ExclusiveStartKey'] = _serialize(query['ExclusiveStartKey'])
+
+    query['TableName'] = table_name
+    return query
+
+
+def _is_latest_pointer(item):
+    """Whether a (deserialized) item read from the table is a latest pointer rather than a version"""
+    return item.get('version') == LATEST_POINTER
+
+
+def _latest_pointer(version):
+    """Latest pointer item of a low level client version item"""
+    pointer = {
+        'entity_id': version['entity_id'],
+        'version': {'S': LATEST_POINTER},
+        LATEST_POINTER_VERSION: version['version'],
+    }
+
+    memberships_version = version.get('app_metadata', {}).get('M', {}).get('memberships_version')
+    if memberships_version is not None:
+        pointer[LATEST_POINTER_MEMBERSHIPS_VERSION] = memberships_version
+    return pointer
+
+
+def obj_type_date(obj_type, date):
+    """
+    Sort key value of an entity dated `date`. Epoch dates are zero padded so that they sort as strings,
+    iso8601 dates sort as they are.
+    """
+    if isinstance(date, str):
+        return '{OBJ_TYPE}#{DATE}'.format(OBJ_TYPE=obj_type, DATE=date)
+    return '{OBJ_TYPE}#{DATE:012d}'.format(OBJ_TYPE=obj_type, DATE=int(date))
+
+
+def projection(fields):
+    """
+    Query/scan kwargs reading only `fields` (plus entity_id) of each item.
+    Attribute names are aliased, many of them (name, status, ...) are DynamoDB reserved words.
+
+    :param fields: list of attribute names, None reads every attribute
+    :return: dict with ProjectionExpression and ExpressionAttributeNames, empty when fields is None
+    """
+    if not fields:
+        return {}
+
+    fields = list(dict.fromkeys(['entity_id'] + list(fields)))
+    names = {'#f{N}'.format(N=i): field for i, field in enumerate(fields)}
+
+    return {
+        'ProjectionExpression': ', '.join(names.keys()),
+        'ExpressionAttributeNames': names,
+    }
+
+
+class ExtendedDynamoStorage(DynamoStorage):
+    """
+    DynamoStorage with multi entity reads, paginated queries, parallel scans,
+    transactional saves and the sparse latest version index
+    """
+    def __init__(self, table, user_id=None, endpoint_url=None, region_name=None):
+        # DynamoStorage.__init__ is not called: it builds a boto3 resource, and resolves credentials, for
+        # every repository, i.e. every request. Its attributes are set here from the clients pool instead.
+        self._table_name = table
+        self._changed_by_id = user_id
+        self._endpoint_url = endpoint_url
+        self._region_name = region_name
+        self._dynamodb_client = clients.client('dynamodb', region_name=region_name, endpoint_url=endpoint_url)
+        self._table = clients.resource('dynamodb', region_name=region_name, endpoint_url=endpoint_url).Table(table)
+
+    def index_backfilled(self, index_name):
+        """
+        Whether the deployment script backfilling a sparse index has run, see INDEX_BACKFILL_SCRIPTS.
+        Once it has, the answer is kept for the life of the container.
+        """
+        if index_name not in _index_backfill_pending:
+            return True
+
+        checked_on = _index_backfill_pending[index_name]
+        if checked_on is not None and time.monotonic() - checked_on < INDEX_BACKFILL_RECHECK_SECONDS:
+            return False
+
+        resp = self._dynamodb_client.get_item(
+            TableName=DEPLOYMENT_TABLE,
+            Key={'script_number': {'N': str(INDEX_BACKFILL_SCRIPTS[index_name])}})
+        item = resp.get('Item')
+        if item and item.get('stage', {}).get('S') == os.environ.get('STAGE'):
+            del _index_backfill_pending[index_name]
+            return True
+
+        _index_backfill_pending[index_name] = time.monotonic()
+        return False
+
+    def latest_supplier_query(self, supplier_id, obj_type):
+        """
+        Query kwargs of the latest active entities of obj_type of a supplier: the sparse
+        by_latest_supplier_id_and_obj_type index once it is backfilled, by_supplier_id_and_obj_type
+        filtered on latest and active before that.
+        """
+        if self.index_backfilled(LATEST_SUPPLIER_INDEX):
+            return {
+                'KeyConditionExpression': Key(LATEST_SUPPLIER_ID).eq(supplier_id) & Key('obj_type').eq(obj_type),
+                'IndexName': LATEST_SUPPLIER_INDEX,
+            }
+
+        return {
+            'KeyConditionExpression': Key('supplier_id').eq(supplier_id) & Key('obj_type').eq(obj_type),
+            'FilterExpression': Attr('latest').eq(True) & Attr('active').eq(True),
+            'IndexName': 'by_supplier_id_and_obj_type',
+        }
+
+    def get(self, entity_id, *args, **kwargs):
+        """
+        DynamoStorage.get(), never the latest pointer item of the entity: a pointer read by the base
+        adapter is replaced with the version it points at.
+        """
+        item = super().get(entity_id, *args, **kwargs)
+        if item and _is_latest_pointer(item):
+            items = self.batch_get([entity_id])
+            return items[0] if items else None
+        return item
+
+    def get_items(self, query):
+        """
+        DynamoStorage.get_items(), without the latest pointer items a query on the table's key reads
+        """
+        resp = super().get_items(query)
+        if any(_is_latest_pointer(item) for item in resp.get('Items', [])):
+            resp['Items'] = [item for item in resp['Items'] if not _is_latest_pointer(item)]
+            resp['Count'] = len(resp['Items'])
+        return resp
+
+    def iter_items(self, query):
+        """
+        Like get_items(), but yields the items of every page, following LastEvaluatedKey.
+        Only one page is held in memory at a time.
+
+        :param query: Table.query() kwargs, e.g. KeyConditionExpression, IndexName
+        """
+        query = dict(query)
+        while True:
+            resp = self._table.query(**query)
+            for item in resp['Items']:
+                if not _is_latest_pointer(item):
+                    yield item
+
+            if 'LastEvaluatedKey' not in resp:
+                break
+            query['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def query_many(self, queries):
+        """
+        Every item of several queries, run concurrently on a thread pool, QUERY_MANY_MAX_WORKERS at a time.
+        The threads share the low level client, boto3 clients are thread safe but resources are not.
+
+        :param queries: list of Table.query() kwargs, as taken by iter_items()
+        :return: list of item lists, one per query, in the order of `queries`
+        """
+        if not queries:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(QUERY_MANY_MAX_WORKERS, len(queries))) as executor:
+            return list(executor.map(self._query_items, queries))
+
+    def _query_items(self, query):
+        """Every item of a query through the low level client, following LastEvaluatedKey"""
+        query = _client_query(self._table_name, query)
+
+        items = []
+        while True:
+            resp = self._dynamodb_client.query(**query)
+            items.extend(item for item in map(_deserialize, resp['Items']) if not _is_latest_pointer(item))
+
+            if 'LastEvaluatedKey' not in resp:
+                return items
+            query['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def scan_items(self, scan=None, total_segments=SCAN_TOTAL_SEGMENTS):
+        """
+        Parallel scan, every segment is read by its own thread through the low level client, boto3
+        clients are thread safe but resources are not. Items are yielded as the pages arrive, in no
+        particular order. At most two pages per segment are held in memory at a time.
+
+        :param scan: Table.scan() kwargs, e.g. FilterExpression built with Attr()
+        :param total_segments: number of segments read concurrently
+        """
+        pages = queue.Queue(maxsize=total_segments * 2)
+        stop = threading.Event()
+        done = object()
+
+        def put(page):
+            # give up when the consumer went away, instead of blocking on a full queue
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read_segment(segment):
+            kwargs = _client_query(self._table_name, dict(scan or {}, Segment=segment, TotalSegments=total_segments))
+            try:
+                while True:
+                    resp = self._dynamodb_client.scan(**kwargs)
+                    items = [_deserialize(item) for item in resp['Items']]
+                    if not put([item for item in items if not _is_latest_pointer(item)]):
+                        break
+
+                    if 'LastEvaluatedKey' not in resp:
+                        break
+                    kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=total_segments) as executor:
+            futures = [executor.submit(read_segment, segment) for segment in range(total_segments)]
+
+            try:
+                remaining = total_segments
+                while remaining:
+                    page = pages.get()
+                    if page is done:
+                        remaining -= 1
+                        continue
+                    for item in page:
+                        yield item
+            finally:
+                stop.set()
+
+            # surface the exception of a failed segment
+            for future in futures:
+                future.result()
+
+    def _batch_get_items(self, keys):
+        """
+        Items of many keys with BatchGetItem, BATCH_GET_CHUNK_SIZE keys per call, retrying UnprocessedKeys
+        with backoff.
+
+        :param keys: list of (entity_id, version)
+        :raise BatchIncomplete: keys were still unprocessed after BATCH_MAX_ATTEMPTS calls
+        :return: list of the low level client items found, in no particular order
+        """
+        items = []
+        for i in range(0, len(keys), BATCH_GET_CHUNK_SIZE):
+            request = {
+                self._table_name: {
+                    'Keys': [_serialize({'entity_id': entity_id, 'version': version})
+                             for entity_id, version in keys[i:i + BATCH_GET_CHUNK_SIZE]],
+                }
+            }
+
+            for attempt in range(BATCH_MAX_ATTEMPTS):
+                if attempt:
+                    # throttled, back off before reading the rest
+                    time.sleep(min(BATCH_MAX_BACKOFF, 0.05 * 2 ** attempt))
+
+                resp = self._dynamodb_client.batch_get_item(RequestItems=request)
+                items.extend(resp['Responses'].get(self._table_name, []))
+
+                request = resp.get('UnprocessedKeys')
+                if not request:
+                    break
+            else:
+                raise BatchIncomplete('{N} keys unprocessed'.format(N=len(request[self._table_name]['Keys'])))
+
+        return items
+
+    def batch_get(self, entity_ids):
+        """
+        Latest version of many entities.
+
+        The latest pointers are read with BatchGetItem, then the versions they point at, see
+        _batch_get_items(). Entities without a pointer, saved before the pointers were backfilled
+        (deployment script 56), or whose version is gone, are read with one query each, run
+        concurrently by query_many().
+
+        :param entity_ids: iterable of entity ids, duplicates are read once
+        :raise BatchIncomplete: keys were still unprocessed after BATCH_MAX_ATTEMPTS calls
+        :return: list of items in the same form as get_items()['Items'], in the order of entity_ids,
+        unknown ids are left out
+        """
+        entity_ids = list(dict.fromkeys(entity_ids))
+
+        pointers = self._batch_get_items([(entity_id, LATEST_POINTER) for entity_id in entity_ids])
+        versions = self._batch_get_items([(pointer['entity_id']['S'], pointer[LATEST_POINTER_VERSION]['S'])
+                                          for pointer in pointers])
+        items = {version['entity_id']['S']: _deserialize(version) for version in versions}
+
+        missing = [entity_id for entity_id in entity_ids if entity_id not in items]
+        queries = [{
+            'KeyConditionExpression': Key('entity_id').eq(entity_id),
+            'FilterExpression': Attr('latest').eq(True),
+        } for entity_id in missing]
+        for found in self.query_many(queries):
+            for item in found:
+                items[item['entity_id']] = item
+
+        return [items[entity_id] for entity_id in entity_ids if entity_id in items]
+
+    def get_memberships_version(self, entity_id):
+        """
+        memberships_version of the app_metadata of a user profile, read from its latest pointer alone:
+        one GetItem of a few dozen bytes whatever the size of the profile.
+
+        :return: int, None when the pointer does not carry it (profile not saved since the pointers
+        carry it, or without memberships_version)
+        """
+        resp = self._dynamodb_client.get_item(
+            TableName=self._table_name,
+            Key=_serialize({'entity_id': entity_id, 'version': LATEST_POINTER}),
+            ProjectionExpression='#v',
+            ExpressionAttributeNames={'#v': LATEST_POINTER_MEMBERSHIPS_VERSION},
+        )
+        item = _deserialize(resp.get('Item', {}))
+        if LATEST_POINTER_MEMBERSHIPS_VERSION not in item:
+            return None
+        return int(item[LATEST_POINTER_MEMBERSHIPS_VERSION])
+
+    def save(self, obj_type, obj, new=False):
+        """
+        Write obj as the new latest version of its entity, see save_versioned()
+
+        :return: the saved version
+        """
+        return self.save_versioned(obj_type, obj, new=new)[0]
+
+    @staticmethod
+    def _looks_up_version(obj, new=False):
+        """
+        Whether obj supersedes the latest version of its entity, looked up on save, rather than the
+        version it was read from: obj has an entity_id but was sent without version, e.g. a modify
+        request whose body carries the entity_id only.
+        """
+        return bool(obj.get('entity_id')) and not obj.get('version') and not new
+
+    def _latest_versions(self, entity_ids):
+        """
+        :return: {entity_id: id of its latest version}, unknown entities are left out
+        """
+        if not entity_ids:
+            return {}
+        return {item['entity_id']: item['version'] for item in self.batch_get(entity_ids)}
+
+    def _new_version(self, obj_type, obj, previous_version):
+        """
+        Turn obj into the new latest version of its entity, in place. Every save builds its
+        version here, the version attributes have a single format.
+
+        :param previous_version: version id obj supersedes, None for the first version of a new entity.
+        obj without entity_id is always a new entity.
+        """
+        obj['obj_type'] = obj_type
+        obj['entity_id'] = obj.get('entity_id') or str(uuid.uuid4())
+        obj['version'] = str(uuid.uuid4())
+        obj['active'] = obj.get('active', True)
+        obj['latest'] = True
+        obj['changed_by_id'] = self._changed_by_id
+        obj['changed_on'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        if previous_version:
+            obj['previous_version'] = previous_version
+        else:
+            obj.pop('previous_version', None)
+
+        self._set_index_attributes(obj_type, obj)
+
+    @staticmethod
+    def _set_index_attributes(obj_type, obj):
+        """
+        Set latest_supplier_id and obj_type_date on obj when it is active, remove them otherwise
+        """
+        obj.pop(LATEST_SUPPLIER_ID, None)
+        obj.pop(OBJ_TYPE_DATE, None)
+        date_attribute = OBJ_TYPE_DATE_ATTRIBUTES.get(obj_type)
+        if obj.get('supplier_id') and obj.get('active', True):
+            obj[LATEST_SUPPLIER_ID] = obj['supplier_id']
+            if date_attribute and obj.get(date_attribute) is not None:
+                obj[OBJ_TYPE_DATE] = obj_type_date(obj_type, obj[date_attribute])
+
+    def _transact_items(self, obj, previous_version):
+        """
+        TransactWriteItems actions saving the new version obj, superseding previous_version, and
+        pointing the latest pointer at it. The pointer of a new entity must not exist yet.
+        """
+        version = _serialize(obj)
+        pointer = {
+            'TableName': self._table_name,
+            'Item': _latest_pointer(version),
+        }
+        if not previous_version:
+            pointer['ConditionExpression'] = 'attribute_not_exists(entity_id)'
+
+        items = [{
+            'Put': {
+                'TableName': self._table_name,
+                'Item': version,
+                'ConditionExpression': 'attribute_not_exists(version)',
+            }
+        }, {
+            'Put': pointer
+        }]
+        if previous_version:
+            items.append({
+                'Update': {
+                    'TableName': self._table_name,
+                    'Key': {
+                        'entity_id': {'S': obj['entity_id']},
+                        'version': {'S': previous_version},
+                    },
+                    'UpdateExpression': 'SET latest = :false REMOVE {ATTR}, {DATE_ATTR}'.format(
+                        ATTR=LATEST_SUPPLIER_ID,
+                        DATE_ATTR=OBJ_TYPE_DATE),
+                    'ConditionExpression': 'latest = :true',
+                    'ExpressionAttributeValues': {':true': {'BOOL': True}, ':false': {'BOOL': False}},
+                }
+            })
+        return items
+
+    def _transact_write(self, items):
+        """
+        :raise VersionConflict: with the entities whose condition failed
+        """
+        try:
+            self._dynamodb_client.transact_write_items(TransactItems=items)
+        except self._dynamodb_client.exceptions.TransactionCanceledException as ex:
+            entity_ids = []
+            for action, reason in zip(items, ex.response.get('CancellationReasons', [])):
+                if reason.get('Code') == 'ConditionalCheckFailed':
+                    key = action['Put']['Item'] if 'Put' in action else action['Update']['Key']
+                    entity_ids.append(key['entity_id']['S'])
+
+            if entity_ids:
+                raise VersionConflict(list(dict.fromkeys(entity_ids)))
+            raise
+
+    def save_versioned(self, obj_type, obj, new=False):
+        """
+        Write obj as the new latest version of its entity.
+
+        The new version is written in a single TransactWriteItems call: put the new version, mark
+        the version it supersedes as not latest, on the condition that it still is the latest one,
+        and rewrite the latest pointer. All happen or none does. A new entity has no version to
+        supersede, its latest pointer must not exist yet.
+
+        The superseded version is the one obj was read from, obj['version'], nothing is read first.
+        obj with an entity_id but no version supersedes the latest version, looked up with batch_get().
+        It has no version to conflict with: when another writer gets in between, the latest version
+        is looked up again, up to SAVE_MAX_ATTEMPTS times. An entity_id that is not found is saved as a
+        new entity. new=True saves obj as a new entity with the entity_id it carries, e.g. a user profile.
+
+        latest_supplier_id and obj_type_date are set on the new version when it is active, and
+        removed from the superseded one.
+
+        :raise VersionConflict: another writer superseded obj['version'] first, or created the entity
+        :return: (saved version, version id it superseded or None for a new entity)
+        """
+        looked_up = self._looks_up_version(obj, new=new)
+        previous_version = obj.get('version') if obj.get('entity_id') and not new else None
+
+        for attempt in range(SAVE_MAX_ATTEMPTS):
+            if looked_up:
+                previous_version = self._latest_versions([obj['entity_id']]).get(obj['entity_id'])
+
+            self._new_version(obj_type, obj, previous_version)
+            try:
+                self._transact_write(self._transact_items(obj, previous_version))
+            except VersionConflict:
+                if not looked_up or attempt + 1 >= SAVE_MAX_ATTEMPTS:
+                    raise
+            else:
+                return obj, previous_version
+            finally:
+                obj.pop(LATEST_SUPPLIER_ID, None)
+                obj.pop(OBJ_TYPE_DATE, None)
+
+    def save_many(self, obj_type, objs):
+        """
+        Save many objects of one type, like save_versioned() does, TRANSACT_CHUNK_SIZE entities per
+        transaction. The latest versions of the objects sent without version are looked up in one
+        batch_get() before anything is written.
+
+        A conflict cancels its transaction only. The objects of that transaction that did not
+        conflict are written again, as are the objects sent without version, with their latest version
+        looked up again, up to SAVE_MAX_ATTEMPTS transactions. The other chunks are written regardless.
+
+        :raise ValueError: an entity_id is repeated in objs, a transaction cannot write an item twice
+        :raise VersionConflict: other writers got to some of the entities first. Its entity_ids are
+        the conflicting entities, its saved list the versions written.
+        :return: the saved versions, in the order of objs
+        """
+        entity_ids = [obj['entity_id'] for obj in objs if obj.get('entity_id')]
+        if len(set(entity_ids)) != len(entity_ids):
+            raise ValueError('entity_id repeated')
+
+        looked_up = {obj['entity_id'] for obj in objs if self._looks_up_version(obj)}
+        latest_versions = self._latest_versions(list(looked_up))
+        versions = [(obj, latest_versions.get(obj['entity_id']) if obj.get('entity_id') in looked_up
+                     else obj.get('version') if obj.get('entity_id') else None) for obj in objs]
+
+        saved = []
+        conflicts = []
+        try:
+            for i in range(0, len(versions), TRANSACT_CHUNK_SIZE):
+                chunk = versions[i:i + TRANSACT_CHUNK_SIZE]
+                for attempt in range(SAVE_MAX_ATTEMPTS):
+                    for obj, previous_version in chunk:
+                        self._new_version(obj_type, obj, previous_version)
+
+                    items = [item for obj, previous_version in chunk
+                             for item in self._transact_items(obj, previous_version)]
+                    try:
+                        self._transact_write(items)
+                    except VersionConflict as ex:
+                        failed = set(ex.entity_ids)
+                        refused = [obj['entity_id'] for obj, _ in chunk
+                                   if obj['entity_id'] in failed and obj['entity_id'] not in looked_up]
+                        retried = [obj['entity_id'] for obj, _ in chunk
+                                   if obj['entity_id'] in failed and obj['entity_id'] in looked_up]
+                        conflicts.extend(refused)
+                        if attempt + 1 >= SAVE_MAX_ATTEMPTS:
+                            conflicts.extend(retried)
+                            break
+
+                        latest_versions = self._latest_versions(retried)
+                        chunk = [(obj, latest_versions.get(obj['entity_id']) if obj['entity_id'] in retried
+                                  else previous_version)
+                                 for obj, previous_version in chunk if obj['entity_id'] not in refused]
+                        if not chunk:
+                            break
+                    else:
+                        saved.extend(obj for obj, _ in chunk)
+                        break
+        finally:
+            for obj in objs:
+                obj.pop(LATEST_SUPPLIER_ID, None)
+                obj.pop(OBJ_TYPE_DATE, None)
+
+        if conflicts:
+            saved_ids = {id(obj) for obj in saved}
+            raise VersionConflict(conflicts, saved=[obj for obj in objs if id(obj) in saved_ids])
+
+        return objs
@@ -0,0 +1,169 @@
+"""
+DynamoRepository with the sub-repositories imported on first use.
+
+DynamoRepository mixes all of them in, so every lambda pays the import of every repository module
+(and of maya, requests, ...) even when it only serves brands. LazyDynamoRepository resolves a method
+the first time it is looked up: it finds the sub-repository implementing it, imports that module, and
+moves the instance to a subclass mixing in every sub-repository loaded so far, built with type(). The
+methods stay on their own classes, so zero argument super() keeps working. Later requests of a warm
+lambda start out on the composed class and find the methods directly.
+
+See services/cold_start_benchmark.py for the import times per service handler.
+"""
+import importlib
+
+from data_common import repository as interfaces
+from data_common.notifications import SnsNotifier
+from data_common.queue import SQSManager
+from data_common.repository import BaseRepository
+
+
+# (abstract interface in data_common.repository, module, class), in DynamoRepository's order
+IMPLEMENTATIONS = [
+    ('ProfileRepository', 'repository.profile', 'DynamoProfileRepository'),
+    ('SupplierRepository', 'repository.suppliers', 'DynamoSuppliersRepository'),
+    ('BrandRepository', 'repository.brands', 'DynamoBrandsRepository'),
+    ('PackageTypeRepository', 'repository.package_types', 'DynamoPackageTypeRepository'),
+    ('ProductRepository', 'repository.products', 'DynamoProductRepository'),
+    ('OnHandRepository', 'repository.on_hand', 'DynamoOnHandRepository'),
+    ('AdjustmentRepository', 'repository.adjustment', 'DynamoAdjustmentRepository'),
+    ('PaymentsRepository', 'repository.payments', 'DynamoPaymentsRepository'),
+    ('ContainerRepository', 'repository.containers', 'DynamoContainerRepository'),
+    ('RetailPackageRepository', 'repository.retail_packages', 'DynamoRetailPackageRepository'),
+    ('ProductionRepository', 'repository.production', 'DynamoProductionRepository'),
+    ('CountRepository', 'repository.counts', 'DynamoCountRepository'),
+    ('PurchaseOrderRepository', 'repository.purchase_orders', 'DynamoPurchaseOrderRepository'),
+    ('InventoryRepository', 'repository.inventory', 'AuroraInventoryRepository'),
+    ('SupplierDistributorsRepository', 'repository.supplier_distributors', 'DynamoSupplierDistributorsRepository'),
+    ('DistributorSuppliersRepository', 'repository.distributor_suppliers', 'DynamoDistributorSuppliersRepository'),
+    ('MerchandiseRepository', 'repository.merchandise', 'DynamoMerchandiseRepository'),
+    ('DistributorsRepository', 'repository.distributors', 'DynamoDistributorsRepository'),
+    ('BulkRepository', 'repository.bulk', 'DynamoBulkRepository'),
+]
+
+
+def _load(module_name, class_name):
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _defines(cls, name):
+    """Whether a class in the mro of cls, other than object, has an attribute `name`"""
+    return any(name in vars(klass) for klass in cls.__mro__ if klass is not object)
+
+
+def implementation(name, loaded=()):
+    """
+    Sub-repository class implementing `name`.
+
+    Looks in the classes already loaded first (helpers like sns_publish() are called from their
+    methods), then at the abstract interfaces, which import only the module declaring the method.
+    A public helper no interface declares is looked for in every sub-repository, importing them in
+    turn, like the eager DynamoRepository would find it.
+
+    :param loaded: classes imported so far
+    :return: class, or None when no sub-repository defines it
+    """
+    for cls in loaded:
+        if _defines(cls, name):
+            return cls
+
+    for interface, module_name, class_name in IMPLEMENTATIONS:
+        if name in vars(getattr(interfaces, interface)):
+            return _load(module_name, class_name)
+
+    for _, module_name, class_name in IMPLEMENTATIONS:
+        cls = _load(module_name, class_name)
+        if _defines(cls, name):
+            return cls
+
+    return None
+
+
+def _compose(classes):
+    """LazyDynamoRepository subclass mixing in the sub-repository classes, in DynamoRepository's order"""
+    key = tuple(classes)
+    if key not in _composed:
+        order = [class_name for _, _, class_name in IMPLEMENTATIONS]
+        bases = tuple(sorted(classes, key=lambda cls: order.index(cls.__name__)))
+        _composed[key] = type('LazyDynamoRepository', bases + (LazyDynamoRepository,), {'__module__': __name__})
+    return _composed[key]
+
+
+# tuple of sub-repository classes -> composed class
+_composed = {}
+
+
+class LazyDynamoRepository(SQSManager, SnsNotifier, BaseRepository):
+    """
+    Same constructor and methods as DynamoRepository. The storage adapters are built on first use too.
+    """
+    # sub-repository classes imported so far, shared by every instance
+    _loaded = []
+
+    def __init__(self,
+                 region_name,
+                 table,
+                 user_id=None,
+                 email='',
+                 aurora_db_arn='',
+                 aurora_db_secret_arn='',
+                 aurora_db_name='',
+                 dynamodb_local_endpoint=None):
+        # same initialisers as DynamoRepository, which starts after data_common.repository.Repository
+        super().__init__(region_name, user_id, email)
+
+        self._table = table
+        self._dynamodb_local_endpoint = dynamodb_local_endpoint
+        self._aurora_db_arn = aurora_db_arn
+        self._aurora_db_secret_arn = aurora_db_secret_arn
+        self._aurora_db_name = aurora_db_name
+
+        if LazyDynamoRepository._loaded:
+            self.__class__ = _compose(LazyDynamoRepository._loaded)
+
+    @property
+    def _storage(self):
+        if '_storage_instance' not in self.__dict__:
+            from extended_data_adapter import ExtendedDynamoStorage
+
+            if self._dynamodb_local_endpoint:
+                self._storage_instance = ExtendedDynamoStorage(table=self._table, user_id=self._user_id,
+                                                               endpoint_url=self._dynamodb_local_endpoint,
+                                                               region_name=self._region_name)
+            else:
+                self._storage_instance = ExtendedDynamoStorage(table=self._table, user_id=self._user_id,
+                                                               region_name=self._region_name)
+        return self._storage_instance
+
+    @property
+    def _auth0(self):
+        if '_auth0_instance' not in self.__dict__:
+            from auth0_adapter import Auth0
+            self._auth0_instance = Auth0(self._user_id)
+        return self._auth0_instance
+
+    @property
+    def _aurora_storage(self):
+        if '_aurora_storage_instance' not in self.__dict__:
+            from extended_aurora_adapter import ExtendedAuroraStorage
+            self._aurora_storage_instance = ExtendedAuroraStorage(self._aurora_db_arn,
+                                                                  self._aurora_db_secret_arn,
+                                                                  self._aurora_db_name,
+                                                                  region_name=self._region_name)
+        return self._aurora_storage_instance
+
+    def __getattr__(self, name):
+        # only called when normal lookup fails, i.e. for methods of sub-repositories not loaded yet.
+        # Private names are never public methods of a sub-repository.
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        cls = implementation(name, LazyDynamoRepository._loaded)
+        if cls is None:
+            raise AttributeError(name)
+
+        if cls not in LazyDynamoRepository._loaded:
+            LazyDynamoRepository._loaded.append(cls)
+
+        self.__class__ = _compose(LazyDynamoRepository._loaded)
+        return getattr(self, name)
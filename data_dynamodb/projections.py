@@ -0,0 +1,78 @@
+import numpy as np
+
+
+def date_range(start_date, end_date):
+    """
+    Days from start_date up to, but not including, end_date
+
+    :param start_date: iso8601 date string
+    :param end_date: iso8601 date string
+    :return: numpy datetime64[D] array
+    """
+    return np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D'))
+
+
+def to_dense(series, days):
+    """
+    Spread a {date: quantity} dict over a day indexed array
+
+    :param series: dict of iso8601 date string -> quantity
+    :param days: datetime64[D] array returned by date_range()
+    :return: (quantities, present) arrays, `present` is True for days found in series
+    """
+    n_days = len(days)
+    quantities = np.zeros(n_days, dtype=np.int64)
+    present = np.zeros(n_days, dtype=bool)
+
+    if series and n_days:
+        offsets = (np.array(list(series.keys()), dtype='datetime64[D]') - days[0]).astype(np.int64)
+        values = np.fromiter((int(val) for val in series.values()), dtype=np.int64, count=len(series))
+
+        in_range = (offsets >= 0) & (offsets < n_days)
+        np.add.at(quantities, offsets[in_range], values[in_range])
+        present[offsets[in_range]] = True
+
+    return quantities, present
+
+
+def running_balance(opening, actual, has_actual, delta):
+    """
+    Day by day balance of one or more SKUs.
+
+    balance[d] = balance[d-1] + delta[d], except that the day after an actual count
+    starts from the counted quantity instead of the projected one.
+
+    :param opening: (n_skus,) quantity on the day before the first day
+    :param actual: (n_skus, n_days) actual counted quantities
+    :param has_actual: (n_skus, n_days) True where an actual count exists
+    :param delta: (n_skus, n_days) production - sales + adjustments for each day
+    :return: (n_skus, n_days) int64 array of balances
+    """
+    opening = np.atleast_1d(np.asarray(opening, dtype=np.int64))
+    actual = np.atleast_2d(np.asarray(actual, dtype=np.int64))
+    has_actual = np.atleast_2d(np.asarray(has_actual, dtype=bool))
+    delta = np.atleast_2d(np.asarray(delta, dtype=np.int64))
+
+    n_skus, n_days = delta.shape
+    if n_days == 0:
+        return np.zeros((n_skus, 0), dtype=np.int64)
+
+    # a segment restarts on the first day, and on every day that follows an actual count
+    reset = np.zeros((n_skus, n_days), dtype=bool)
+    reset[:, 0] = True
+    reset[:, 1:] = has_actual[:, :-1]
+
+    base = np.zeros((n_skus, n_days), dtype=np.int64)
+    base[:, 0] = opening
+    base[:, 1:] = np.where(has_actual[:, :-1], actual[:, :-1], 0)
+
+    cumulative = np.cumsum(delta, axis=1)
+    cumulative_before = cumulative - delta
+
+    # index of the segment start each day belongs to
+    segment_start = np.where(reset, np.arange(n_days), 0)
+    segment_start = np.maximum.accumulate(segment_start, axis=1)
+
+    offset = np.take_along_axis(base - cumulative_before, segment_start, axis=1)
+
+    return offset + cumulative
@@ -0,0 +1,79 @@
+"""
+Coalescing of the messages of the projections queue, run by process_projections_queue in services/on_hand.
+
+Messages carry either a single product (brand_id, package_type_id) or a supplier wide recalculation
+with an optional list of products.
+"""
+import json
+import uuid
+
+
+def coalesce(records):
+    """
+    Group the SQS records of a batch, keeping the earliest start_date, so that a burst of edits results
+    in a single recalculation per product. Products covered by a supplier wide message of the same batch
+    are folded into it.
+
+    :return: (supplier_projections, projections), dicts of group, keyed by supplier_id and by
+    (supplier_id, brand_id, package_type_id). A group is a dict with the first record of the group,
+    start_date, full_rewrite, products (a set of (brand_id, package_type_id), None for every product)
+    and lock_attempts
+    """
+    projections = {}
+    supplier_projections = {}
+    for record in records:
+        obj = json.loads(record['body'])
+
+        if 'brand_id' in obj:
+            key = (obj['supplier_id'], obj['brand_id'], obj['package_type_id'])
+            group = projections
+        else:
+            key = obj['supplier_id']
+            group = supplier_projections
+
+        if 'products' in obj and obj['products'] is not None:
+            products = {(product['brand_id'], product['package_type_id']) for product in obj['products']}
+        else:
+            products = None
+
+        if key in group:
+            projection = group[key]
+            projection['lock_attempts'] = max(projection['lock_attempts'], obj.get('lock_attempts', 0))
+            projection['start_date'] = min(projection['start_date'], obj['start_date'])
+            projection['full_rewrite'] = projection['full_rewrite'] or obj.get('full_rewrite', False)
+            if projection['products'] is not None and products is not None:
+                projection['products'] |= products
+            else:
+                projection['products'] = None
+        else:
+            group[key] = {
+                'record': record,
+                'start_date': obj['start_date'],
+                'full_rewrite': obj.get('full_rewrite', False),
+                'products': products,
+                'lock_attempts': obj.get('lock_attempts', 0),
+            }
+
+    for key in list(projections.keys()):
+        supplier_id, brand_id, package_type_id = key
+        supplier_projection = supplier_projections.get(supplier_id)
+
+        if supplier_projection and (supplier_projection['products'] is None or
+                                    (brand_id, package_type_id) in supplier_projection['products']):
+            projection = projections.pop(key)
+            supplier_projection['start_date'] = min(supplier_projection['start_date'], projection['start_date'])
+            supplier_projection['full_rewrite'] = supplier_projection['full_rewrite'] or projection['full_rewrite']
+
+    return supplier_projections, projections
+
+
+def group_request_id(invocation_id, key):
+    """
+    Lease owner id of one group of an invocation. Every group takes its own leases, so the groups of
+    one invocation must not share an owner.
+
+    :param invocation_id: aws_request_id of the lambda invocation
+    :param key: key of the group returned by coalesce()
+    :return: uuid string, the same for the same invocation and group
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, '{ID}/{KEY}'.format(ID=invocation_id, KEY=key)))
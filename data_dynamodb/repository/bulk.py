@@ -0,0 +1,108 @@
+import json
+
+from data_common.constants import brand_attributes, merchandise_attributes, base_attributes
+from data_common.exceptions import CannotModifyEntityStates
+from data_common.notifications import SnsNotifier
+from data_common.repository import BulkRepository
+from data_common.utils import clean
+from data_dynamodb.exceptions import VersionConflict
+from data_dynamodb.utils import check_for_required_keys, check_properties_datatypes, check_unique_entity_ids
+from log_config import logger
+
+
+# SNS refuses messages over 256 KB, this leaves room for the notification envelope
+SNS_BATCH_MAX_BYTES = 240 * 1024
+
+
+def _batches(objs):
+    """Split objs in lists whose json stays under SNS_BATCH_MAX_BYTES, a single one unless they are large"""
+    batch = []
+    size = 0
+    for obj in objs:
+        obj_size = len(json.dumps(obj, default=str).encode('utf-8')) + 2
+        if batch and size + obj_size > SNS_BATCH_MAX_BYTES:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(obj)
+        size += obj_size
+
+    if batch:
+        yield batch
+
+
+class DynamoBulkRepository(BulkRepository, SnsNotifier):
+    def sns_publish_many(self, name, objs):
+        """
+        Publish objs to `name` in one notification, {"entities": [obj, ...]}. Objects too large for a
+        single SNS message are split over as few notifications as fit.
+
+        The objects are already saved, a failed notification is logged instead of failing the request:
+        retrying it would save the objects a second time.
+        """
+        for batch in _batches(objs):
+            try:
+                self.sns_publish(name, {'entities': batch})  # publish notification
+            except Exception as ex:
+                logger.error('Publishing {NAME} notification of {N} entities failed: {ERR}'.format(
+                    NAME=name, N=len(batch), ERR=str(ex)))
+
+    def save_many(self, obj_type, objs, attributes, notification):
+        """
+        Validate every object before writing any of them, save them all and publish them to `notification`
+
+        :param objs: list of objects, all of obj_type
+        :param attributes: required attributes and their datatypes, e.g. product_attributes
+        :raise BadParameters: an attribute has the wrong datatype, or an entity_id is repeated
+        :raise VersionConflict: some objects were saved by another writer first. The others were saved
+        and published, they are listed, cleaned, in its saved attribute.
+        :return: list of saved objects
+        """
+        for obj in objs:
+            check_for_required_keys(obj, attributes)
+            content = {k: v for k, v in obj.items() if k not in base_attributes}
+            check_properties_datatypes(content, attributes)
+        check_unique_entity_ids(objs)
+
+        for obj in objs:
+            obj['user_id'] = self._user_id
+
+        try:
+            saved = self._storage.save_many(obj_type, objs)
+        except VersionConflict as ex:
+            self.sns_publish_many(notification, ex.saved)  # publish notifications of what was written
+            ex.saved = [clean(obj) for obj in ex.saved]
+            raise
+
+        self.sns_publish_many(notification, saved)  # publish notifications
+
+        return [clean(obj) for obj in saved]
+
+    @staticmethod
+    def _check_unique_names(objs, get_all):
+        """
+        Names are unique in a supplier, see save_brand() and save_merchandise()
+
+        :param get_all: e.g. self.get_all_brands, lists the existing entities of a supplier
+        :raise CannotModifyEntityStates: a name is taken, or repeated in objs
+        """
+        names = {
+            supplier_id: {item['name']: item['entity_id'] for item in get_all(supplier_id)}
+            for supplier_id in {obj.get('supplier_id') for obj in objs}
+        }
+
+        seen = set()
+        for obj in objs:
+            key = (obj.get('supplier_id'), obj.get('name'))
+            existing_id = names.get(obj.get('supplier_id'), {}).get(obj.get('name'))
+            if key in seen or (existing_id and existing_id != obj.get('entity_id')):
+                raise CannotModifyEntityStates
+            seen.add(key)
+
+    def save_brands(self, objs):
+        self._check_unique_names(objs, self.get_all_brands)
+        return self.save_many('brands', objs, brand_attributes, 'brands')
+
+    def save_merchandises(self, objs):
+        self._check_unique_names(objs, self.get_all_merchandises)
+        return self.save_many('merchandise', objs, merchandise_attributes, 'merchandise')
@@ -10,36 +10,34 @@ from data_common.repository import CountRepository
 from data_common.queue import SQSManager
 from data_common.notifications import SnsNotifier
 from data_common.utils import clean
+from data_dynamodb.extended_data_adapter import LATEST_SUPPLIER_DATE_INDEX, obj_type_date, projection
 from data_dynamodb.utils import check_for_required_keys, check_properties_datatypes
 
 
 class DynamoCountRepository(CountRepository, SQSManager, SnsNotifier):
-    def get_all_counts(self, supplier_id):
+    def get_all_counts(self, supplier_id, fields=None):
         obj_type = 'counts'
 
         query = {
-            'KeyConditionExpression': Key('supplier_id').eq(supplier_id) & Key('obj_type').eq(obj_type),
-            'FilterExpression':
-                (Attr('latest').eq(True) & Attr('active').eq(True)),
-            'IndexName': 'by_supplier_id_and_obj_type'
+            **self._storage.latest_supplier_query(supplier_id, obj_type),
+            **projection(fields)
         }
 
-        response = self._storage.get_items(query)
-
         counts_obj = []
 
-        for item in response['Items']:
+        for item in self._storage.iter_items(query):
             # The 4 lines below can be uncommented if we move
             # from ALL to KEYS_ONLY for the table
             # entity_id = item['EntityID']
             # count = self._storage.get(table, entity_id)
             # count = clean(count)
             count = json_util.loads(clean(item))
-            count['count_date'] = maya.to_iso8601(
-                datetime.utcfromtimestamp(
-                    count['count_date']
-                )
-            ).split('T')[0]
+            if 'count_date' in count:
+                count['count_date'] = maya.to_iso8601(
+                    datetime.utcfromtimestamp(
+                        count['count_date']
+                    )
+                ).split('T')[0]
             counts_obj.append(count)
 
         return counts_obj
@@ -55,29 +53,35 @@ class DynamoCountRepository(CountRepository, SQSManager, SnsNotifier):
             max_count_date = maya.parse(max_count_date.split('T')[0]).epoch
             print (max_count_date)
 
-        if max_count_date:
+        if not self._storage.index_backfilled(LATEST_SUPPLIER_DATE_INDEX):
+            # obj_type_date is not backfilled yet, filter every count of the supplier
+            if max_count_date:
+                date_filter = Attr('count_date').between(min_count_date, max_count_date)
+            else:
+                date_filter = Attr('count_date').gt(min_count_date)
+
             query = {
                 'KeyConditionExpression': Key('supplier_id').eq(supplier_id) & Key('obj_type').eq(obj_type),
-                'FilterExpression':
-                    Attr('latest').eq(True) & Attr('active').eq(True) & Attr('count_date').between(
-                    min_count_date,
-                    max_count_date),
+                'FilterExpression': Attr('latest').eq(True) & Attr('active').eq(True) & date_filter,
                 'IndexName': 'by_supplier_id_and_obj_type'
             }
         else:
+            if max_count_date:
+                key_condition = Key('obj_type_date').between(obj_type_date(obj_type, min_count_date),
+                                                             obj_type_date(obj_type, max_count_date))
+            else:
+                # after min_count_date, up to the largest 12 digit epoch
+                key_condition = Key('obj_type_date').between(obj_type_date(obj_type, min_count_date + 1),
+                                                             obj_type_date(obj_type, 10 ** 12 - 1))
+
             query = {
-                'KeyConditionExpression': Key('supplier_id').eq(supplier_id) & Key('obj_type').eq(obj_type),
-                'FilterExpression':
-                    Attr('latest').eq(True) & Attr('active').eq(True) & Attr('count_date').gt(
-                    min_count_date),
-                'IndexName': 'by_supplier_id_and_obj_type'
+                'KeyConditionExpression': Key('latest_supplier_id').eq(supplier_id) & key_condition,
+                'IndexName': LATEST_SUPPLIER_DATE_INDEX
             }
 
-        response = self._storage.get_items(query)
-
         counts_obj = []
 
-        for item in response['Items']:
+        for item in self._storage.iter_items(query):
             count = json_util.loads(clean(item))
             count['count_date'] = maya.to_iso8601(
                 datetime.utcfromtimestamp(
@@ -179,28 +183,30 @@ class DynamoCountRepository(CountRepository, SQSManager, SnsNotifier):
                 }
 
             # delete all records with matching brand_id, package_type_id, created_on, actual=true
-            table = 'on_hand'
-            query = """
-                    DELETE
-                    FROM {TABLE}
-                    WHERE brand_id='{BRAND_ID}' AND package_type_id='{PACK_ID}' AND created_on='{CREATED_ON}' AND actual=true""".format(TABLE=table,
-                               BRAND_ID=brand_id,
-                               PACK_ID=package_type_id,
-                               CREATED_ON=created_on)
-            self._aurora_storage._execute(query)
+            self._aurora_storage.execute_named('counts.delete_actual_on_hand', {
+                'brand_id': brand_id,
+                'package_type_id': package_type_id,
+                'created_on': created_on,
+            })
 
         # aggregate by package_type_id
         for item in products_agg.values():
             if obj["active"] and "status" and obj["status"] == "complete":  # we are recording only for this status
                 self._aurora_storage.save('on_hand', item)
 
-            # Re-calculate projections
-            created_on_minus_one = maya.parse(item['created_on']).add(days=-1).iso8601().split("T")[0]
+        # Re-calculate projections of all counted products in one go
+        if products_agg:
+            created_on = maya.to_iso8601(datetime.utcfromtimestamp(obj['count_date'])).split("T")[0]
+            created_on_minus_one = maya.parse(created_on).add(days=-1).iso8601().split("T")[0]
             self.sqs_enqueue("projections", {
                 'user_id': self._user_id,
                 'supplier_id': supplier_id,
-                'brand_id': item['brand_id'],
-                'package_type_id': item['package_type_id'],
                 'start_date': created_on_minus_one,
+                'products': [
+                    {
+                        'brand_id': item['brand_id'],
+                        'package_type_id': item['package_type_id'],
+                    } for item in products_agg.values()
+                ],
             })  # enqueue object
 
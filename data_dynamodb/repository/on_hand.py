@@ -1,10 +1,9 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
 import os
 import time
 
 import maya
-from maya import MayaInterval
-from boto3.dynamodb.conditions import Key, Attr
 from dynamodb_json import json_util
 
 from data_common.constants import on_hand_attributes, base_attributes
@@ -12,36 +11,40 @@ from data_common.exceptions import BadParameters, NoSuchEntity, AquireProjection
 from data_common.repository import OnHandRepository
 from data_common.notifications import SnsNotifier
 from data_common.utils import clean
+from data_dynamodb import clients
+from data_dynamodb.extended_data_adapter import projection
 from data_dynamodb.utils import check_for_required_keys, check_properties_datatypes
 
 
+# rows per page of projections.sources. The Data API refuses responses over 1 MB,
+# a row takes about 250 bytes of it
+PROJECTION_SOURCES_MAX_ROWS = 3000
+
+
 class DynamoOnHandRepository(OnHandRepository, SnsNotifier):
-    def get_all_on_hands(self, supplier_id):
+    def get_all_on_hands(self, supplier_id, fields=None):
         obj_type = 'on-hand-inventory'
 
         query = {
-            'KeyConditionExpression': Key('supplier_id').eq(supplier_id) & Key('obj_type').eq(obj_type),
-            'FilterExpression':
-                (Attr('latest').eq(True) & Attr('active').eq(True)),
-            'IndexName': 'by_supplier_id_and_obj_type'
+            **self._storage.latest_supplier_query(supplier_id, obj_type),
+            **projection(fields)
         }
 
-        response = self._storage.get_items(query)
-
         on_hands_obj = []
 
-        for item in response['Items']:
+        for item in self._storage.iter_items(query):
             # The 4 lines below can be uncommented if we move
             # from ALL to KEYS_ONLY for the table
             # entity_id = item['EntityID']
             # on_hand = self._storage.get(table, entity_id)
             # on_hand = clean(on_hand)
             on_hand = json_util.loads(clean(item))
-            on_hand['observation_date'] = maya.to_iso8601(
-                datetime.utcfromtimestamp(
-                    on_hand['observation_date']
-                )
-            ).split('T')[0]
+            if 'observation_date' in on_hand:
+                on_hand['observation_date'] = maya.to_iso8601(
+                    datetime.utcfromtimestamp(
+                        on_hand['observation_date']
+                    )
+                ).split('T')[0]
             on_hands_obj.append(on_hand)
 
         return on_hands_obj
@@ -103,322 +106,370 @@ class DynamoOnHandRepository(OnHandRepository, SnsNotifier):
         else:
             raise NoSuchEntity
 
-    def _acquire_lock(self, brand_id, package_type_id, request_id):
-        print('Acquire lock for brand_id: {}, '
-              'package_type_id: {}, request_id: {}'.format(brand_id,
-                                                           package_type_id,
-                                                           request_id))
-        table = 'projection_locks'
-        for attempt in range(0, 11):
-            time.sleep(2 * attempt)
-            item = {
-                "brand_id": brand_id,
-                "package_type_id": package_type_id,
-                "request_id": request_id,
-                "timestamp": int(time.time())
-            }
-
-            try:
-                obj = self._aurora_storage.save(table, item)
-                break
-            except Exception:
-                pass
-        else:
-            raise AquireProjectionLockError("Timeout")
-
-        print(obj)
-        return obj
-
-    def _release_lock(self, brand_id, package_type_id):
-        print('Release lock for brand_id: {}, package_type_id: {}'.format(brand_id, package_type_id))
-        table = 'projection_locks'
-        query = """
-                DELETE
-                FROM {TABLE}
-                WHERE package_type_id='{PACKAGE_TYPE_ID}' AND brand_id='{BRAND_ID}'
-                """.format(TABLE=table,
-                           BRAND_ID=brand_id,
-                           PACKAGE_TYPE_ID=package_type_id)
-
-        resp = self._aurora_storage._execute(query)
+    def _acquire_locks(self, skus, request_id, timestamp):
+        """
+        Take a lease on a list of (brand_id, package_type_id) pairs, in one round trip.
+
+        A lease older than PROJECTIONS_LOCK_TTL_SECONDS is considered abandoned (e.g. the lambda holding it
+        timed out) and is taken over. Every takeover increments the pair's fencing token, and every write
+        of the projections is conditioned on it, see _write_projections().
+
+        Pairs whose lease is busy are left alone. The leases actually taken, with their fencing tokens,
+        come back with the sources, see _get_projection_sources().
+        """
+        print('Acquire lock for {N} products, request_id: {ID}'.format(N=len(skus), ID=request_id))
+        expired_before = timestamp - int(os.environ.get('PROJECTIONS_LOCK_TTL_SECONDS', 900))
+
+        self._aurora_storage.batch_execute_named('projections.acquire_lease', [{
+            "brand_id": brand_id,
+            "package_type_id": package_type_id,
+            "request_id": request_id,
+            "timestamp": timestamp,
+            "expired_before": expired_before
+        } for brand_id, package_type_id in skus])
+
+    def _release_locks(self, request_id, transaction_id=None):
+        """
+        Expire our leases. The rows are kept so that fencing tokens keep increasing
+        """
+        print('Release lock for request_id: {ID}'.format(ID=request_id))
+        return self._aurora_storage.execute_named('projections.release_leases', {'request_id': request_id},
+                                                  transaction_id)
+
+    def requeue_projections(self, obj, attempt):
+        """
+        Send a projections message back to the queue, delayed with an exponential backoff,
+        instead of waiting for a busy lease inside the lambda.
+
+        After PROJECTIONS_MAX_LOCK_ATTEMPTS attempts the message is logged and dropped, the next
+        change to the same SKUs schedules the projections again.
+
+        :return: send_message response, None when dropped
+        """
+        max_attempts = int(os.environ.get('PROJECTIONS_MAX_LOCK_ATTEMPTS', 10))
+        if attempt + 1 >= max_attempts:
+            print('Dropping projections after {N} lock attempts: {OBJ}'.format(N=attempt + 1, OBJ=json.dumps(obj)))
+            return None
+
+        delay = min(900, int(os.environ.get('PROJECTIONS_LOCK_RETRY_DELAY_SECONDS', 15)) * 2 ** attempt)
+        obj = dict(obj, lock_attempts=attempt + 1)
+
+        sqs = clients.client('sqs', region_name=self._region_name)
+        queue_url = sqs.get_queue_url(QueueName='{STAGE}-projections'.format(STAGE=self._stage))['QueueUrl']
+        resp = sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(obj), DelaySeconds=delay)
         print(resp)
         return resp
 
-    def process_projections_queue(self, supplier_id, brand_id, package_type_id, start_date, request_id):
-        try:
-            self._acquire_lock(brand_id, package_type_id, request_id)
+    def _get_projection_sources(self, supplier_id, skus, start_date, end_date, request_id, timestamp):
+        """
+        Fetch on_hand, production, sales and adjustments of a list of (brand_id, package_type_id) pairs,
+        and the leases taken on them by request_id at timestamp, each row tagged with the table it came from.
+
+        Only the rows stored are read, in pages of PROJECTION_SOURCES_MAX_ROWS rows: a single round trip
+        unless the products have more rows than that, whatever their number.
+
+        :return: ({(brand_id, package_type_id): fencing_token},
+                  {(brand_id, package_type_id): {source: {date: quantity}}})
+        """
+        name = 'projections.sources'
+        parameters = {
+            'supplier_id': supplier_id,
+            'skus': ','.join('{B}:{P}'.format(B=brand_id, P=package_type_id) for brand_id, package_type_id in skus),
+            'start_date_minus_one': (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=1)).date().isoformat(),
+            'start_date': start_date,
+            'end_date': end_date,
+            'request_id': request_id,
+            'timestamp': timestamp,
+            'count': PROJECTION_SOURCES_MAX_ROWS,
+        }
 
-            print(brand_id, package_type_id, start_date)
-            start_date_minus_one = maya.parse(start_date).add(days=-1).iso8601().split('T')[0]
+        tokens = {}
+        sources = {}
+        while True:
+            columns = self._aurora_storage.get_columns_named(name, parameters)
+            rows = list(zip(columns['source'], columns['brand_id'], columns['package_type_id'],
+                            columns['day'], columns['quantity'], columns['actual']))
+
+            for source, brand_id, package_type_id, day, quantity, actual in rows:
+                sku = (brand_id, package_type_id)
+                if source == 'lease':
+                    tokens[sku] = int(quantity)
+                    continue
+
+                if sku not in sources:
+                    sources[sku] = {
+                        'on_hand_actual': {},
+                        'on_hand_theoretical': {},
+                        'production': {},
+                        'sales': {},
+                        'adjustments': {},
+                    }
+
+                if source == 'on_hand':
+                    source = 'on_hand_actual' if actual else 'on_hand_theoretical'
+                sources[sku][source][day] = int(quantity)
+
+            if len(rows) < PROJECTION_SOURCES_MAX_ROWS:
+                return tokens, sources
+
+            source, brand_id, package_type_id, day, _, actual = rows[-1]
+            name = 'projections.sources_after'
+            parameters.update({
+                'after_brand_id': brand_id,
+                'after_package_type_id': package_type_id,
+                'after_source': source,
+                'after_day': day,
+                'after_actual': actual,
+            })
+
+    @staticmethod
+    def _compute_projections(supplier_id, skus, sources, start_date, end_date, incremental):
+        """
+        Project every sku in one pass of the balance kernel
+
+        :return: (theoretical on_hand rows to upsert, (brand_id, package_type_id, date) of rows to delete)
+        """
+        # numpy is only needed here, keep it off the import path of the on_hand API handlers
+        import numpy as np
+        from data_dynamodb.projections import date_range, to_dense, running_balance
+
+        days = date_range(start_date, end_date)
+        dates = np.datetime_as_string(days).tolist()
+        previous_date = str(np.datetime64(start_date, 'D') - 1)
+
+        n_skus = len(skus)
+        opening = np.zeros(n_skus, dtype=np.int64)
+        actual = np.zeros((n_skus, len(days)), dtype=np.int64)
+        has_actual = np.zeros((n_skus, len(days)), dtype=bool)
+        delta = np.zeros((n_skus, len(days)), dtype=np.int64)
+
+        empty = {'on_hand_actual': {}, 'on_hand_theoretical': {}, 'production': {}, 'sales': {}, 'adjustments': {}}
+
+        for i, sku in enumerate(skus):
+            sku_sources = sources.get(sku, empty)
+            on_hands_actual = sku_sources['on_hand_actual']
+            on_hands_theoretical = sku_sources['on_hand_theoretical']
+
+            opening[i] = on_hands_actual.get(previous_date, on_hands_theoretical.get(previous_date, 0))
+
+            produced, _ = to_dense(sku_sources['production'], days)
+            sold, _ = to_dense(sku_sources['sales'], days)
+            adjusted, _ = to_dense(sku_sources['adjustments'], days)
+            actual[i], has_actual[i] = to_dense(on_hands_actual, days)
+            delta[i] = produced - sold + adjusted
+
+        balances = running_balance(opening, actual, has_actual, delta)
+
+        objs = []
+        stale = []
+        for i, (brand_id, package_type_id) in enumerate(skus):
+            on_hands_theoretical = sources.get((brand_id, package_type_id), empty)['on_hand_theoretical']
+
+            # theoretical rows already in the window, anything we don't rewrite below is stale
+            existing_theoretical = {date: quantity for date, quantity in on_hands_theoretical.items()
+                                    if start_date <= date <= end_date}
+            stale_dates = set(existing_theoretical)
+
+            for current_date, quantity, is_actual in zip(dates, balances[i].tolist(), has_actual[i].tolist()):
+                if is_actual:
+                    # we don't want to disturb the actual entries, we are only going to manipulate theoretical entries
+                    continue
+
+                stale_dates.discard(current_date)
+                if incremental and existing_theoretical.get(current_date) == quantity:
+                    continue
+
+                objs.append({
+                    'supplier_id': supplier_id,
+                    'created_on': current_date,
+                    'brand_id': brand_id,
+                    'package_type_id': package_type_id,
+                    'quantity': quantity,
+                    'actual': False
+                })
+
+            stale.extend((brand_id, package_type_id, date) for date in sorted(stale_dates))
+
+        return objs, stale
+
+    def _write_projections(self, supplier_id, request_id, objs, stale, tokens, transaction_id):
+        """
+        Upsert the theoretical on_hand rows and delete the theoretical rows listed in `stale`
+        (left over when an actual count landed on a previously projected day), within transaction_id:
+        readers see either the previous rows or the new ones.
+
+        Every statement only writes while our lease on its product is still valid, checked by the statement
+        itself against the fencing token, so a run whose lease was taken over writes nothing. The run that
+        took it over recomputes the whole window anyway.
+        """
+        self._aurora_storage.batch_execute_named('projections.delete_theoretical', [{
+            'supplier_id': supplier_id,
+            'brand_id': brand_id,
+            'package_type_id': package_type_id,
+            'created_on': created_on,
+            'request_id': request_id,
+            'fencing_token': tokens[(brand_id, package_type_id)]
+        } for brand_id, package_type_id, created_on in stale], transaction_id)
+
+        self._aurora_storage.batch_execute_named('projections.upsert_theoretical', [{
+            'supplier_id': obj['supplier_id'],
+            'created_on': obj['created_on'],
+            'brand_id': obj['brand_id'],
+            'package_type_id': obj['package_type_id'],
+            'quantity': obj['quantity'],
+            'request_id': request_id,
+            'fencing_token': tokens[(obj['brand_id'], obj['package_type_id'])]
+        } for obj in objs], transaction_id)
+
+    def _run_projections(self, supplier_id, skus, start_date, request_id, incremental):
+        """
+        Recompute the projections of skus. The Data API round trips are: take the leases, read the sources
+        together with the leases taken (one call per page of rows, a single one unless the products have
+        many), then in one transaction delete the stale rows (only when there are any), upsert the
+        projected rows and release the leases.
+
+        The leases are taken in a statement of their own, committed right away: a concurrent run sees
+        them busy and requeues its message instead of waiting on the row locks of our transaction.
+
+        The skus whose lease was taken are projected. Those whose lease is busy are left to the caller,
+        another run holds them and they are requeued, see requeue_projections().
+
+        :return: list of the busy (brand_id, package_type_id), nothing was written for them
+        """
+        if not skus:
+            return []
+
+        released = False
+        try:
+            timestamp = int(time.time())
+            self._acquire_locks(skus, request_id, timestamp)
 
             cutoff = int(os.environ['PROJECTIONS_CUTOFF_DELTA_DAYS'])
             end_date = maya.when('today').add(days=cutoff).iso8601().split('T')[0]
 
-            # query on_hand between start date minus 1 and end date
-            table = 'on_hand'
-            query = """
-            SELECT *
-            FROM {TABLE}
-            USE INDEX (by_created_on_and_supplier_id)
-            WHERE supplier_id='{SUPPLIER_ID}' AND package_type_id='{PACKAGE_TYPE_ID}' AND brand_id='{BRAND_ID}' AND (created_on BETWEEN '{START_DATE}' AND '{END_DATE}') 
-            """.format(TABLE=table,
-                       SUPPLIER_ID=supplier_id,
-                       START_DATE=start_date_minus_one,
-                       END_DATE=end_date,
-                       BRAND_ID=brand_id,
-                       PACKAGE_TYPE_ID=package_type_id)
-            results = self._aurora_storage.get_items(query)
-
-            # # convert from response
-            keys = [
-                "supplier_id",
-                "created_on",
-                "brand_id",
-                "package_type_id",
-                "quantity",
-                "actual"
-            ]
-
-            on_hands_theoretical = {}
-            on_hands_actual = {}
-            for result in results:
-                record = {}
-                for i, val in enumerate(result):
-                    record[keys[i]] = val
-
-                if record['actual']:
-                    on_hands_actual[record['created_on']] = record
-                else:
-                    on_hands_theoretical[record['created_on']] = record
-
-            print("On Hand: ")
-            print(on_hands_actual)
-            print(on_hands_theoretical)
-
-            # query productions between start date and end date
-            table = 'production'
-            query = """
-                    SELECT production_date, SUM(quantity)
-                    FROM {TABLE}
-                    USE INDEX (by_production_date_and_supplier_id)
-                    WHERE supplier_id='{SUPPLIER_ID}' AND package_type_id='{PACKAGE_TYPE_ID}' AND brand_id='{BRAND_ID}' AND (production_date BETWEEN '{START_DATE}' AND '{END_DATE}') 
-                    GROUP BY production_date
-                    """.format(TABLE=table,
-                               SUPPLIER_ID=supplier_id,
-                               START_DATE=start_date,
-                               END_DATE=end_date,
-                               BRAND_ID=brand_id,
-                               PACKAGE_TYPE_ID=package_type_id)
-            results = self._aurora_storage.get_items(query)
-
-            # # convert from response
-            keys = [
-                "production_date",
-                "quantity"
-            ]
-
-            production = {}
-            for result in results:
-                record = {}
-                for i, val in enumerate(result):
-                    record[keys[i]] = val
-
-                production[record['production_date']] = record
-
-            print("Production: ")
-            print(production)
-
-            # query sales between start date and end date
-            table = 'sales'
-            query = """
-                    SELECT sale_date, SUM(quantity)
-                    FROM {TABLE}
-                    USE INDEX (by_sale_date_and_supplier_id)
-                    WHERE supplier_id='{SUPPLIER_ID}' AND package_type_id='{PACKAGE_TYPE_ID}' AND brand_id='{BRAND_ID}' AND (sale_date BETWEEN '{START_DATE}' AND '{END_DATE}') 
-                    GROUP BY sale_date
-                    """.format(TABLE=table,
-                               SUPPLIER_ID=supplier_id,
-                               START_DATE=start_date,
-                               END_DATE=end_date,
-                               BRAND_ID=brand_id,
-                               PACKAGE_TYPE_ID=package_type_id)
-            results = self._aurora_storage.get_items(query)
-
-            # # convert from response
-            keys = [
-                "sale_date",
-                "quantity"
-            ]
-
-            sales = {}
-            for result in results:
-                record = {}
-                for i, val in enumerate(result):
-                    record[keys[i]] = val
-
-                sales[record['sale_date']] = record
-
-            print("Sales: ")
-            print(sales)
-
-            # query adjustments between start date and end date
-            table = 'adjustments'
-            query = """
-                    SELECT adjustment_date, SUM(quantity)
-                    FROM {TABLE}
-                    USE INDEX (by_adjustment_date_and_supplier_id)
-                    WHERE supplier_id='{SUPPLIER_ID}' AND package_type_id='{PACKAGE_TYPE_ID}' AND brand_id='{BRAND_ID}' AND (adjustment_date BETWEEN '{START_DATE}' AND '{END_DATE}') 
-                    GROUP BY adjustment_date
-                    """.format(TABLE=table,
-                               SUPPLIER_ID=supplier_id,
-                               START_DATE=start_date,
-                               END_DATE=end_date,
-                               BRAND_ID=brand_id,
-                               PACKAGE_TYPE_ID=package_type_id)
-            results = self._aurora_storage.get_items(query)
-
-            # # convert from response
-            keys = [
-                "adjustment_date",
-                "quantity"
-            ]
-
-            adjustments = {}
-            for result in results:
-                record = {}
-                for i, val in enumerate(result):
-                    record[keys[i]] = val
-
-                adjustments[record['adjustment_date']] = record
-
-            print("Adjustments: ")
-            print(adjustments)
-
-            start = maya.parse(start_date)
-            end = maya.parse(end_date)
-            interval = MayaInterval(start=start, end=end)
-
-            objs = []
-            for day_interval in interval.split(duration=24*60*60):
-                current_date = day_interval.start.iso8601().split('T')[0]
-                previous_date = maya.parse(current_date).add(days=-1).iso8601().split('T')[0]
-
-                if previous_date in on_hands_actual:
-                    start_quantity = on_hands_actual[previous_date]['quantity']
-                elif previous_date in on_hands_theoretical:
-                    start_quantity = on_hands_theoretical[previous_date]['quantity']
-                else:
-                    start_quantity = 0
-
-                produce = 0
-                if current_date in production:
-                    produce = production[current_date]['quantity']
-
-                sale_quantity = 0
-                if current_date in sales:
-                    sale_quantity = sales[current_date]['quantity']
-
-                adjust_quantity = 0
-                if current_date in adjustments:
-                    adjust_quantity = adjustments[current_date]['quantity']
-
-                quantity = int(start_quantity) + int(produce) - int(sale_quantity) + int(adjust_quantity)
-
-                if current_date in on_hands_actual:
-                    # we don't want to disturb the actual entries, we are only going to manipulate theoretical entries
-                    pass
-                else:
-                    obj = {
-                        'supplier_id': supplier_id,
-                        'created_on': current_date,
-                        'brand_id': brand_id,
-                        'package_type_id': package_type_id,
-                        'quantity': quantity,
-                        'actual': False
-                    }
-                    objs.append(obj)
-
-                    # update
-                    on_hands_theoretical[current_date] = obj
-
-            # Delete all actual=False entries in on_hand in this time period
-            table = 'on_hand'
-            query = """
-                    DELETE
-                    FROM {TABLE}
-                    WHERE supplier_id='{SUPPLIER_ID}' AND package_type_id='{PACKAGE_TYPE_ID}' AND brand_id='{BRAND_ID}' AND actual=false AND (created_on BETWEEN '{START_DATE}' AND '{END_DATE}') 
-                    """.format(TABLE=table,
-                               SUPPLIER_ID=supplier_id,
-                               START_DATE=start_date,
-                               END_DATE=end_date,
-                               BRAND_ID=brand_id,
-                               PACKAGE_TYPE_ID=package_type_id)
-            resp = self._aurora_storage._execute(query)
-            print(resp)
-
-            # Insert into on_hand
-            resp = self._aurora_storage.bulk_insert('on_hand', objs)
-            print(resp)
-
-            obj = {
-                "supplier_id": supplier_id,
-                "brand_id": brand_id,
-                "package_type_id": package_type_id,
-                "start_date": start_date,
-                "end_date": end_date
-            }
-            self.sns_publish("projections", obj)  # publish notification
+            tokens, sources = self._get_projection_sources(supplier_id, skus, start_date, end_date,
+                                                           request_id, timestamp)
+
+            locked = [sku for sku in skus if sku in tokens]
+            busy = [sku for sku in skus if sku not in tokens]
+            if busy:
+                print('{N} of {M} products busy, projecting the others'.format(N=len(busy), M=len(skus)))
+            if not locked:
+                return busy
+
+            objs, stale = self._compute_projections(supplier_id, locked, sources, start_date, end_date, incremental)
+            print("Writing {N} theoretical on_hand rows, deleting {M}".format(N=len(objs), M=len(stale)))
+
+            with self._aurora_storage.transaction() as transaction_id:
+                self._write_projections(supplier_id, request_id, objs, stale, tokens, transaction_id)
+                self._release_locks(request_id, transaction_id)
+            released = True
+
+            for brand_id, package_type_id in locked:
+                obj = {
+                    "supplier_id": supplier_id,
+                    "brand_id": brand_id,
+                    "package_type_id": package_type_id,
+                    "start_date": start_date,
+                    "end_date": end_date
+                }
+                self.sns_publish("projections", obj)  # publish notification
+
+            return busy
 
         finally:
-            self._release_lock(brand_id, package_type_id)
+            if not released:
+                self._release_locks(request_id)
 
-    def get_details_by_date_range(self, supplier_id, start_date, end_date=None):
+    def process_projections_queue(self, supplier_id, brand_id, package_type_id, start_date, request_id,
+                                  incremental=True):
+        """
+        Recalculate the theoretical on_hand of a brand/package pair from start_date up to
+        today + PROJECTIONS_CUTOFF_DELTA_DAYS.
+
+        With `incremental` only the days whose projected quantity differs from the stored theoretical
+        row are written. Pass incremental=False to rewrite every day in the window.
+
+        :raise AquireProjectionLockError: the lease of the pair is busy, nothing was written
+        """
+        print(brand_id, package_type_id, start_date)
+
+        if self._run_projections(supplier_id, [(brand_id, package_type_id)], start_date, request_id, incremental):
+            raise AquireProjectionLockError("Busy")
+
+    def process_supplier_projections_queue(self, supplier_id, start_date, request_id, products=None,
+                                           incremental=True):
+        """
+        Recalculate the theoretical on_hand of many products of a supplier at once, with one write
+        for all of them. The sources are read for the requested products only, see _get_projection_sources().
+
+        :param products: list of {"brand_id", "package_type_id"} dicts. Defaults to every product of the supplier
+        :return: list of {"brand_id", "package_type_id"} dicts of the products whose lease was busy, to requeue.
+        The other products were projected.
+        """
+        if products is None:
+            products = self.get_all_products(supplier_id, fields=['brand_id', 'package_type_id'])
+
+        skus = sorted({(product['brand_id'], product['package_type_id']) for product in products})
+
+        print(supplier_id, len(skus), start_date)
+
+        busy = self._run_projections(supplier_id, skus, start_date, request_id, incremental)
+
+        return [{'brand_id': brand_id, 'package_type_id': package_type_id} for brand_id, package_type_id in busy]
+
+    def get_details_page(self, supplier_id, start_date, end_date=None, after=None, page_size=1000):
+        """
+        One page of on_hand rows of a supplier, ordered by brand_id, package_type_id, created_on.
+        Pages are read with keyset pagination, so late pages cost the same as the first one.
+
+        :param after: cursor returned with the previous page, None for the first page
+        :return: (rows, cursor of the next page), the cursor is None after the last page
+        """
         # query on_hand between start date minus 1 and end date
         start_date = maya.parse(start_date).iso8601().split('T')[0]
         end_date = maya.parse(end_date).iso8601().split('T')[0]
 
-        table = 'on_hand'
-        offset = 0
-        count = 1000
-        details = []
+        parameters = {
+            'supplier_id': supplier_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            'count': page_size,
+        }
+        if after:
+            results = self._aurora_storage.get_rows_named('on_hand.details_page_after', dict(parameters, **{
+                'after_brand_id': after['brand_id'],
+                'after_package_type_id': after['package_type_id'],
+                'after_created_on': after['created_on'],
+                'after_actual': after['actual'],
+            }))
+        else:
+            results = self._aurora_storage.get_rows_named('on_hand.details_page', parameters)
+
+        cursor = None
+        if len(results) == page_size:
+            last = results[-1]
+            cursor = {key: last[key] for key in ('brand_id', 'package_type_id', 'created_on', 'actual')}
 
+        for record in results:
+            if record['actual']:
+                record['actual'] = False
+
+        return results, cursor
+
+    def iter_details_by_date_range(self, supplier_id, start_date, end_date=None, page_size=1000):
+        """
+        Yield the on_hand rows of a supplier as the pages arrive, see get_details_page().
+        Only one page is held in memory at a time.
+        """
+        cursor = None
         while True:
-            query = """
-                        SELECT created_on, brand_id, package_type_id, quantity, actual
-                        FROM {TABLE}
-                        WHERE  supplier_id='{SUPPLIER_ID}' AND (created_on BETWEEN '{START_DATE}' AND '{END_DATE}') AND (quantity<>0)
-                        ORDER BY brand_id, package_type_id, created_on, actual
-                        LIMIT {OFFSET}, {COUNT}
-                        """.format(TABLE=table,
-                                   SUPPLIER_ID=supplier_id,
-                                   START_DATE=start_date,
-                                   END_DATE=end_date,
-                                   OFFSET=offset,
-                                   COUNT=count)
-
-            results = self._aurora_storage.get_items(query)
-
-            # convert from response
-            keys = [
-                "created_on",
-                "brand_id",
-                "package_type_id",
-                "quantity",
-                "actual"
-            ]
-
-            for result in results:
-                record = {}
-                for i, val in enumerate(result):
-                    record[keys[i]] = val
-
-                if record['actual']:
-                    record['actual'] = False
-                details.append(record)
-
-            if len(results) < 1000:
+            results, cursor = self.get_details_page(supplier_id, start_date, end_date, cursor, page_size)
+            for record in results:
+                yield record
+
+            if cursor is None:
                 break
-            else:
-                offset += 1000
 
-        return details
+    def get_details_by_date_range(self, supplier_id, start_date, end_date=None):
+        return list(self.iter_details_by_date_range(supplier_id, start_date, end_date))
@@ -1,4 +1,3 @@
-from boto3.dynamodb.conditions import Key, Attr
 from dynamodb_json import json_util
 
 from data_common.constants import product_attributes, base_attributes
@@ -7,43 +6,42 @@ from data_common.repository import ProductRepository
 from data_common.notifications import SnsNotifier
 from data_common.utils import clean
 from data_dynamodb.utils import check_for_required_keys, check_properties_datatypes
+from data_dynamodb.extended_data_adapter import projection
 
 
 class DynamoProductRepository(ProductRepository, SnsNotifier):
-    def get_all_products(self, supplier):
+    def get_all_products(self, supplier, fields=None):
         obj_type = 'products'
 
         if isinstance(supplier, list):
-            response_items = []
-            for item in supplier:
-                query = {
-                    'KeyConditionExpression': Key('supplier_id').eq(item) & Key('obj_type').eq(obj_type),
-                    'FilterExpression':
-                        (Attr('latest').eq(True) & Attr('active').eq(True)),
-                    'IndexName': 'by_supplier_id_and_obj_type'
-                }
-                response = self._storage.get_items(query)
-                response_items.extend(response['Items'])
+            suppliers = supplier
         else:
-            query = {
-                'KeyConditionExpression': Key('supplier_id').eq(supplier) & Key('obj_type').eq(obj_type),
-                'FilterExpression':
-                    (Attr('latest').eq(True) & Attr('active').eq(True)),
-                'IndexName': 'by_supplier_id_and_obj_type'
-            }
-            response = self._storage.get_items(query)
-            response_items = response['Items']
+            suppliers = [supplier]
+
+        queries = [
+            {
+                **self._storage.latest_supplier_query(supplier_id, obj_type),
+                **projection(fields)
+            } for supplier_id in suppliers
+        ]
+
+        if len(queries) == 1:
+            pages = [self._storage.iter_items(queries[0])]
+        else:
+            # a distributor's suppliers are queried concurrently
+            pages = self._storage.query_many(queries)
 
         products_obj = []
 
-        for item in response_items:
-            # The 4 lines below can be uncommented if we move
-            # from ALL to KEYS_ONLY for the table
-            # entity_id = item['EntityID']
-            # product = self._storage.get(table, entity_id)
-            # product = clean(product)
-            product = json_util.loads(clean(item))
-            products_obj.append(product)
+        for items in pages:
+            for item in items:
+                # The 4 lines below can be uncommented if we move
+                # from ALL to KEYS_ONLY for the table
+                # entity_id = item['EntityID']
+                # product = self._storage.get(table, entity_id)
+                # product = clean(product)
+                product = json_util.loads(clean(item))
+                products_obj.append(product)
 
         return products_obj
 
@@ -63,6 +61,9 @@ class DynamoProductRepository(ProductRepository, SnsNotifier):
 
         return product_type
 
+    def save_products(self, objs):
+        return self.save_many('products', objs, product_attributes, 'products')
+
     def get_product_by_id(self, supplier_id, entity_id):
         obj_type = 'products'
 
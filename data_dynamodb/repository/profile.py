@@ -4,6 +4,7 @@ from data_common.exceptions import BadParameters, NoSuchEntity
 from data_common.repository import ProfileRepository
 from data_common.notifications import SnsNotifier
 from data_common.utils import clean, generate_affiliate_id
+from data_dynamodb import app_metadata_cache
 
 import json
 
@@ -36,7 +37,7 @@ class DynamoProfileRepository(ProfileRepository, SnsNotifier):
                 'email': self._email,
                 'affiliate_id': affiliate_id,
             }
-            user_obj = self._storage.save(obj_type, user_obj)
+            user_obj = self._storage.save(obj_type, user_obj, new=True)
             self.sns_publish("users", user_obj)  # publish notification
 
         user_obj = clean(user_obj)
@@ -99,9 +100,8 @@ class DynamoProfileRepository(ProfileRepository, SnsNotifier):
                 if "suppliers" in app_metadata:
                     suppliers = app_metadata["suppliers"]
 
-                    for supplier_id in suppliers:
-                        # get supplier obj
-                        supplier = self._storage.get(supplier_id)
+                    # get supplier objs
+                    for supplier in self._storage.batch_get(suppliers):
                         if supplier:
                             supplier = clean(supplier)
 
@@ -122,9 +122,8 @@ class DynamoProfileRepository(ProfileRepository, SnsNotifier):
                 if "distributors" in app_metadata:
                     distributors = app_metadata["distributors"]
 
-                    for distributor_id in distributors:
-                        # get distributor obj
-                        distributor = self._storage.get(distributor_id)
+                    # get distributor objs
+                    for distributor in self._storage.batch_get(distributors):
                         if distributor:
                             distributor = clean(distributor)
 
@@ -189,6 +188,7 @@ class DynamoProfileRepository(ProfileRepository, SnsNotifier):
         # update app_metadata
         user_obj["app_metadata"] = app_metadata
         user_obj = self._storage.save(obj_type, user_obj)
+        app_metadata_cache.invalidate(self._user_id)
         self.sns_publish("users", user_obj)  # publish notification
 
         return user_obj
@@ -196,6 +196,10 @@ class DynamoProfileRepository(ProfileRepository, SnsNotifier):
     def get_user_app_metadata(self):
         obj_type = 'users'
 
+        app_metadata = app_metadata_cache.get(app_metadata_cache.PROFILE, self._user_id)
+        if app_metadata is not None:
+            return app_metadata
+
         # get user profile
         user_obj = self._storage.get_by_user_id(self._user_id)
 
@@ -205,8 +209,22 @@ class DynamoProfileRepository(ProfileRepository, SnsNotifier):
         user_obj = clean(user_obj)
 
         app_metadata = user_obj.get("app_metadata", {})
+        app_metadata_cache.put(app_metadata_cache.PROFILE, self._user_id, app_metadata)
         return app_metadata
 
+    def get_memberships_version(self):
+        """
+        memberships_version of the profile app_metadata, without reading the profile, see
+        ExtendedDynamoStorage.get_memberships_version()
+
+        :return: int, None when unknown
+        """
+        return self._storage.get_memberships_version(self._user_id)
+
+    def get_auth0_app_metadata(self):
+        """app_metadata of the Auth0 user, the one the claims of its tokens are built from"""
+        return self._auth0.get_app_metadata()
+
     def delete_profile(self):
         obj_type = 'users'
 
@@ -1,11 +1,12 @@
 import os
-import requests
 import base64
 import binascii
-import boto3
 
 from boto3.dynamodb.conditions import Key, Attr
+from dynamodb_json import json_util
 
+from data_dynamodb import clients
+from data_dynamodb.auth0_adapter import updated
 from data_dynamodb.utils import generate_random_password
 from data_common.constants import supplier_attributes, base_attributes
 from data_common.exceptions import BadParameters, NoSuchEntity, \
@@ -14,7 +15,8 @@ from data_common.exceptions import BadParameters, NoSuchEntity, \
 from data_common.repository import SupplierRepository
 from data_common.notifications import SnsNotifier
 from data_common.utils import clean, generate_affiliate_id
-from data_dynamodb.utils import check_for_required_keys, check_properties_datatypes
+from data_dynamodb.utils import check_for_required_keys, check_properties_datatypes, \
+    bump_memberships_version
 
 
 class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
@@ -43,9 +45,9 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
     def add_supplier_to_app_metadata(self, supplier_id, role, valid=True, user_id=None):
         # get Auth0 user profile object (in order to get app_metadata)
         if user_id:
-            app_metadata = self._auth0.get_app_metadata(user_id)
+            app_metadata = self._auth0.get_app_metadata(user_id, fresh=True)
         else:
-            app_metadata = self._auth0.get_app_metadata()
+            app_metadata = self._auth0.get_app_metadata(fresh=True)
 
         if "suppliers" not in app_metadata:
             app_metadata["suppliers"] = {}
@@ -55,6 +57,8 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
             "valid": valid
         }
 
+        bump_memberships_version(app_metadata)
+
         if user_id:
             self._auth0.update_app_metadata(app_metadata, user_id)
         else:
@@ -84,44 +88,64 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
         return False
 
     def remove_supplier_from_app_metadata(self, supplier_id, user_id=None):
-        # get Auth0 user profile object (in order to get app_metadata)
-        if user_id:
-            app_metadata = self._auth0.get_app_metadata(user_id)
-        else:
-            app_metadata = self._auth0.get_app_metadata()
+        return self.remove_supplier_from_users_app_metadata(supplier_id, [user_id or self._user_id])
 
-        if "suppliers" not in app_metadata:
-            return
+    def remove_supplier_from_users_app_metadata(self, supplier_id, user_ids):
+        """
+        Remove a supplier from the app_metadata of many users, in Auth0 and in their profiles.
+        The Auth0 reads and updates of all the users run concurrently.
 
-        app_metadata["suppliers"].pop(supplier_id, None)
+        :raise Auth0UnknownError: the Auth0 update of some users still failed after the retries of
+        update_app_metadata_many(). The profiles of the other users are saved, theirs are left as they were.
+        :raise NoSuchEntity: some users updated in Auth0 have no profile. The profiles of the others are saved.
+        :return: True when the app_metadata of a user was updated
+        """
+        # get Auth0 user profile objects (in order to get app_metadata)
+        app_metadata_by_user = {}
+        for user_id, app_metadata in self._auth0.get_app_metadata_many(user_ids, fresh=True).items():
+            if "suppliers" not in app_metadata:
+                continue
 
-        if user_id:
-            self._auth0.update_app_metadata(app_metadata, user_id)
-        else:
-            self._auth0.update_app_metadata(app_metadata)
+            app_metadata["suppliers"].pop(supplier_id, None)
 
-        # Update user table item with app_metadata
+            bump_memberships_version(app_metadata)
+            app_metadata_by_user[user_id] = app_metadata
+
+        statuses = self._auth0.update_app_metadata_many(app_metadata_by_user)
+        failed = {user_id: status for user_id, status in statuses.items() if not updated(status)}
+
+        # Update user table items with app_metadata, of the users updated in Auth0 only
         obj_type = 'users'
 
-        # get user profile
-        if user_id:
+        missing = []
+        for user_id, app_metadata in app_metadata_by_user.items():
+            if user_id in failed:
+                continue
+
+            # get user profile
             user_obj = self._storage.get_by_user_id(user_id)
-        else:
-            user_obj = self._storage.get_by_user_id(self._user_id)
 
-        if not user_obj:
-            raise NoSuchEntity
+            if not user_obj:
+                # Auth0 is updated already, save the other profiles before giving up
+                print('No profile for user {ID}, its app_metadata is only updated in Auth0'.format(ID=user_id))
+                missing.append(user_id)
+                continue
 
-        user_obj = clean(user_obj)
+            user_obj = clean(user_obj)
 
-        # update app_metadata
-        user_obj["app_metadata"] = app_metadata
-        user_obj = self._storage.save(obj_type, user_obj)
-        self.sns_publish("users", user_obj)  # publish notification
+            # update app_metadata
+            user_obj["app_metadata"] = app_metadata
+            user_obj = self._storage.save(obj_type, user_obj)
+            self.sns_publish("users", user_obj)  # publish notification
 
-        if "app_metadata" in user_obj:
-            return True
-        return False
+        if failed:
+            # the notification is processed again, the next attempt re-reads Auth0
+            raise Auth0UnknownError('Updating the app_metadata of {N} users failed: {STATUSES}'.format(
+                N=len(failed), STATUSES=failed))
+        if missing:
+            raise NoSuchEntity('No profile for users {IDS}'.format(IDS=', '.join(missing)))
+
+        return bool(app_metadata_by_user)
 
     def is_current_user_admin(self, supplier_id):
         app_metadata = self._auth0.get_app_metadata()
@@ -135,13 +159,15 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
         return False
 
     def get_all_suppliers(self, suppliers):
-        supplier_ids = suppliers.keys()
+        supplier_ids = list(suppliers.keys())
+
+        items = {item['entity_id']: item for item in self._storage.batch_get(supplier_ids)}
 
         suppliers_obj = []
         for supplier_id in supplier_ids:
-            supplier = self._storage.get(supplier_id)
+            supplier = items.get(supplier_id)
             if supplier:
-                supplier = clean(supplier)
+                supplier = json_util.loads(clean(supplier))
 
                 suppliers_obj.append(supplier)
 
@@ -236,10 +262,7 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
         if image_string:
             logo_filepath = self.base64_to_png(image_string)
 
-            if 'S3_ENDPOINT' in os.environ:
-                s3 = boto3.client('s3', endpoint_url=os.environ['S3_ENDPOINT'])
-            else:
-                s3 = boto3.client('s3')
+            s3 = clients.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT'))
 
             bucket_name = os.environ['S3_UPLOADS_BUCKET_NAME']
 
@@ -325,22 +348,7 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
             user_is_new = False
         else:
             # get Machine-to-machine access token
-            resp = requests.post(
-                os.environ['AUTH0_DOMAIN'] + '/oauth/token',
-                json={
-                    'grant_type': 'client_credentials',
-                    'client_id': os.environ['AUTH0_MANAGEMENT_API_CLIENT_ID'],
-                    'client_secret': os.environ['AUTH0_MANAGEMENT_API_CLIENT_SECRET'],
-                    'audience': os.environ['AUTH0_AUDIENCE'],
-                    'scope': 'create:users'
-                },
-                headers={
-                    'content-type': "application/json"
-                }
-
-            )
-
-            body = resp.json()
+            body = self._auth0.get_token_body('create:users')
 
             if all(k in body for k in [
                 'access_token',
@@ -356,7 +364,7 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
 
             access_token = body['access_token']
 
-            resp = requests.post(
+            resp = clients.http_session().post(
                 os.environ['AUTH0_DOMAIN'] + "/api/v2/users",
                 json={
                     'email': email,
@@ -415,7 +423,7 @@ class DynamoSuppliersRepository(SupplierRepository, SnsNotifier):
                 'affiliate_id': affiliate_id
             }
 
-            user_obj = self._storage.save('users', user_obj)
+            user_obj = self._storage.save('users', user_obj, new=True)
             self.sns_publish("users", user_obj)  # publish notification
 
         # save supplier obj
@@ -0,0 +1,311 @@
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import types
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+# the lambdas import data_dynamodb's modules both as data_dynamodb.X and as top level modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STAGE', 'test')
+
+
+def _stub_module(name, **attributes):
+    """
+    Register a stand-in for a module the deployment puts next to the lambdas (log_config, data_adapter, ...)
+    or the rest of data_common, when it is not importable here. An installed module is always preferred.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        pass
+
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(importlib.import_module(parent), child, module)
+    return module
+
+
+def _exception_class(name):
+    """data_common.exceptions stand-in: every exception the repositories name, as a plain Exception"""
+    if name.startswith('__'):
+        raise AttributeError(name)
+    exceptions = sys.modules['data_common.exceptions']
+    cls = type(name, (Exception,), {'__module__': exceptions.__name__})
+    setattr(exceptions, name, cls)
+    return cls
+
+
+class _DynamoStorage:
+    """data_adapter.DynamoStorage stand-in, its constructor builds a boto3 resource like the real one"""
+    def __init__(self, table, user_id=None, endpoint_url=None):
+        import boto3
+        self._table = boto3.resource('dynamodb', endpoint_url=endpoint_url).Table(table)
+
+
+class _AuroraStorage:
+    """aurora_adapter.AuroraStorage stand-in, its constructor builds a boto3 client like the real one"""
+    def __init__(self, db_arn, db_secret_arn, db_name):
+        import boto3
+        self._client = boto3.client('rds-data')
+
+
+def _clean(obj):
+    """data_common.utils.clean stand-in, drops the storage attributes of a version"""
+    return {k: v for k, v in obj.items() if k not in ('latest', 'obj_type', 'active')}
+
+
+def _is_right_datatype(val, datatype):
+    """data_common.utils.is_right_datatype stand-in, "uuid", "date", ... are strings"""
+    if isinstance(datatype, str):
+        return isinstance(val, str)
+    return isinstance(val, datatype)
+
+
+class _SnsNotifier:
+    def sns_publish(self, topic, obj):
+        pass
+
+
+class _SQSManager:
+    pass
+
+
+def _jwt_decode(token, key):
+    """services/auth.py jwt_decode stand-in, checks the signature with python-jose like the deployed one"""
+    from jose import jwt
+    return jwt.decode(token, key, options={'verify_aud': False})
+
+
+_stub_module('data_common.exceptions', __getattr__=_exception_class)
+_stub_module('data_common.utils',
+             clean=_clean,
+             generate_affiliate_id=lambda: 'affiliate',
+             is_right_datatype=_is_right_datatype)
+_stub_module('data_common.notifications', SnsNotifier=_SnsNotifier)
+_stub_module('data_common.queue', SQSManager=_SQSManager)
+_stub_module('data_adapter', DynamoStorage=_DynamoStorage)
+_stub_module('aurora_adapter', AuroraStorage=_AuroraStorage)
+_stub_module('log_config', logger=logging.getLogger('brewoptix'))
+_stub_module('auth', jwt_decode=_jwt_decode)
+
+
+AURORA_DB_ARN = 'arn:aws:rds:us-east-1:123456789012:cluster:brewoptix-test'
+AURORA_DB_SECRET_ARN = 'arn:aws:secretsmanager:us-east-1:123456789012:secret:brewoptix-test'
+AURORA_DB_NAME = 'brewoptix'
+
+
+class TransactionCanceledException(Exception):
+    def __init__(self, reasons):
+        super().__init__('Transaction cancelled')
+        self.response = {'CancellationReasons': reasons}
+
+
+class FakeDynamoClient:
+    """
+    In memory brewoptix table behind the low level calls of ExtendedDynamoStorage. Understands the
+    condition expressions the adapter writes, records every call.
+    """
+    class exceptions:
+        TransactionCanceledException = TransactionCanceledException
+
+    def __init__(self):
+        self.items = {}
+        self.calls = []
+        self.unprocessed = 0
+        # brewoptix-deployment table, script_number -> stage
+        self.deployments = {}
+
+    def put(self, **obj):
+        """Store an item as a plain dict, e.g. put(entity_id='a', version='1', latest=True)"""
+        serializer = TypeSerializer()
+        self.items[(obj['entity_id'], obj['version'])] = {k: serializer.serialize(v) for k, v in obj.items()}
+
+    def get(self, entity_id, version):
+        deserializer = TypeDeserializer()
+        item = self.items.get((entity_id, version))
+        return item and {k: deserializer.deserialize(v) for k, v in item.items()}
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+    @staticmethod
+    def _key(item):
+        return item['entity_id']['S'], item['version']['S']
+
+    def _check(self, action):
+        if 'Put' in action:
+            put = action['Put']
+            if put.get('ConditionExpression', '').startswith('attribute_not_exists'):
+                return self._key(put['Item']) not in self.items
+            return True
+
+        update = action['Update']
+        current = self.items.get(self._key(update['Key']))
+        return current is not None and current.get('latest', {}).get('BOOL') is True
+
+    def transact_write_items(self, TransactItems):
+        self.calls.append(('transact_write_items', TransactItems))
+        assert len(TransactItems) <= 25
+
+        reasons = [{'Code': 'None'} if self._check(action) else {'Code': 'ConditionalCheckFailed'}
+                   for action in TransactItems]
+        if any(reason['Code'] != 'None' for reason in reasons):
+            raise TransactionCanceledException(reasons)
+
+        for action in TransactItems:
+            if 'Put' in action:
+                self.items[self._key(action['Put']['Item'])] = action['Put']['Item']
+            else:
+                update = action['Update']
+                item = self.items[self._key(update['Key'])]
+                item['latest'] = {'BOOL': False}
+                for name in update['UpdateExpression'].split('REMOVE')[1].split(','):
+                    item.pop(name.strip(), None)
+        return {}
+
+    def batch_get_item(self, RequestItems):
+        self.calls.append(('batch_get_item', RequestItems))
+        ((table_name, request),) = RequestItems.items()
+        assert len(request['Keys']) <= 100
+
+        keys = request['Keys']
+        unprocessed = {}
+        if self.unprocessed:
+            keys, unprocessed = keys[:-self.unprocessed], {table_name: {'Keys': keys[-self.unprocessed:]}}
+            self.unprocessed = 0
+
+        found = [self.items[self._key(key)] for key in keys if self._key(key) in self.items]
+        return {'Responses': {table_name: found}, 'UnprocessedKeys': unprocessed}
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None):
+        self.calls.append(('get_item', Key))
+        if TableName != 'brewoptix-deployment':
+            item = self.items.get(self._key(Key), {})
+            if ProjectionExpression:
+                names = [ExpressionAttributeNames.get(name.strip(), name.strip())
+                         for name in ProjectionExpression.split(',')]
+                item = {k: v for k, v in item.items() if k in names}
+            return {'Item': item} if item else {}
+
+        script_number = int(Key['script_number']['N'])
+        if script_number not in self.deployments:
+            return {}
+        return {'Item': {'script_number': Key['script_number'], 'stage': {'S': self.deployments[script_number]}}}
+
+    def query(self, **query):
+        """Latest version of the entity_id of the key condition"""
+        self.calls.append(('query', query))
+        (entity_id,) = [value['S'] for value in query['ExpressionAttributeValues'].values() if 'S' in value]
+        found = [item for (item_id, _), item in self.items.items()
+                 if item_id == entity_id and item.get('latest', {}).get('BOOL') is True]
+        return {'Items': found}
+
+
+    def scan(self, TableName, Segment, TotalSegments, **scan):
+        """Items of a segment, those whose entity_id hashes to it, one item per page"""
+        self.calls.append(('scan', dict(scan, Segment=Segment, TotalSegments=TotalSegments)))
+        keys = sorted(key for key in self.items if sum(map(ord, key[0])) % TotalSegments == Segment)
+        if 'ExclusiveStartKey' in scan:
+            keys = [key for key in keys if key > self._key(scan['ExclusiveStartKey'])]
+        if not keys:
+            return {'Items': []}
+
+        item = self.items[keys[0]]
+        if len(keys) == 1:
+            return {'Items': [item]}
+        return {'Items': [item], 'LastEvaluatedKey': {'entity_id': item['entity_id'], 'version': item['version']}}
+
+
+def _matches(condition, item):
+    """Whether a deserialized item satisfies a Key() / Attr() condition, the operators the repositories use"""
+    expression = condition.get_expression()
+    operator, values = expression['operator'], expression['values']
+    if operator == 'AND':
+        return all(_matches(value, item) for value in values)
+
+    name = values[0].name
+    if operator == 'attribute_exists':
+        return name in item
+    if name not in item:
+        return False
+    if operator == '=':
+        return item[name] == values[1]
+    if operator == '>':
+        return item[name] > values[1]
+    if operator == 'BETWEEN':
+        return values[1] <= item[name] <= values[2]
+    raise ValueError(operator)
+
+
+class FakeDynamoTable:
+    """Table resource over the items of a FakeDynamoClient, query() evaluates the conditions of every index"""
+    def __init__(self, client):
+        self.client = client
+
+    def query(self, **query):
+        self.client.calls.append(('Table.query', query))
+        deserializer = TypeDeserializer()
+        items = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in self.client.items.values()]
+        for param in ('KeyConditionExpression', 'FilterExpression'):
+            if param in query:
+                items = [item for item in items if _matches(query[param], item)]
+        return {'Items': items}
+
+
+class FakeDynamoResource:
+    def __init__(self, client):
+        self.client = client
+
+    def Table(self, name):
+        return FakeDynamoTable(self.client)
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    """FakeDynamoClient behind data_dynamodb.clients"""
+    from data_dynamodb import clients
+
+    fake = FakeDynamoClient()
+    monkeypatch.setattr(clients, 'client', lambda *args, **kwargs: fake)
+    monkeypatch.setattr(clients, 'resource', lambda *args, **kwargs: FakeDynamoResource(fake))
+    return fake
+
+
+@pytest.fixture
+def build_repository(dynamodb, monkeypatch):
+    """
+    Factory of repositories built like insert_repo() builds them: a LazyDynamoRepository whose storages
+    are built by their own constructors, over the FakeDynamoClient. Notifications are recorded in
+    repo.published instead of being sent.
+
+    :param aurora_storage: ExtendedAuroraStorage subclass, or partial of one, answering the named
+    statements; the repository builds it instead of ExtendedAuroraStorage, with the same arguments
+    """
+    import extended_aurora_adapter
+    from data_dynamodb import lazy_repository
+    from data_dynamodb.lazy_repository import LazyDynamoRepository
+
+    # brands, package_types, ... are not in this tree, look methods up in the sub-repositories that are
+    monkeypatch.setattr(lazy_repository, 'IMPLEMENTATIONS', [
+        implementation for implementation in lazy_repository.IMPLEMENTATIONS
+        if importlib.util.find_spec(implementation[1]) is not None])
+
+    def build(user_id='user', aurora_storage=None):
+        if aurora_storage is not None:
+            monkeypatch.setattr(extended_aurora_adapter, 'ExtendedAuroraStorage', aurora_storage)
+
+        repo = LazyDynamoRepository(region_name='us-east-1', table='brewoptix-test', user_id=user_id,
+                                    aurora_db_arn=AURORA_DB_ARN, aurora_db_secret_arn=AURORA_DB_SECRET_ARN,
+                                    aurora_db_name=AURORA_DB_NAME)
+        repo.published = []
+        repo.sns_publish = lambda name, obj: repo.published.append((name, obj))
+        return repo
+
+    return build
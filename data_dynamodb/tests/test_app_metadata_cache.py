@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from data_dynamodb import app_metadata_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(app_metadata_cache, '_app_metadata', {})
+
+
+def test_entries_expire(monkeypatch):
+    app_metadata_cache.put(app_metadata_cache.AUTH0, 'u1', {'suppliers': {'s1': 'admin'}})
+    assert app_metadata_cache.get(app_metadata_cache.AUTH0, 'u1') == {'suppliers': {'s1': 'admin'}}
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + app_metadata_cache.APP_METADATA_TTL_SECONDS + 1)
+
+    assert app_metadata_cache.get(app_metadata_cache.AUTH0, 'u1') is None
+
+
+def test_empty_app_metadata_is_not_cached():
+    app_metadata_cache.put(app_metadata_cache.PROFILE, 'u1', {})
+
+    assert app_metadata_cache.get(app_metadata_cache.PROFILE, 'u1') is None
+
+
+def test_sources_are_cached_apart_and_invalidated_together():
+    app_metadata_cache.put(app_metadata_cache.PROFILE, 'u1', {'suppliers': {'s1': 'admin'}})
+    app_metadata_cache.put(app_metadata_cache.AUTH0, 'u1', {'suppliers': {}})
+
+    assert app_metadata_cache.get(app_metadata_cache.PROFILE, 'u1') == {'suppliers': {'s1': 'admin'}}
+    assert app_metadata_cache.get(app_metadata_cache.AUTH0, 'u1') == {'suppliers': {}}
+
+    app_metadata_cache.invalidate('u1')
+
+    assert app_metadata_cache.get(app_metadata_cache.PROFILE, 'u1') is None
+    assert app_metadata_cache.get(app_metadata_cache.AUTH0, 'u1') is None
+
+
+def test_entries_are_copies():
+    app_metadata = {'suppliers': {'s1': 'admin'}}
+    app_metadata_cache.put(app_metadata_cache.AUTH0, 'u1', app_metadata)
+    app_metadata['suppliers']['s2'] = 'user'
+
+    cached = app_metadata_cache.get(app_metadata_cache.AUTH0, 'u1')
+    cached['suppliers']['s3'] = 'user'
+
+    assert app_metadata_cache.get(app_metadata_cache.AUTH0, 'u1') == {'suppliers': {'s1': 'admin'}}
@@ -0,0 +1,273 @@
+import json
+import threading
+import time
+
+from botocore.exceptions import ClientError
+import pytest
+
+from data_adapter import DynamoStorage
+from data_common.exceptions import Auth0UnableToAccess
+from data_dynamodb import app_metadata_cache, auth0_adapter, clients
+from data_dynamodb.auth0_adapter import Auth0
+
+
+class Response:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Auth0 token and users endpoints, records the requests and how many were in flight at once"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app_metadata = {}
+        self._lock = threading.Lock()
+
+    def _request(self, method, url, body):
+        with self._lock:
+            self.requests.append((method, url.split('/', 3)[-1]))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return body
+
+    def post(self, url, json=None, headers=None):
+        return Response(self._request('post', url, {'access_token': json['scope'], 'expires_in': 86400}))
+
+    def get(self, url, headers=None):
+        user_id = url.rsplit('|', 1)[-1]
+        return Response(self._request('get', url, {'app_metadata': self.app_metadata.get(user_id, {})}))
+
+    def patch(self, url, payload, headers=None):
+        return Response(self._request('patch', url, {}))
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setenv('AUTH0_DOMAIN', 'https://tenant')
+    monkeypatch.setenv('AUTH0_MANAGEMENT_API_CLIENT_ID', 'client')
+    monkeypatch.setenv('AUTH0_MANAGEMENT_API_CLIENT_SECRET', 'secret')
+    monkeypatch.setenv('AUTH0_AUDIENCE', 'https://tenant/api/v2/')
+    monkeypatch.setattr(auth0_adapter, '_tokens', {})
+    monkeypatch.delenv(auth0_adapter.TOKEN_PARAMETER, raising=False)
+    for user_id in ('u1', 'u2', 'u3', 'u4', 'user'):
+        app_metadata_cache.invalidate(user_id)
+
+    fake = FakeSession()
+    monkeypatch.setattr(clients, 'http_session', lambda: fake)
+    return fake
+
+
+def test_get_app_metadata_many_reads_the_users_concurrently(session):
+    session.delay = 0.05
+    session.app_metadata = {'u1': {'suppliers': {'s1': 'admin'}}, 'u3': {'suppliers': {'s3': 'user'}}}
+
+    app_metadata = Auth0('user').get_app_metadata_many(['u1', 'u2', 'u3', 'u1'], fresh=True)
+
+    assert app_metadata == {'u1': {'suppliers': {'s1': 'admin'}}, 'u2': {}, 'u3': {'suppliers': {'s3': 'user'}}}
+    assert session.requests.count(('post', 'oauth/token')) == 1
+    assert session.max_in_flight == 3
+
+
+def test_update_app_metadata_many_patches_every_user(session):
+    session.delay = 0.05
+
+    statuses = Auth0('user').update_app_metadata_many({'u1': {}, 'u2': {}, 'u3': {}, 'u4': {}})
+
+    assert statuses == {'u1': 200, 'u2': 200, 'u3': 200, 'u4': 200}
+    assert sorted(url for method, url in session.requests if method == 'patch') == \
+        ['api/v2/users/auth0|u{}'.format(i) for i in range(1, 5)]
+    assert session.max_in_flight > 1
+
+
+def test_token_is_requested_once_while_fresh(session):
+    assert Auth0.get_token_body('read:users') == {'access_token': 'read:users', 'expires_in': 86400}
+    Auth0.get_token_body('read:users')
+    Auth0.get_token_body('update:users')
+
+    assert session.requests == [('post', 'oauth/token'), ('post', 'oauth/token')]
+
+
+def test_token_is_renewed_before_it_expires(session, monkeypatch):
+    Auth0.get_token_body('read:users')
+    expires_at = auth0_adapter._tokens['read:users']['expires_at']
+
+    monkeypatch.setattr(time, 'time', lambda: expires_at - auth0_adapter.TOKEN_EXPIRY_MARGIN + 1)
+    Auth0.get_token_body('read:users')
+
+    assert session.requests.count(('post', 'oauth/token')) == 2
+
+
+class FakeSsm:
+    """SSM parameters, GetParameter of an unknown name raises ParameterNotFound"""
+    def __init__(self):
+        self.parameters = {}
+
+    def get_parameter(self, Name, WithDecryption=False):
+        assert WithDecryption
+        if Name not in self.parameters:
+            raise ClientError({'Error': {'Code': 'ParameterNotFound'}}, 'GetParameter')
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name]}}
+
+    def put_parameter(self, Name, Value, Type, Overwrite=False):
+        assert Type == 'SecureString'
+        self.parameters[Name] = Value
+
+
+@pytest.fixture
+def ssm(session, monkeypatch):
+    monkeypatch.setenv(auth0_adapter.TOKEN_PARAMETER, '/brewoptix/test/auth0-token/')
+    fake = FakeSsm()
+    monkeypatch.setattr(clients, 'client', lambda service, **kwargs: fake if service == 'ssm' else None)
+    return fake
+
+
+def test_token_is_shared_with_cold_containers(session, ssm, monkeypatch):
+    Auth0.get_token_body('read:users')
+    assert list(ssm.parameters) == ['/brewoptix/test/auth0-token/read_users']
+
+    # another container
+    monkeypatch.setattr(auth0_adapter, '_tokens', {})
+    assert Auth0.get_token_body('read:users') == {'access_token': 'read:users', 'expires_in': 86400}
+
+    assert session.requests == [('post', 'oauth/token')]
+
+
+def test_expired_shared_token_is_renewed(session, ssm, monkeypatch):
+    Auth0.get_token_body('read:users')
+    expires_at = auth0_adapter._tokens['read:users']['expires_at']
+
+    monkeypatch.setattr(auth0_adapter, '_tokens', {})
+    monkeypatch.setattr(time, 'time', lambda: expires_at - auth0_adapter.TOKEN_EXPIRY_MARGIN + 1)
+    Auth0.get_token_body('read:users')
+
+    assert session.requests.count(('post', 'oauth/token')) == 2
+    assert json.loads(ssm.parameters['/brewoptix/test/auth0-token/read_users'])['expires_at'] > expires_at
+
+
+def test_token_error_body_is_not_cached(session, monkeypatch):
+    monkeypatch.setattr(session, 'post', lambda url, json=None, headers=None: Response({'error': 'access_denied'}))
+
+    assert Auth0.get_token_body('read:users') == {'error': 'access_denied'}
+    assert 'read:users' not in auth0_adapter._tokens
+
+
+def test_app_metadata_is_read_once_while_cached(session):
+    session.app_metadata = {'u1': {'suppliers': {'s1': 'admin'}}}
+    auth0 = Auth0('u1')
+
+    app_metadata = auth0.get_app_metadata()
+    app_metadata['suppliers']['s2'] = 'user'
+
+    assert auth0.get_app_metadata() == {'suppliers': {'s1': 'admin'}}
+    assert session.requests.count(('get', 'api/v2/users/auth0|u1')) == 1
+
+
+def test_fresh_app_metadata_bypasses_the_cache(session):
+    session.app_metadata = {'u1': {'suppliers': {'s1': 'admin'}}}
+    auth0 = Auth0('u1')
+
+    auth0.get_app_metadata()
+    session.app_metadata = {'u1': {'suppliers': {}}}
+
+    assert auth0.get_app_metadata(fresh=True) == {'suppliers': {}}
+    assert session.requests.count(('get', 'api/v2/users/auth0|u1')) == 2
+
+
+def test_app_metadata_error_response_raises_when_fresh(session, monkeypatch):
+    monkeypatch.setattr(session, 'get', lambda url, headers=None: Response({'error': 'too_many_requests'}, 429))
+    auth0 = Auth0('u1')
+
+    assert auth0.get_app_metadata() == {}
+    with pytest.raises(Auth0UnableToAccess):
+        auth0.get_app_metadata(fresh=True)
+
+
+def test_update_app_metadata_many_retries_the_refused_updates(session, monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    refused = {'u2': 2, 'u3': auth0_adapter.AUTH0_UPDATE_MAX_ATTEMPTS}
+    patch = session.patch
+
+    def rate_limited_patch(url, payload, headers=None):
+        user_id = url.rsplit('|', 1)[-1]
+        if refused.get(user_id):
+            refused[user_id] -= 1
+            return Response({'error': 'too_many_requests'}, 429)
+        return patch(url, payload, headers)
+
+    monkeypatch.setattr(session, 'patch', rate_limited_patch)
+
+    statuses = Auth0('user').update_app_metadata_many({'u1': {}, 'u2': {}, 'u3': {}})
+
+    assert statuses == {'u1': 200, 'u2': 200, 'u3': 429}
+    assert sorted(url for method, url in session.requests if method == 'patch') == \
+        ['api/v2/users/auth0|u1', 'api/v2/users/auth0|u2']
+
+
+@pytest.fixture
+def profiles(session, build_repository, monkeypatch):
+    """
+    Factory of repositories over the profiles of u1, u2 and u3, but the missing ones, in the FakeDynamoClient.
+    DynamoStorage.get_by_user_id() is not in this tree, the entity_id of a profile is its user_id.
+    """
+    def get_by_user_id(storage, user_id):
+        found = storage.batch_get([user_id])
+        return found[0] if found else None
+    monkeypatch.setattr(DynamoStorage, 'get_by_user_id', get_by_user_id, raising=False)
+
+    # the repositories import auth0_adapter as a top level module, a second copy with its own tokens
+    import auth0_adapter as loaded_auth0_adapter
+    monkeypatch.setattr(loaded_auth0_adapter, '_tokens', {})
+
+    def build(missing=()):
+        repo = build_repository()
+        for user_id in ('u1', 'u2', 'u3'):
+            if user_id not in missing:
+                repo._storage.save('users', {'entity_id': user_id, 'user_id': user_id})
+        return repo
+
+    return build
+
+
+def saved_app_metadata(repo):
+    """app_metadata of the latest version of each profile, None when it was not saved with one"""
+    profiles = repo._storage.batch_get(['u1', 'u2', 'u3'])
+    return {profile['entity_id']: profile.get('app_metadata') for profile in profiles}
+
+
+def test_retiring_a_supplier_saves_only_the_profiles_updated_in_auth0(session, profiles, monkeypatch):
+    from data_common.exceptions import Auth0UnknownError
+
+    session.app_metadata = {'u1': {'suppliers': {'s1': 'admin'}}, 'u2': {'suppliers': {'s1': 'user'}}}
+    repo = profiles()
+    monkeypatch.setattr(type(repo._auth0), 'update_app_metadata_many',
+                        lambda self, app_metadata_by_user: {'u1': 200, 'u2': 429})
+
+    with pytest.raises(Auth0UnknownError):
+        repo.remove_supplier_from_users_app_metadata('s1', ['u1', 'u2'])
+
+    assert saved_app_metadata(repo) == {'u1': {'suppliers': {}, 'memberships_version': 1}, 'u2': None, 'u3': None}
+
+
+def test_retiring_a_distributor_saves_the_other_profiles_when_one_is_missing(session, profiles, monkeypatch):
+    from data_common.exceptions import NoSuchEntity
+
+    session.app_metadata = {user_id: {'distributors': {'d1': 'user'}} for user_id in ('u1', 'u2', 'u3')}
+    repo = profiles(missing={'u2'})
+    monkeypatch.setattr(type(repo._auth0), 'update_app_metadata_many',
+                        lambda self, app_metadata_by_user: dict.fromkeys(app_metadata_by_user, 200))
+
+    with pytest.raises(NoSuchEntity):
+        repo.remove_distributor_from_users_app_metadata('d1', ['u1', 'u2', 'u3'])
+
+    retired = {'distributors': {}, 'memberships_version': 1}
+    assert saved_app_metadata(repo) == {'u1': retired, 'u3': retired}
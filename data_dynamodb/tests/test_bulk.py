@@ -0,0 +1,135 @@
+import pytest
+
+from data_common.constants import brand_attributes, merchandise_attributes
+from data_common.exceptions import BadParameters, CannotModifyEntityStates, MissingRequiredKey
+from data_dynamodb.exceptions import VersionConflict
+from repository import bulk  # the module LazyDynamoRepository loads
+
+
+@pytest.fixture
+def repo(build_repository):
+    repo = build_repository()
+    # DynamoBrandsRepository and DynamoMerchandiseRepository are not in this tree, list repo.brands instead
+    repo.brands = []
+    repo.get_all_brands = lambda supplier_id: [brand for brand in repo.brands if brand['supplier_id'] == supplier_id]
+    repo.get_all_merchandises = repo.get_all_brands
+    return repo
+
+
+def published(repo):
+    return [(name, [entity['name'] for entity in obj['entities']]) for name, obj in repo.published]
+
+
+def test_save_many_publishes_every_saved_object(repo):
+    saved = repo.save_many('brands', [{'name': 'a'}, {'name': 'b'}], {}, 'brands')
+
+    assert [(obj['name'], obj['user_id']) for obj in saved] == [('a', 'user'), ('b', 'user')]
+    assert published(repo) == [('brands', ['a', 'b'])]
+
+
+def test_save_many_splits_the_notification_over_the_sns_message_size(repo, monkeypatch):
+    # a saved brand is under 300 bytes of json, two fit
+    monkeypatch.setattr(bulk, 'SNS_BATCH_MAX_BYTES', 600)
+
+    repo.save_many('brands', [{'name': str(i) * 20} for i in range(5)], {}, 'brands')
+
+    assert [names for _, names in published(repo)] == [['0' * 20, '1' * 20], ['2' * 20, '3' * 20], ['4' * 20]]
+
+
+def test_save_many_logs_a_failed_notification(repo):
+    def sns_publish(name, obj):
+        raise RuntimeError('throttled')
+    repo.sns_publish = sns_publish
+
+    saved = repo.save_many('brands', [{'name': 'a'}], {}, 'brands')
+
+    assert [obj['name'] for obj in saved] == ['a']
+
+
+def test_save_many_publishes_what_was_written_before_a_conflict(repo):
+    read = dict(repo._storage.save('brands', {'name': 'b'}))
+    repo._storage.save('brands', dict(read, name='other writer'))
+
+    with pytest.raises(VersionConflict) as ex:
+        repo.save_many('brands', [{'name': 'a'}, dict(read), {'name': 'c'}], {}, 'brands')
+
+    assert ex.value.entity_ids == [read['entity_id']]
+    assert [(obj['name'], obj['user_id']) for obj in ex.value.saved] == [('a', 'user'), ('c', 'user')]
+    assert published(repo) == [('brands', ['a', 'c'])]
+
+
+PRODUCT = {'supplier_id': 'supplier', 'brand_id': 'b1', 'package_type_id': 'p1'}
+
+
+@pytest.mark.parametrize('obj', [
+    {'supplier_id': 'supplier', 'brand_id': 'b1'},
+    dict(PRODUCT, package_type_id=''),
+    dict(PRODUCT, brand_id=1),
+])
+def test_save_products_refuses_what_save_product_refuses(repo, dynamodb, obj):
+    with pytest.raises(Exception) as single:
+        repo.save_product(dict(obj))
+    with pytest.raises(Exception) as bulk:
+        repo.save_products([dict(PRODUCT), dict(obj)])
+
+    assert type(bulk.value) is type(single.value)
+    assert str(bulk.value) == str(single.value)
+    assert dynamodb.items == {}
+
+
+def test_save_products_saves_what_save_product_saves(repo):
+    single = repo.save_product(dict(PRODUCT))
+    (bulk,) = repo.save_products([dict(PRODUCT)])
+
+    ignored = {'entity_id', 'version', 'changed_on'}
+    assert {k: v for k, v in bulk.items() if k not in ignored} == \
+        {k: v for k, v in single.items() if k not in ignored}
+
+
+def test_save_products_refuses_an_entity_id_repeated(repo, dynamodb):
+    saved = repo.save_product(dict(PRODUCT))
+    dynamodb.calls = []
+
+    with pytest.raises(BadParameters):
+        repo.save_products([dict(saved, package_type_id='p2'), dict(saved, package_type_id='p3')])
+    assert dynamodb.calls == []
+
+
+BRAND = {'supplier_id': 'supplier', 'name': 'ipa', 'core_or_seasonal': 'core', 'is_active': True, 'has_logo': False}
+
+
+@pytest.mark.parametrize('key', sorted(brand_attributes))
+def test_save_brands_requires_every_brand_attribute(repo, dynamodb, key):
+    brand = dict(BRAND)
+    del brand[key]
+
+    with pytest.raises(MissingRequiredKey):
+        repo.save_brands([brand])
+    assert dynamodb.items == {}
+
+
+def test_save_brands_checks_the_brand_attribute_types(repo, dynamodb):
+    with pytest.raises(BadParameters):
+        repo.save_brands([dict(BRAND, is_active='yes')])
+    assert dynamodb.items == {}
+
+
+def test_save_merchandises_requires_every_merchandise_attribute(repo, dynamodb):
+    for key in merchandise_attributes:
+        with pytest.raises(MissingRequiredKey):
+            repo.save_merchandises([{k: v for k, v in BRAND.items() if k != key}])
+    assert dynamodb.items == {}
+
+
+def test_save_brands_keeps_names_unique_per_supplier(repo, dynamodb):
+    repo.brands = [{'supplier_id': 'supplier', 'name': 'ipa', 'entity_id': 'existing'}]
+
+    with pytest.raises(CannotModifyEntityStates):
+        repo.save_brands([dict(BRAND)])
+    with pytest.raises(CannotModifyEntityStates):
+        repo.save_brands([dict(BRAND, name='stout'), dict(BRAND, name='stout')])
+    assert dynamodb.items == {}
+
+    # renaming the brand that has the name, or the same name at another supplier
+    saved = repo.save_brands([dict(BRAND, entity_id='existing'), dict(BRAND, supplier_id='other')])
+    assert [brand['name'] for brand in saved] == ['ipa', 'ipa']
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+
+import pytest
+
+# services/common.py is deployed next to the handlers, with log_config and auth, see conftest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             'services'))
+
+import common  # noqa: E402
+
+CLAIM = 'https://api.brewoptix.com/app_metadata'
+
+
+class Repo:
+    def __init__(self, profile_app_metadata, auth0_app_metadata):
+        self.profile_app_metadata = profile_app_metadata
+        self.memberships_version = profile_app_metadata.get('memberships_version')
+        self.auth0_app_metadata = auth0_app_metadata
+        self.calls = []
+
+    def get_user_app_metadata(self):
+        self.calls.append('get_user_app_metadata')
+        return self.profile_app_metadata
+
+    def get_memberships_version(self):
+        self.calls.append('get_memberships_version')
+        return self.memberships_version
+
+    def get_auth0_app_metadata(self):
+        self.calls.append('get_auth0_app_metadata')
+        return self.auth0_app_metadata
+
+
+class Context:
+    user_id = 'user'
+
+    def __init__(self, claim, profile_app_metadata=None, auth0_app_metadata=None, age=0):
+        self.claims = {CLAIM: claim, 'iat': int(time.time()) - age}
+        self.repo = Repo(profile_app_metadata or {}, auth0_app_metadata or {})
+
+
+@pytest.fixture(autouse=True)
+def claim_mode(monkeypatch):
+    monkeypatch.setattr(common, 'AUTH0_APP_METADATA_CLAIM', CLAIM)
+    monkeypatch.setattr(common, '_memberships_refreshed', {})
+
+
+def test_claim_of_a_recent_token_is_trusted_without_any_read():
+    claim = {'v': 2, 'memberships_version': 3, 'suppliers': {'s1': 'admin'}}
+    context = Context(claim, profile_app_metadata={'memberships_version': 4, 'suppliers': {}})
+
+    assert common.get_claimed_app_metadata(context) == claim
+    assert context.repo.calls == []
+
+
+def test_claim_of_the_token_checked_by_check_auth_is_trusted(monkeypatch):
+    from jose import jwt
+
+    monkeypatch.setattr(common, 'AUTH0_CLIENT_PUBLIC_KEY', 'secret')
+    claim = {'v': 2, 'memberships_version': 3, 'suppliers': {'s1': 'admin'}}
+    token = jwt.encode({'sub': 'auth0|user', 'email': 'user@example.com', 'iat': int(time.time()), CLAIM: claim},
+                       'secret')
+
+    context = Context(None)
+    common.check_auth(lambda event, context: None)({'headers': {'Authorization': 'Bearer ' + token}}, context)
+
+    assert context.user_id == 'user'
+    assert common.get_claimed_app_metadata(context) == claim
+
+
+def test_claim_of_an_old_token_is_ignored():
+    claim = {'v': 2, 'memberships_version': 3, 'suppliers': {'s1': 'admin'}}
+    context = Context(claim, age=common.AUTH0_APP_METADATA_CLAIM_MAX_AGE + 1)
+
+    assert common.get_claimed_app_metadata(context) is None
+
+    del context.claims['iat']
+    assert common.get_claimed_app_metadata(context) is None
+
+
+def test_version_check_reads_the_memberships_version_alone(monkeypatch):
+    monkeypatch.setattr(common, 'AUTH0_APP_METADATA_CLAIM_CHECK_VERSION', True)
+    claim = {'v': 2, 'memberships_version': 3, 'suppliers': {'s1': 'admin'}}
+
+    context = Context(claim, profile_app_metadata={'memberships_version': 3, 'suppliers': {'s1': 'admin'}})
+    assert common.get_claimed_app_metadata(context) == claim
+    assert context.repo.calls == ['get_memberships_version']
+
+    # issued before the memberships changed
+    context = Context(claim, profile_app_metadata={'memberships_version': 4, 'suppliers': {}})
+    assert common.get_claimed_app_metadata(context) is None
+
+    # the version of the profile is unknown
+    context = Context(claim)
+    assert common.get_claimed_app_metadata(context) is None
+    assert 'get_user_app_metadata' not in context.repo.calls
+
+
+def test_claim_of_another_version_is_ignored():
+    context = Context({'v': 1, 'suppliers': {'s1': 'admin'}})
+
+    assert common.get_claimed_app_metadata(context) is None
+
+
+def test_claim_is_ignored_when_the_mode_is_off(monkeypatch):
+    monkeypatch.setattr(common, 'AUTH0_APP_METADATA_CLAIM', None)
+
+    assert common.get_claimed_app_metadata(Context({'v': 2, 'suppliers': {}})) is None
+
+
+def test_refresh_rereads_the_auth0_app_metadata_once_per_interval(monkeypatch):
+    def claimed_context():
+        context = Context({'v': 2, 'suppliers': {}}, auth0_app_metadata={'suppliers': {'s2': 'user'}})
+        common.set_memberships(context, common.get_claimed_app_metadata(context))
+        context.app_metadata_from_claims = True
+        return context
+
+    context = claimed_context()
+    assert common.refresh_memberships(context)
+    assert context.suppliers == {'s2': 'user'}
+    assert context.repo.calls == ['get_auth0_app_metadata']
+
+    # the memberships are read once per request
+    assert not common.refresh_memberships(context)
+
+    # and once per interval for a user
+    context = claimed_context()
+    assert not common.refresh_memberships(context)
+    assert 'get_auth0_app_metadata' not in context.repo.calls
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + common.MEMBERSHIPS_REFRESH_INTERVAL_SECONDS + 1)
+    assert common.refresh_memberships(context)
@@ -0,0 +1,46 @@
+import pytest
+from boto3.dynamodb.conditions import ConditionExpressionBuilder
+
+import extended_data_adapter
+from extended_data_adapter import INDEX_BACKFILL_SCRIPTS
+
+
+@pytest.fixture
+def repo(build_repository, monkeypatch):
+    monkeypatch.setattr(extended_data_adapter, '_index_backfill_pending', dict.fromkeys(INDEX_BACKFILL_SCRIPTS))
+
+    repo = build_repository()
+    repo._storage.save('counts', {'entity_id': 'count', 'supplier_id': 'supplier', 'count_date': 1565827200})
+    repo._storage.save('counts', {'entity_id': 'july', 'supplier_id': 'supplier', 'count_date': 1563148800})
+    return repo
+
+
+def queries(dynamodb):
+    return [query for name, query in dynamodb.calls if name == 'Table.query']
+
+
+def expression(condition, is_key_condition):
+    built = ConditionExpressionBuilder().build_expression(condition, is_key_condition=is_key_condition)
+    return built.condition_expression, sorted(built.attribute_name_placeholders.values())
+
+
+def test_count_date_range_queries_the_date_index_once_backfilled(repo, dynamodb):
+    dynamodb.deployments[INDEX_BACKFILL_SCRIPTS['by_latest_supplier_id_and_obj_type_date']] = 'test'
+
+    counts = repo.get_count_by_count_date_range('supplier', '2019-08-01', '2019-08-31')
+
+    assert [(count['entity_id'], count['count_date']) for count in counts] == [('count', '2019-08-15')]
+    (query,) = queries(dynamodb)
+    assert query['IndexName'] == 'by_latest_supplier_id_and_obj_type_date'
+    assert 'FilterExpression' not in query
+    assert expression(query['KeyConditionExpression'], True)[1] == ['latest_supplier_id', 'obj_type_date']
+
+
+def test_count_date_range_filters_the_supplier_counts_before_the_backfill(repo, dynamodb):
+    counts = repo.get_count_by_count_date_range('supplier', '2019-08-01')
+
+    assert [(count['entity_id'], count['count_date']) for count in counts] == [('count', '2019-08-15')]
+    (query,) = queries(dynamodb)
+    assert query['IndexName'] == 'by_supplier_id_and_obj_type'
+    assert expression(query['KeyConditionExpression'], True)[1] == ['obj_type', 'supplier_id']
+    assert expression(query['FilterExpression'], False)[1] == ['active', 'count_date', 'latest']
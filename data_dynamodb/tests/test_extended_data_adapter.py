@@ -0,0 +1,276 @@
+import time
+
+import pytest
+
+import extended_data_adapter
+from data_adapter import DynamoStorage
+from data_dynamodb.exceptions import VersionConflict
+from extended_data_adapter import ExtendedDynamoStorage, LATEST_POINTER, INDEX_BACKFILL_SCRIPTS
+
+
+@pytest.fixture
+def storage(dynamodb):
+    return ExtendedDynamoStorage('brewoptix-test', user_id='user')
+
+
+def test_batch_get_reads_latest_pointers_then_versions_100_per_call(storage, dynamodb):
+    entity_ids = [storage.save('suppliers', {'name': str(i)})['entity_id'] for i in range(250)]
+    dynamodb.calls = []
+
+    items = storage.batch_get(entity_ids + entity_ids[:1])
+
+    assert [item['name'] for item in items] == [str(i) for i in range(250)]
+    assert dynamodb.names() == ['batch_get_item'] * 6
+    assert {key['version']['S'] for key in dynamodb.calls[0][1]['brewoptix-test']['Keys']} == {LATEST_POINTER}
+
+
+def test_batch_get_returns_the_latest_version(storage, dynamodb):
+    saved = storage.save('suppliers', {'name': 'before'})
+    first_version = saved['version']
+    saved['name'] = 'after'
+    storage.save('suppliers', saved)
+
+    (item,) = storage.batch_get([saved['entity_id']])
+
+    assert item['name'] == 'after'
+    assert item['previous_version'] == first_version
+    assert dynamodb.get(saved['entity_id'], LATEST_POINTER) == {
+        'entity_id': saved['entity_id'],
+        'version': LATEST_POINTER,
+        'latest_version': item['version'],
+    }
+
+
+def test_batch_get_retries_unprocessed_keys(storage, dynamodb, monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    entity_ids = [storage.save('suppliers', {})['entity_id'] for _ in range(3)]
+    dynamodb.calls = []
+    dynamodb.unprocessed = 2
+
+    items = storage.batch_get(entity_ids)
+
+    assert [item['entity_id'] for item in items] == entity_ids
+    assert dynamodb.names() == ['batch_get_item', 'batch_get_item', 'batch_get_item']
+    assert len(dynamodb.calls[1][1]['brewoptix-test']['Keys']) == 2
+
+
+def test_batch_get_queries_entities_without_pointer(storage, dynamodb):
+    new_id = storage.save('suppliers', {})['entity_id']
+    dynamodb.put(entity_id='old', version='v2', latest=True, name='old')
+    dynamodb.put(entity_id='old', version='v1', latest=False, name='older')
+    dynamodb.calls = []
+
+    items = storage.batch_get(['old', 'unknown', new_id])
+
+    assert [item['entity_id'] for item in items] == ['old', new_id]
+    assert items[0]['name'] == 'old'
+    assert dynamodb.names() == ['batch_get_item', 'batch_get_item', 'query', 'query']
+
+
+def test_scan_items_reads_every_segment(storage, dynamodb):
+    for i in range(10):
+        dynamodb.put(entity_id='e{N}'.format(N=i), version='1', latest=True, n=i)
+
+    items = list(storage.scan_items(total_segments=3))
+
+    assert sorted(item['n'] for item in items) == list(range(10))
+    assert {call['Segment'] for name, call in dynamodb.calls if name == 'scan'} == {0, 1, 2}
+    assert dynamodb.names().count('scan') == 10
+
+
+def test_get_never_returns_the_latest_pointer(storage, dynamodb, monkeypatch):
+    saved = storage.save('suppliers', {'name': 'a'})
+    # a read of the base adapter that would find the pointer, e.g. the last item of the entity's key
+    monkeypatch.setattr(DynamoStorage, 'get', lambda self, entity_id: dynamodb.get(entity_id, LATEST_POINTER),
+                        raising=False)
+
+    assert storage.get(saved['entity_id'])['name'] == 'a'
+
+
+def test_get_items_drops_the_latest_pointers(storage, dynamodb, monkeypatch):
+    saved = storage.save('suppliers', {'name': 'a'})
+    items = [dynamodb.get(saved['entity_id'], saved['version']), dynamodb.get(saved['entity_id'], LATEST_POINTER)]
+    monkeypatch.setattr(DynamoStorage, 'get_items', lambda self, query: {'Items': list(items), 'Count': 2},
+                        raising=False)
+
+    resp = storage.get_items({})
+
+    assert [item['version'] for item in resp['Items']] == [saved['version']]
+    assert resp['Count'] == 1
+
+
+def test_scan_items_drops_the_latest_pointers(storage, dynamodb):
+    saved = storage.save('suppliers', {'name': 'a'})
+
+    assert [item['version'] for item in storage.scan_items()] == [saved['version']]
+
+
+def test_save_many_refuses_an_entity_id_repeated(storage, dynamodb):
+    saved = storage.save('suppliers', {'name': 'a'})
+    dynamodb.calls = []
+
+    with pytest.raises(ValueError):
+        storage.save_many('suppliers', [dict(saved, name='b'), dict(saved, name='c')])
+    assert dynamodb.calls == []
+
+
+def test_latest_supplier_query_keeps_to_the_previous_query_until_the_backfill_is_recorded(storage, dynamodb,
+                                                                                          monkeypatch):
+    pending = dict.fromkeys(INDEX_BACKFILL_SCRIPTS)
+    monkeypatch.setattr(extended_data_adapter, '_index_backfill_pending', pending)
+
+    query = storage.latest_supplier_query('supplier', 'products')
+    assert query['IndexName'] == 'by_supplier_id_and_obj_type'
+    assert 'FilterExpression' in query
+
+    # recorded for another stage, then for this one but not looked up again before the delay
+    dynamodb.deployments[54] = 'prod'
+    pending['by_latest_supplier_id_and_obj_type'] = None
+    assert storage.latest_supplier_query('supplier', 'products')['IndexName'] == 'by_supplier_id_and_obj_type'
+    dynamodb.deployments[54] = 'test'
+    assert storage.latest_supplier_query('supplier', 'products')['IndexName'] == 'by_supplier_id_and_obj_type'
+    assert dynamodb.names() == ['get_item', 'get_item']
+
+    pending['by_latest_supplier_id_and_obj_type'] = time.monotonic() - 301
+    for _ in range(2):
+        query = storage.latest_supplier_query('supplier', 'products')
+        assert query['IndexName'] == 'by_latest_supplier_id_and_obj_type'
+        assert 'FilterExpression' not in query
+    assert dynamodb.names() == ['get_item'] * 3
+
+
+def test_memberships_version_is_read_from_the_latest_pointer_alone(storage, dynamodb):
+    storage.save('users', {'entity_id': 'user', 'app_metadata': {'memberships_version': 3}})
+    storage.save('users', {'entity_id': 'other', 'app_metadata': {}})
+    dynamodb.calls = []
+
+    assert storage.get_memberships_version('user') == 3
+    assert dynamodb.calls == [('get_item', {'entity_id': {'S': 'user'}, 'version': {'S': LATEST_POINTER}})]
+
+    assert storage.get_memberships_version('other') is None
+    assert storage.get_memberships_version('unknown') is None
+
+
+def test_save_supersedes_the_version_it_was_read_from(storage, dynamodb):
+    created = dict(storage.save('products', {'supplier_id': 'supplier', 'name': 'ipa'}))
+    dynamodb.calls = []
+
+    updated = storage.save('products', dict(created, name='neipa'))
+
+    assert dynamodb.names() == ['transact_write_items']
+    assert updated['previous_version'] == created['version']
+    assert sorted(updated) == sorted(set(created) | {'previous_version'})
+
+    superseded = dynamodb.get(created['entity_id'], created['version'])
+    assert superseded['latest'] is False
+    assert 'latest_supplier_id' not in superseded
+    assert dynamodb.get(updated['entity_id'], updated['version'])['latest_supplier_id'] == 'supplier'
+
+
+def test_save_of_a_superseded_version_conflicts(storage, dynamodb):
+    created = dict(storage.save('products', {'name': 'ipa'}))
+    storage.save('products', dict(created, name='first writer'))
+    items = dict(dynamodb.items)
+
+    with pytest.raises(VersionConflict) as ex:
+        storage.save('products', dict(created, name='second writer'))
+
+    assert ex.value.entity_ids == [created['entity_id']]
+    assert dynamodb.items == items
+    (item,) = storage.batch_get([created['entity_id']])
+    assert item['name'] == 'first writer'
+
+
+def test_save_without_version_supersedes_the_latest_version(storage, dynamodb):
+    created = dict(storage.save('products', {'name': 'ipa'}))
+
+    updated = storage.save('products', {'entity_id': created['entity_id'], 'name': 'neipa'})
+
+    assert updated['previous_version'] == created['version']
+    assert dynamodb.get(created['entity_id'], created['version'])['latest'] is False
+    (item,) = storage.batch_get([created['entity_id']])
+    assert item['name'] == 'neipa'
+
+
+def test_save_without_version_looks_the_latest_version_up_again_after_a_conflict(storage, dynamodb,
+                                                                                  monkeypatch):
+    created = dict(storage.save('products', {'name': 'ipa'}))
+    storage.save('products', dict(created, name='other writer'))
+
+    # the first lookup races with the other writer
+    lookups = [{created['entity_id']: created['version']}]
+    latest_versions = storage._latest_versions
+    monkeypatch.setattr(storage, '_latest_versions',
+                        lambda entity_ids: lookups.pop() if lookups else latest_versions(entity_ids))
+
+    updated = storage.save('products', {'entity_id': created['entity_id'], 'name': 'mine'})
+
+    (item,) = storage.batch_get([created['entity_id']])
+    assert item['name'] == 'mine'
+    assert item['version'] == updated['version']
+
+
+def test_save_without_version_of_an_unknown_entity_creates_it(storage, dynamodb):
+    saved = storage.save('products', {'entity_id': 'product', 'name': 'ipa'})
+
+    assert 'previous_version' not in saved
+    (item,) = storage.batch_get(['product'])
+    assert item['name'] == 'ipa'
+
+
+def test_save_new_with_entity_id_conflicts_with_an_existing_entity(storage, dynamodb):
+    saved = storage.save('users', {'entity_id': 'user', 'email': 'a@example.com'}, new=True)
+    assert 'previous_version' not in saved
+
+    with pytest.raises(VersionConflict):
+        storage.save('users', {'entity_id': 'user', 'email': 'b@example.com'}, new=True)
+
+    (item,) = storage.batch_get(['user'])
+    assert item['email'] == 'a@example.com'
+
+
+def test_save_many_writes_like_save(storage, dynamodb):
+    existing = dict(storage.save('brands', {'supplier_id': 'supplier', 'name': 'existing'}))
+    dynamodb.calls = []
+
+    objs = [{'supplier_id': 'supplier', 'name': str(i)} for i in range(19)] + [dict(existing, name='renamed')]
+    saved = storage.save_many('brands', objs)
+
+    assert dynamodb.names() == ['transact_write_items'] * 3
+    assert [obj['name'] for obj in saved] == [str(i) for i in range(19)] + ['renamed']
+    assert sorted(saved[0]) == sorted(existing)
+    assert saved[-1]['previous_version'] == existing['version']
+
+    items = storage.batch_get(obj['entity_id'] for obj in saved)
+    assert [item['version'] for item in items] == [obj['version'] for obj in saved]
+    assert all(item['latest_supplier_id'] == 'supplier' for item in items)
+
+
+def test_save_many_looks_up_the_objects_without_version_in_one_batch(storage, dynamodb):
+    existing = [dict(storage.save('brands', {'name': str(i)})) for i in range(3)]
+    dynamodb.calls = []
+
+    saved = storage.save_many('brands', [{'entity_id': obj['entity_id'], 'name': 'renamed'} for obj in existing])
+
+    assert dynamodb.names() == ['batch_get_item', 'batch_get_item', 'transact_write_items']
+    assert [obj['previous_version'] for obj in saved] == [obj['version'] for obj in existing]
+
+
+def test_save_many_writes_the_chunks_without_conflict(storage, dynamodb):
+    stale = dict(storage.save('brands', {'name': 'stale'}))
+    storage.save('brands', dict(stale, name='other writer'))
+    dynamodb.calls = []
+
+    objs = [{'name': str(i)} for i in range(8)] + [dict(stale, name='mine')] + [{'name': str(i)} for i in range(8, 16)]
+    with pytest.raises(VersionConflict) as ex:
+        storage.save_many('brands', objs)
+
+    assert ex.value.entity_ids == [stale['entity_id']]
+    # the other objects of the cancelled transaction are written again without it
+    assert [obj['name'] for obj in ex.value.saved] == [str(i) for i in range(16)]
+    assert dynamodb.names() == ['transact_write_items'] * 4
+
+    saved_ids = [obj['entity_id'] for obj in ex.value.saved]
+    assert [item['entity_id'] for item in storage.batch_get(saved_ids)] == saved_ids
+    (item,) = storage.batch_get([stale['entity_id']])
+    assert item['name'] == 'other writer'
@@ -0,0 +1,117 @@
+import types
+
+import boto3
+import pytest
+
+from data_dynamodb import clients, lazy_repository
+from data_dynamodb.lazy_repository import LazyDynamoRepository
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Modules imported by implementation(), the classes loaded start out empty"""
+    monkeypatch.setattr(LazyDynamoRepository, '_loaded', [])
+    monkeypatch.setattr(lazy_repository, '_composed', {})
+
+    loads = []
+    load = lazy_repository._load
+
+    def recording_load(module_name, class_name):
+        loads.append(module_name)
+        return load(module_name, class_name)
+
+    monkeypatch.setattr(lazy_repository, '_load', recording_load)
+    return loads
+
+
+def repository():
+    return LazyDynamoRepository(region_name='us-east-1', table='brewoptix-test', user_id='user')
+
+
+def test_method_imports_the_sub_repository_declaring_it(loads):
+    repo = repository()
+
+    assert repo.get_user_app_metadata.__func__.__qualname__ == 'DynamoProfileRepository.get_user_app_metadata'
+    assert loads == ['repository.profile']
+    assert type(repo).__name__ == 'LazyDynamoRepository'
+    assert isinstance(repo, LazyDynamoRepository)
+
+
+def test_loaded_sub_repositories_are_kept_by_later_instances(loads):
+    repository().get_user_app_metadata
+    repository().requeue_projections
+
+    repo = repository()
+    assert [cls.__name__ for cls in type(repo).__bases__] == \
+        ['DynamoProfileRepository', 'DynamoOnHandRepository', 'LazyDynamoRepository']
+
+    repo.get_or_create_profile
+    assert loads == ['repository.profile', 'repository.on_hand']
+
+
+def test_composed_classes_are_reused(loads):
+    first = repository()
+    first.get_user_app_metadata
+    second = repository()
+
+    assert type(first) is type(second)
+
+
+def test_helper_no_interface_declares_is_found_in_the_sub_repositories(loads, monkeypatch):
+    monkeypatch.setattr(lazy_repository, 'IMPLEMENTATIONS', [
+        implementation for implementation in lazy_repository.IMPLEMENTATIONS
+        if implementation[1] in ('repository.profile', 'repository.on_hand', 'repository.bulk')])
+    repo = repository()
+
+    # a public helper of DynamoBulkRepository, not on BulkRepository
+    assert repo.sns_publish_many.__func__.__qualname__ == 'DynamoBulkRepository.sns_publish_many'
+    assert loads == ['repository.profile', 'repository.on_hand', 'repository.bulk']
+
+
+def test_unknown_method_raises_attribute_error(loads, monkeypatch):
+    monkeypatch.setattr(lazy_repository, 'IMPLEMENTATIONS', [
+        implementation for implementation in lazy_repository.IMPLEMENTATIONS
+        if implementation[1] == 'repository.profile'])
+    repo = repository()
+
+    with pytest.raises(AttributeError):
+        repo.not_a_repository_method
+    assert type(repo) is LazyDynamoRepository
+
+
+def test_private_name_raises_attribute_error_without_importing(loads):
+    repo = repository()
+
+    assert not hasattr(repo, '_not_private')
+    assert loads == []
+
+
+def test_storages_of_a_later_repository_build_no_boto3_client(monkeypatch):
+    monkeypatch.setattr(clients, '_clients', {})
+    monkeypatch.setattr(clients, '_resources', {})
+
+    built = []
+
+    def client(service, **kwargs):
+        built.append(('client', service, kwargs))
+        return object()
+
+    def resource(service, **kwargs):
+        built.append(('resource', service, kwargs))
+        return types.SimpleNamespace(Table=lambda name: name)
+
+    monkeypatch.setattr(boto3, 'client', client)
+    monkeypatch.setattr(boto3, 'resource', resource)
+
+    repo = repository()
+    repo._storage, repo._aurora_storage
+    assert sorted(built) == [
+        ('client', 'dynamodb', {'region_name': 'us-east-1'}),
+        ('client', 'rds-data', {'region_name': 'us-east-1'}),
+        ('resource', 'dynamodb', {'region_name': 'us-east-1'}),
+    ]
+
+    built.clear()
+    repo = repository()
+    repo._storage, repo._aurora_storage
+    assert built == []
@@ -0,0 +1,73 @@
+import functools
+
+import pytest
+
+from extended_aurora_adapter import ExtendedAuroraStorage
+
+
+KEY = ('brand_id', 'package_type_id', 'created_on', 'actual')
+
+
+class FakeAuroraStorage(ExtendedAuroraStorage):
+    """Keyset pages of on_hand.details_page and on_hand.details_page_after over a list of rows"""
+    def __init__(self, db_arn, db_secret_arn, db_name, region_name=None, rows=()):
+        super().__init__(db_arn, db_secret_arn, db_name, region_name=region_name)
+        self.rows = sorted(rows, key=lambda row: tuple(row[key] for key in KEY))
+        self.names = []
+
+    @property
+    def pages(self):
+        return len(self.names)
+
+    def get_rows_named(self, name, parameters=None, transaction_id=None):
+        self.names.append(name)
+
+        rows = self.rows
+        if name == 'on_hand.details_page_after':
+            after = tuple(parameters['after_' + key] for key in KEY)
+            rows = [row for row in rows if tuple(row[key] for key in KEY) > after]
+
+        return [dict(row) for row in rows[:parameters['count']]]
+
+
+def on_hand_rows():
+    return [{
+        'brand_id': brand_id,
+        'package_type_id': 'p',
+        'created_on': '2019-08-0{D}'.format(D=day),
+        'actual': actual,
+        'quantity': day,
+    } for brand_id in ('b1', 'b2') for day in (1, 2, 3) for actual in (False, True)]
+
+
+@pytest.fixture
+def repo(build_repository):
+    return build_repository(aurora_storage=functools.partial(FakeAuroraStorage, rows=on_hand_rows()))
+
+
+def test_iter_details_reads_every_row_page_by_page(repo):
+    storage = repo._aurora_storage
+
+    details = repo.iter_details_by_date_range('supplier', '2019-08-01', '2019-08-03', page_size=5)
+    first = next(details)
+
+    assert storage.pages == 1
+    assert first['brand_id'] == 'b1' and first['created_on'] == '2019-08-01'
+
+    rest = list(details)
+    assert len(rest) == 11
+    assert storage.names == ['on_hand.details_page', 'on_hand.details_page_after', 'on_hand.details_page_after']
+    assert all(row['actual'] is False for row in [first] + rest)
+
+
+def test_details_page_cursor_resumes_after_the_last_row(repo):
+    rows, cursor = repo.get_details_page('supplier', '2019-08-01', '2019-08-03', page_size=3)
+    assert cursor == {'brand_id': 'b1', 'package_type_id': 'p', 'created_on': '2019-08-02', 'actual': False}
+
+    rows, cursor = repo.get_details_page('supplier', '2019-08-01', '2019-08-03', after=cursor, page_size=3)
+    assert [(row['created_on'], row['quantity']) for row in rows] == \
+        [('2019-08-02', 2), ('2019-08-03', 3), ('2019-08-03', 3)]
+
+    rows, cursor = repo.get_details_page('supplier', '2019-08-01', '2019-08-03', after=cursor, page_size=100)
+    assert len(rows) == 6
+    assert cursor is None
@@ -0,0 +1,228 @@
+from contextlib import contextmanager
+import datetime
+import functools
+
+import pytest
+
+from data_common.exceptions import AquireProjectionLockError
+from extended_aurora_adapter import ExtendedAuroraStorage
+from repository import on_hand  # the module LazyDynamoRepository loads
+
+
+COLUMNS = ['source', 'brand_id', 'package_type_id', 'day', 'quantity', 'actual']
+
+
+class FakeAuroraStorage(ExtendedAuroraStorage):
+    """Answers the named statements of the projections, records every round trip"""
+    def __init__(self, db_arn, db_secret_arn, db_name, region_name=None, rows=(), busy=(), tokens=None):
+        super().__init__(db_arn, db_secret_arn, db_name, region_name=region_name)
+        self.rows = list(rows)
+        self.busy = set(busy)
+        self.tokens = tokens or {}
+        self.calls = []
+        # names of the statements run within a transaction
+        self.transacted = []
+        self.fail_on = None
+
+    def _call(self, name, parameters, transaction_id):
+        self.calls.append((name, parameters))
+        if transaction_id:
+            self.transacted.append(name)
+        if name == self.fail_on:
+            raise RuntimeError(name)
+
+    def batch_execute_named(self, name, parameter_sets, transaction_id=None):
+        if not parameter_sets:
+            return None
+        self._call(name, parameter_sets, transaction_id)
+        return {'updateResults': []}
+
+    def execute_named(self, name, parameters=None, transaction_id=None):
+        self._call(name, parameters, transaction_id)
+        return {}
+
+    @contextmanager
+    def transaction(self):
+        self.calls.append(('begin_transaction', None))
+        try:
+            yield 'transaction'
+        except Exception:
+            self.calls.append(('rollback_transaction', None))
+            raise
+        self.calls.append(('commit_transaction', None))
+
+    def get_columns_named(self, name, parameters=None, transaction_id=None, as_numpy=False):
+        self.calls.append((name, dict(parameters)))
+
+        skus = [tuple(sku.split(':')) for sku in parameters['skus'].split(',')]
+        rows = [row for row in self.rows if (row[1], row[2]) in skus]
+        rows += [('lease', brand_id, package_type_id, parameters['start_date_minus_one'],
+                  self.tokens.get((brand_id, package_type_id), 1), False)
+                 for brand_id, package_type_id in skus if (brand_id, package_type_id) not in self.busy]
+
+        rows.sort(key=self._key)
+        if name == 'projections.sources_after':
+            after = (parameters['after_brand_id'], parameters['after_package_type_id'], parameters['after_source'],
+                     parameters['after_day'], parameters['after_actual'])
+            rows = [row for row in rows if self._key(row) > after]
+        rows = rows[:parameters['count']]
+
+        return {column: [row[i] for row in rows] for i, column in enumerate(COLUMNS)}
+
+    @staticmethod
+    def _key(row):
+        source, brand_id, package_type_id, day, quantity, actual = row
+        return brand_id, package_type_id, source, day, actual
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+
+def today(days=0):
+    return (datetime.date.today() + datetime.timedelta(days=days)).isoformat()
+
+
+@pytest.fixture
+def repository(build_repository, monkeypatch):
+    """Factory of repositories over a FakeAuroraStorage of the rows, busy SKUs and lease tokens given"""
+    monkeypatch.setenv('PROJECTIONS_CUTOFF_DELTA_DAYS', '2')
+
+    def build(**aurora_storage):
+        return build_repository(aurora_storage=functools.partial(FakeAuroraStorage, **aurora_storage))
+
+    return build
+
+
+def test_recompute_round_trips(repository):
+    repo = repository(rows=[('production', 'b1', 'p1', today(-1), 5, False)], tokens={('b1', 'p1'): 7})
+    storage = repo._aurora_storage
+
+    repo.process_projections_queue('supplier', 'b1', 'p1', today(-2), 'request')
+
+    assert storage.names() == ['projections.acquire_lease', 'projections.sources', 'begin_transaction',
+                               'projections.upsert_theoretical', 'projections.release_leases',
+                               'commit_transaction']
+    assert storage.transacted == ['projections.upsert_theoretical', 'projections.release_leases']
+
+    upserts = storage.calls[3][1]
+    assert [(row['created_on'], row['quantity']) for row in upserts] == \
+        [(today(-2), 0), (today(-1), 5), (today(0), 5), (today(1), 5)]
+    assert all(row['request_id'] == 'request' and row['fencing_token'] == 7 for row in upserts)
+
+    assert storage.calls[1][1]['skus'] == 'b1:p1'
+    assert storage.calls[1][1]['count'] == on_hand.PROJECTION_SOURCES_MAX_ROWS
+    assert [obj['brand_id'] for name, obj in repo.published] == ['b1']
+
+
+def test_recompute_deletes_theoretical_rows_replaced_by_a_count(repository):
+    repo = repository(rows=[
+        ('on_hand', 'b1', 'p1', today(-1), 10, True),
+        ('on_hand', 'b1', 'p1', today(-1), 4, False),
+    ], tokens={('b1', 'p1'): 3})
+    storage = repo._aurora_storage
+
+    repo.process_projections_queue('supplier', 'b1', 'p1', today(-1), 'request')
+
+    assert storage.names() == ['projections.acquire_lease', 'projections.sources', 'begin_transaction',
+                               'projections.delete_theoretical', 'projections.upsert_theoretical',
+                               'projections.release_leases', 'commit_transaction']
+    assert storage.transacted == ['projections.delete_theoretical', 'projections.upsert_theoretical',
+                                  'projections.release_leases']
+    assert storage.calls[3][1] == [{
+        'supplier_id': 'supplier',
+        'brand_id': 'b1',
+        'package_type_id': 'p1',
+        'created_on': today(-1),
+        'request_id': 'request',
+        'fencing_token': 3,
+    }]
+
+
+def test_busy_lease_projects_the_others_and_returns_the_busy_ones(repository):
+    repo = repository(busy=[('b2', 'p2')])
+    storage = repo._aurora_storage
+
+    busy = repo.process_supplier_projections_queue('supplier', today(-1), 'request', products=[
+        {'brand_id': 'b1', 'package_type_id': 'p1'},
+        {'brand_id': 'b2', 'package_type_id': 'p2'},
+    ])
+
+    assert busy == [{'brand_id': 'b2', 'package_type_id': 'p2'}]
+    assert storage.names() == ['projections.acquire_lease', 'projections.sources', 'begin_transaction',
+                               'projections.upsert_theoretical', 'projections.release_leases',
+                               'commit_transaction']
+    assert {row['brand_id'] for row in storage.calls[3][1]} == {'b1'}
+    assert storage.calls[4][1] == {'request_id': 'request'}
+    assert [obj['brand_id'] for name, obj in repo.published] == ['b1']
+
+
+def test_busy_lease_of_a_single_product_writes_nothing(repository):
+    repo = repository(busy=[('b1', 'p1')])
+    storage = repo._aurora_storage
+
+    with pytest.raises(AquireProjectionLockError):
+        repo.process_projections_queue('supplier', 'b1', 'p1', today(-1), 'request')
+
+    assert storage.names() == ['projections.acquire_lease', 'projections.sources', 'projections.release_leases']
+    assert storage.transacted == []
+    assert repo.published == []
+
+
+def test_failed_write_rolls_back_and_releases_the_leases(repository):
+    repo = repository(rows=[('production', 'b1', 'p1', today(-1), 5, False)])
+    storage = repo._aurora_storage
+    storage.fail_on = 'projections.upsert_theoretical'
+
+    with pytest.raises(RuntimeError):
+        repo.process_projections_queue('supplier', 'b1', 'p1', today(-1), 'request')
+
+    assert storage.names()[-3:] == ['projections.upsert_theoretical', 'rollback_transaction',
+                                    'projections.release_leases']
+    assert storage.transacted == ['projections.upsert_theoretical']
+    assert repo.published == []
+
+
+def test_leases_are_taken_before_the_sources_are_read(repository):
+    repo = repository()
+    storage = repo._aurora_storage
+
+    repo.process_supplier_projections_queue('supplier', today(-1), 'request', products=[
+        {'brand_id': 'b1', 'package_type_id': 'p1'},
+        {'brand_id': 'b2', 'package_type_id': 'p2'},
+    ])
+
+    name, leases = storage.calls[0]
+    assert name == 'projections.acquire_lease'
+    assert [(lease['brand_id'], lease['package_type_id']) for lease in leases] == [('b1', 'p1'), ('b2', 'p2')]
+    assert all(lease['request_id'] == 'request' for lease in leases)
+    assert storage.calls[1][1]['timestamp'] == leases[0]['timestamp']
+
+
+def test_supplier_recompute_reads_the_sources_of_every_product_at_once(repository):
+    repo = repository(rows=[('sales', 'b{N}'.format(N=n), 'p', today(-1), 1, False) for n in range(50)])
+    storage = repo._aurora_storage
+
+    products = [{'brand_id': 'b{N}'.format(N=n), 'package_type_id': 'p'} for n in range(50)]
+    repo.process_supplier_projections_queue('supplier', today(-1), 'request', products=products)
+
+    assert [name for name in storage.names() if name.startswith('projections.sources')] == ['projections.sources']
+
+
+def test_supplier_recompute_pages_through_the_sources(repository, monkeypatch):
+    monkeypatch.setattr(on_hand, 'PROJECTION_SOURCES_MAX_ROWS', 4)
+    repo = repository(rows=[('production', 'b{N}'.format(N=n), 'p', today(-1), n, False) for n in range(5)])
+    storage = repo._aurora_storage
+
+    products = [{'brand_id': 'b{N}'.format(N=n), 'package_type_id': 'p'} for n in range(5)]
+    repo.process_supplier_projections_queue('supplier', today(-1), 'request', products=products)
+
+    # 5 production and 5 lease rows
+    reads = [(name, parameters) for name, parameters in storage.calls if name.startswith('projections.sources')]
+    assert [name for name, _ in reads] == ['projections.sources', 'projections.sources_after',
+                                           'projections.sources_after']
+    assert reads[1][1]['after_brand_id'] == 'b1' and reads[1][1]['after_source'] == 'production'
+    assert all(parameters['skus'] == 'b0:p,b1:p,b2:p,b3:p,b4:p' for _, parameters in reads)
+
+    upserts = [row for name, rows in storage.calls if name == 'projections.upsert_theoretical' for row in rows]
+    assert {(row['brand_id'], row['quantity']) for row in upserts if row['created_on'] == today(-1)} == \
+        {('b{N}'.format(N=n), n) for n in range(5)}
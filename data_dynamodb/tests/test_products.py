@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+import pytest
+
+# the handlers import common and api_utils from services/, see conftest for log_config and auth
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             'services'))
+
+
+class Context:
+    user_id = 'user'
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.suppliers = {'supplier': 'admin'}
+        self.distributors = {}
+
+
+@pytest.fixture
+def handler():
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                 'services', 'products'))
+    import handler
+    return handler
+
+
+@pytest.fixture
+def context(build_repository):
+    return Context(build_repository())
+
+
+def check_supplier(decorated):
+    """The handler under check_supplier, past check_auth and insert_repo"""
+    return decorated.__wrapped__.__wrapped__
+
+
+def test_modify_product_with_a_body_without_version(handler, context, dynamodb):
+    created = context.repo.save_product({'supplier_id': 'supplier', 'brand_id': 'b1', 'package_type_id': 'p1'})
+
+    resp = check_supplier(handler.modify_product)({
+        'headers': {'x-supplier-id': 'supplier'},
+        'body': json.dumps({'entity_id': created['entity_id'], 'brand_id': 'b2', 'package_type_id': 'p1'}),
+    }, context)
+
+    assert resp['statusCode'] == 200
+    body = json.loads(resp['body'])
+    assert body['brand_id'] == 'b2'
+    assert body['previous_version'] == created['version']
+    assert dynamodb.get(created['entity_id'], created['version'])['latest'] is False
@@ -0,0 +1,92 @@
+import datetime
+import random
+
+import numpy as np
+
+from data_dynamodb.projections import date_range, to_dense, running_balance
+
+
+def previous_loop(start_date, end_date, production, sales, adjustments, on_hands_actual, on_hands_theoretical):
+    """The per-day loop DynamoOnHandRepository used before projections.running_balance()"""
+    on_hands_theoretical = dict(on_hands_theoretical)
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+
+    balances = {}
+    current = start
+    while current < end:
+        current_date = current.isoformat()
+        previous_date = (current - datetime.timedelta(days=1)).isoformat()
+
+        if previous_date in on_hands_actual:
+            start_quantity = on_hands_actual[previous_date]
+        elif previous_date in on_hands_theoretical:
+            start_quantity = on_hands_theoretical[previous_date]
+        else:
+            start_quantity = 0
+
+        quantity = (start_quantity + production.get(current_date, 0) - sales.get(current_date, 0)
+                    + adjustments.get(current_date, 0))
+
+        if current_date not in on_hands_actual:
+            balances[current_date] = quantity
+            on_hands_theoretical[current_date] = quantity
+
+        current += datetime.timedelta(days=1)
+
+    return balances
+
+
+def kernel(start_date, end_date, production, sales, adjustments, on_hands_actual, on_hands_theoretical):
+    """Same computation as DynamoOnHandRepository.process_projections()"""
+    days = date_range(start_date, end_date)
+    previous_date = str(np.datetime64(start_date, 'D') - 1)
+    opening = on_hands_actual.get(previous_date, on_hands_theoretical.get(previous_date, 0))
+
+    produced, _ = to_dense(production, days)
+    sold, _ = to_dense(sales, days)
+    adjusted, _ = to_dense(adjustments, days)
+    actual, has_actual = to_dense(on_hands_actual, days)
+
+    balances = running_balance(opening, actual, has_actual, produced - sold + adjusted)[0]
+
+    return {day: quantity
+            for day, quantity, is_actual in zip(np.datetime_as_string(days).tolist(),
+                                                balances.tolist(),
+                                                has_actual.tolist())
+            if not is_actual}
+
+
+def random_series(rng, start, n_days, density):
+    return {(start + datetime.timedelta(days=offset)).isoformat(): rng.randint(-50, 200)
+            for offset in range(-1, n_days) if rng.random() < density}
+
+
+def test_running_balance_matches_previous_loop():
+    rng = random.Random(42)
+
+    for _ in range(200):
+        start = datetime.date(2019, 1, 1) + datetime.timedelta(days=rng.randint(0, 365))
+        n_days = rng.randint(0, 60)
+        end = start + datetime.timedelta(days=n_days)
+
+        series = [random_series(rng, start, n_days, rng.random()) for _ in range(5)]
+        args = (start.isoformat(), end.isoformat()) + tuple(series)
+
+        assert kernel(*args) == previous_loop(*args)
+
+
+def test_running_balance_restarts_after_actual_count():
+    delta = [[1, 1, 1, 1]]
+    actual = [[0, 10, 0, 0]]
+    has_actual = [[False, True, False, False]]
+
+    assert running_balance(5, actual, has_actual, delta).tolist() == [[6, 7, 11, 12]]
+
+
+def test_running_balance_several_skus():
+    delta = [[1, 2, 3], [-1, -1, -1]]
+    actual = [[0, 0, 0], [0, 0, 0]]
+    has_actual = [[False, False, False], [False, False, False]]
+
+    assert running_balance([0, 10], actual, has_actual, delta).tolist() == [[1, 3, 6], [9, 8, 7]]
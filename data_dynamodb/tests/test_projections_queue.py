@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from data_dynamodb import clients
+from data_dynamodb.projections_queue import coalesce, group_request_id
+
+
+def record(**obj):
+    obj.setdefault('user_id', 'user')
+    obj.setdefault('supplier_id', 'supplier')
+    return {'body': json.dumps(obj)}
+
+
+def product(brand_id, package_type_id, start_date, **obj):
+    return record(brand_id=brand_id, package_type_id=package_type_id, start_date=start_date, **obj)
+
+
+def test_coalesce_keeps_earliest_start_date_per_product():
+    supplier_projections, projections = coalesce([
+        product('b1', 'p1', '2019-08-10'),
+        product('b1', 'p1', '2019-08-02', lock_attempts=2),
+        product('b1', 'p1', '2019-08-05', full_rewrite=True),
+        product('b2', 'p1', '2019-08-07'),
+    ])
+
+    assert supplier_projections == {}
+    assert sorted(projections) == [('supplier', 'b1', 'p1'), ('supplier', 'b2', 'p1')]
+
+    projection = projections[('supplier', 'b1', 'p1')]
+    assert projection['start_date'] == '2019-08-02'
+    assert projection['full_rewrite'] is True
+    assert projection['lock_attempts'] == 2
+    assert projections[('supplier', 'b2', 'p1')]['start_date'] == '2019-08-07'
+
+
+def test_coalesce_keeps_products_of_separate_suppliers_apart():
+    supplier_projections, projections = coalesce([
+        product('b1', 'p1', '2019-08-10', supplier_id='s1'),
+        product('b1', 'p1', '2019-08-02', supplier_id='s2'),
+    ])
+
+    assert projections[('s1', 'b1', 'p1')]['start_date'] == '2019-08-10'
+    assert projections[('s2', 'b1', 'p1')]['start_date'] == '2019-08-02'
+
+
+def test_coalesce_folds_products_into_supplier_wide_message():
+    supplier_projections, projections = coalesce([
+        product('b1', 'p1', '2019-08-01', full_rewrite=True),
+        record(start_date='2019-08-05'),
+        product('b2', 'p2', '2019-08-03', supplier_id='other'),
+    ])
+
+    assert list(projections) == [('other', 'b2', 'p2')]
+
+    supplier_projection = supplier_projections['supplier']
+    assert supplier_projection['products'] is None
+    assert supplier_projection['start_date'] == '2019-08-01'
+    assert supplier_projection['full_rewrite'] is True
+
+
+def test_coalesce_folds_only_products_listed_by_supplier_message():
+    supplier_projections, projections = coalesce([
+        record(start_date='2019-08-05', products=[{'brand_id': 'b1', 'package_type_id': 'p1'}]),
+        record(start_date='2019-08-04', products=[{'brand_id': 'b2', 'package_type_id': 'p2'}]),
+        product('b1', 'p1', '2019-08-01'),
+        product('b3', 'p3', '2019-08-02'),
+    ])
+
+    assert list(projections) == [('supplier', 'b3', 'p3')]
+
+    supplier_projection = supplier_projections['supplier']
+    assert supplier_projection['products'] == {('b1', 'p1'), ('b2', 'p2')}
+    assert supplier_projection['start_date'] == '2019-08-01'
+
+
+def test_coalesce_supplier_message_without_products_covers_every_product():
+    supplier_projections, projections = coalesce([
+        record(start_date='2019-08-05', products=[{'brand_id': 'b1', 'package_type_id': 'p1'}]),
+        record(start_date='2019-08-06'),
+    ])
+
+    assert supplier_projections['supplier']['products'] is None
+
+
+def test_group_request_id_differs_per_group():
+    ids = {
+        group_request_id('invocation', 'supplier'),
+        group_request_id('invocation', ('supplier', 'b1', 'p1')),
+        group_request_id('invocation', ('supplier', 'b2', 'p1')),
+        group_request_id('other invocation', 'supplier'),
+    }
+
+    assert len(ids) == 4
+    assert all(len(request_id) == 36 for request_id in ids)
+    assert group_request_id('invocation', 'supplier') == group_request_id('invocation', 'supplier')
+
+
+class FakeSQS:
+    def __init__(self):
+        self.sent = []
+
+    def get_queue_url(self, QueueName):
+        return {'QueueUrl': 'https://sqs/' + QueueName}
+
+    def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+        return {'MessageId': str(len(self.sent))}
+
+
+@pytest.fixture
+def sqs(dynamodb, monkeypatch):
+    """FakeSQS behind data_dynamodb.clients, next to the FakeDynamoClient"""
+    fake = FakeSQS()
+    monkeypatch.setattr(clients, 'client', lambda service, **kwargs: fake if service == 'sqs' else dynamodb)
+    return fake
+
+
+def test_requeue_projections_backs_off_exponentially(build_repository, sqs, monkeypatch):
+    monkeypatch.setenv('PROJECTIONS_LOCK_RETRY_DELAY_SECONDS', '15')
+    repo = build_repository()
+    obj = {'supplier_id': 'supplier', 'start_date': '2019-08-01'}
+
+    for attempt in range(3):
+        repo.requeue_projections(obj, attempt)
+
+    assert [sent['DelaySeconds'] for sent in sqs.sent] == [15, 30, 60]
+    assert [json.loads(sent['MessageBody'])['lock_attempts'] for sent in sqs.sent] == [1, 2, 3]
+    assert sqs.sent[0]['QueueUrl'] == 'https://sqs/test-projections'
+    assert 'lock_attempts' not in obj
+
+
+def test_requeue_projections_delay_is_capped(build_repository, sqs, monkeypatch):
+    monkeypatch.setenv('PROJECTIONS_MAX_LOCK_ATTEMPTS', '20')
+    repo = build_repository()
+
+    repo.requeue_projections({'supplier_id': 'supplier'}, 12)
+
+    assert sqs.sent[0]['DelaySeconds'] == 900
+
+
+def test_requeue_projections_drops_after_max_attempts(build_repository, sqs, monkeypatch):
+    monkeypatch.setenv('PROJECTIONS_MAX_LOCK_ATTEMPTS', '3')
+    repo = build_repository()
+
+    assert repo.requeue_projections({'supplier_id': 'supplier'}, 1) is not None
+    assert repo.requeue_projections({'supplier_id': 'supplier'}, 2) is None
+    assert len(sqs.sent) == 1
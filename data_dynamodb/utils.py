@@ -29,6 +29,26 @@ def check_properties_datatypes(obj, attributes):
                 raise BadParameters(key)
 
 
+def check_unique_entity_ids(objs):
+    """
+    Entities saved together are saved once each, see ExtendedDynamoStorage.save_many()
+
+    :raise BadParameters: an entity_id is repeated
+    """
+    entity_ids = [obj['entity_id'] for obj in objs if obj.get('entity_id')]
+    if len(set(entity_ids)) != len(entity_ids):
+        raise BadParameters('entity_id')
+
+
+def bump_memberships_version(app_metadata):
+    """
+    Count a change of the suppliers / distributors of app_metadata, in place. The claims of the
+    tokens issued afterwards carry it, see AUTH0_APP_METADATA_CLAIM in services/common.py
+    """
+    app_metadata['memberships_version'] = app_metadata.get('memberships_version', 0) + 1
+    return app_metadata
+
+
 def generate_random_password():
     """Generate a random string of fixed length """
     password_length = 12
@@ -0,0 +1,23 @@
+STAGE=$1
+SCRIPT_NUM=52
+
+echo "Add fencing_token column to projection_locks"
+python $PWD/deployment_scripts/52_PROJECTION_LOCK_LEASE/alter_projection_locks_table.py $STAGE
+
+if [ $? = 0 ]; then
+    echo "Successfully altered projection_locks"
+else
+    echo "Altering projection_locks failed"
+    exit 1
+fi
+
+echo "Add script number to deployment table"
+cd $PWD/deployment_scripts/common || exit
+python add_script_number_to_deployment_table.py $STAGE $SCRIPT_NUM
+
+if [ $? = 0 ]; then
+    echo "Script number successfully added to deployment table"
+else
+    echo "Script number already exists or deployment table doesn't exist. Exiting..."
+    exit 1
+fi
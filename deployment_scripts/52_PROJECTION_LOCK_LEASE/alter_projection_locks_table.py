@@ -0,0 +1,80 @@
+import boto3
+import time
+from botocore.exceptions import ClientError
+
+
+# projection locks are leases with a fencing token, incremented on every takeover
+ALTER_PROJECTION_LOCKS = (
+    "ALTER TABLE `projection_locks` "
+    "ADD COLUMN `fencing_token` BIGINT NOT NULL DEFAULT 0")
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    import os
+
+    args = sys.argv
+    if len(args) >= 2:
+        stage = args[1]
+
+        config_filename = 'config.' + stage + '.json'
+        parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        config_filepath = os.path.join(parent_dir, config_filename)
+
+        with open(config_filepath, 'r') as fp:
+            config = json.load(fp)
+
+        region = config['REGION']
+        rds_client = boto3.client('rds-data', region_name=region)
+
+        try:
+            db_arn = config["AURORA_DB_ARN"]
+            db_secret_arn = config["AURORA_DB_SECRET_ARN"]
+            db_name = config["AURORA_DB_NAME"]
+        except KeyError:
+            print("""Missing key-val pairs AURORA_DB_ARN, AURORA_DB_SECRET_ARN and/or AURORA_DB_NAME in {CONFIG}
+            Unable to alter SQL Tables""".format(CONFIG=config_filename))
+            sys.exit(1)
+
+        for i in range(3):
+            try:
+                response = rds_client.execute_statement(
+                    secretArn=db_secret_arn,
+                    database=db_name,
+                    resourceArn=db_arn,
+                    sql="""SELECT *
+                    FROM information_schema.columns
+                    WHERE table_schema = '{DB_NAME}'
+                    AND table_name = 'projection_locks'
+                    AND column_name = 'fencing_token'
+                    LIMIT 1;
+                    """.format(DB_NAME=db_name)
+                )
+                break
+            except ClientError as ex:
+                print(ex)
+                print("Attempt {0}".format(i))
+                if ex.response['Error']['Code'] == 'BadRequestException':
+                    pass  # Assuming Connection Link error
+                else:
+                    raise ex
+
+                time.sleep(30)
+        else:
+            raise Exception("Mysql Connection Link Failure. Tried 3 times and failed")
+
+        is_column_exists = bool(response.get("records", None))
+
+        if not is_column_exists:
+            print('Adding fencing_token to projection_locks')
+            rds_client.execute_statement(
+                secretArn=db_secret_arn,
+                database=db_name,
+                resourceArn=db_arn,
+                sql=ALTER_PROJECTION_LOCKS
+            )
+    else:
+        print("""FAILED: Running projection_locks alter script.
+                 STAGE needs to be passed as a positional argument
+                 while running the script""")
@@ -0,0 +1,23 @@
+STAGE=$1
+SCRIPT_NUM=53
+
+echo "Add by_supplier_id_and_primary_key index to on_hand"
+python $PWD/deployment_scripts/53_ON_HAND_KEYSET_INDEX/create_on_hand_index.py $STAGE
+
+if [ $? = 0 ]; then
+    echo "Successfully created on_hand index"
+else
+    echo "Creating on_hand index failed"
+    exit 1
+fi
+
+echo "Add script number to deployment table"
+cd $PWD/deployment_scripts/common || exit
+python add_script_number_to_deployment_table.py $STAGE $SCRIPT_NUM
+
+if [ $? = 0 ]; then
+    echo "Script number successfully added to deployment table"
+else
+    echo "Script number already exists or deployment table doesn't exist. Exiting..."
+    exit 1
+fi
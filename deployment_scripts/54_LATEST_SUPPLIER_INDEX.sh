@@ -0,0 +1,27 @@
+STAGE=$1
+SCRIPT_NUM=54
+
+# Run after the services are deployed: only the new code keeps latest_supplier_id on the latest
+# active version alone. add_latest_supplier_index.py can be run again by hand, it prunes what the
+# previous code left behind. The readers keep to by_supplier_id_and_obj_type until the script
+# number is recorded below.
+echo "Add by_latest_supplier_id_and_obj_type index to brewoptix table"
+python $PWD/deployment_scripts/54_LATEST_SUPPLIER_INDEX/add_latest_supplier_index.py $STAGE
+
+if [ $? = 0 ]; then
+    echo "Successfully added latest_supplier_id index"
+else
+    echo "Adding latest_supplier_id index failed"
+    exit 1
+fi
+
+echo "Add script number to deployment table"
+cd $PWD/deployment_scripts/common || exit
+python add_script_number_to_deployment_table.py $STAGE $SCRIPT_NUM
+
+if [ $? = 0 ]; then
+    echo "Script number successfully added to deployment table"
+else
+    echo "Script number already exists or deployment table doesn't exist. Exiting..."
+    exit 1
+fi
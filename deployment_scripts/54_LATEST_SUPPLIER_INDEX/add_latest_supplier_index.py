@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+
+INDEX_NAME = 'by_latest_supplier_id_and_obj_type'
+
+
+def wait_for_index(client, table_name):
+    while True:
+        response = client.describe_table(TableName=table_name)
+        for index in response['Table'].get('GlobalSecondaryIndexes', []):
+            if index['IndexName'] == INDEX_NAME and index['IndexStatus'] == 'ACTIVE':
+                return
+        print('Waiting for {INDEX} to become ACTIVE'.format(INDEX=INDEX_NAME))
+        time.sleep(30)
+
+
+def backfill(table):
+    """
+    Set latest_supplier_id on the latest active version of every entity that has a supplier_id.
+    A version superseded or deactivated between the scan and its update is left alone
+    """
+    count = 0
+    skipped = 0
+    scan_kwargs = {
+        'FilterExpression': Attr('latest').eq(True) & Attr('active').eq(True) &
+                            Attr('supplier_id').exists() & Attr('latest_supplier_id').not_exists(),
+        'ProjectionExpression': 'entity_id, version, supplier_id',
+    }
+    while True:
+        resp = table.scan(**scan_kwargs)
+
+        for item in resp['Items']:
+            try:
+                table.update_item(
+                    Key={'entity_id': item['entity_id'], 'version': item['version']},
+                    UpdateExpression='SET latest_supplier_id = :supplier_id',
+                    ConditionExpression=Attr('latest').eq(True) & Attr('active').eq(True),
+                    ExpressionAttributeValues={':supplier_id': item['supplier_id']},
+                )
+                count += 1
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                skipped += 1
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+        scan_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    print('Set latest_supplier_id on {N} items, {M} superseded since the scan'.format(N=count, M=skipped))
+
+
+def prune(table):
+    """
+    Remove latest_supplier_id from superseded and inactive versions, e.g. versions superseded
+    by the previous code after they were backfilled
+    """
+    count = 0
+    scan_kwargs = {
+        'FilterExpression': Attr('latest_supplier_id').exists() &
+                            (Attr('latest').ne(True) | Attr('active').ne(True)),
+        'ProjectionExpression': 'entity_id, version',
+    }
+    while True:
+        resp = table.scan(**scan_kwargs)
+
+        for item in resp['Items']:
+            table.update_item(
+                Key={'entity_id': item['entity_id'], 'version': item['version']},
+                UpdateExpression='REMOVE latest_supplier_id',
+            )
+            count += 1
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+        scan_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    print('Removed latest_supplier_id from {N} items'.format(N=count))
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    if len(args) >= 2:
+        stage = args[1]
+
+        config_filename = 'config.' + stage + '.json'
+        parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        config_filepath = os.path.join(parent_dir, config_filename)
+
+        with open(config_filepath, 'r') as fp:
+            config = json.load(fp)
+
+        region = config['REGION']
+        table_name = 'brewoptix-{STAGE}'.format(STAGE=stage)
+
+        try:
+            endpoint = args[2]
+            client = boto3.client('dynamodb', region_name=region, endpoint_url=endpoint)
+            resource = boto3.resource('dynamodb', region_name=region, endpoint_url=endpoint)
+        except IndexError:
+            client = boto3.client('dynamodb', region_name=region)
+            resource = boto3.resource('dynamodb', region_name=region)
+
+        response = client.describe_table(TableName=table_name)
+        global_indexes = response['Table'].get('GlobalSecondaryIndexes', [])
+        index_list = [index['IndexName'] for index in global_indexes]
+        if INDEX_NAME not in index_list:
+            print('Adding Global Secondary index {INDEX} on {TABLE}'.format(INDEX=INDEX_NAME, TABLE=table_name))
+            client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=[
+                    {'AttributeName': 'latest_supplier_id', 'AttributeType': 'S'},
+                    {'AttributeName': 'obj_type', 'AttributeType': 'S'}],
+                GlobalSecondaryIndexUpdates=[
+                    {
+                        'Create': {
+                            'IndexName': INDEX_NAME,
+                            'KeySchema': [
+                                {
+                                    'AttributeName': 'latest_supplier_id',
+                                    'KeyType': 'HASH'
+                                },
+                                {
+                                    'AttributeName': 'obj_type',
+                                    'KeyType': 'RANGE'
+                                }
+                            ],
+                            'Projection': {
+                                'ProjectionType': 'ALL'
+                            },
+                            'ProvisionedThroughput': {
+                                'ReadCapacityUnits': 4,
+                                'WriteCapacityUnits': 4
+                            }
+                        }
+                    }
+                ],
+            )
+
+        wait_for_index(client, table_name)
+        # versions superseded by the previous code after their backfill, still deployed while it runs,
+        # keep latest_supplier_id, prune removes it
+        backfill(resource.Table(table_name))
+        prune(resource.Table(table_name))
+    else:
+        print("""FAILED: Running latest_supplier_id index script.
+                 STAGE needs to be passed as a positional argument
+                 while running the script""")
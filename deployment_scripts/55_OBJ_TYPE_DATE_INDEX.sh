@@ -0,0 +1,27 @@
+STAGE=$1
+SCRIPT_NUM=55
+
+# Run after the services are deployed, and after 54_LATEST_SUPPLIER_INDEX: obj_type_date follows
+# latest_supplier_id. add_obj_type_date_index.py can be run again by hand, it prunes what the previous
+# code left behind. get_count_by_count_date_range keeps to by_supplier_id_and_obj_type until the
+# script number is recorded below.
+echo "Add by_latest_supplier_id_and_obj_type_date index to brewoptix table"
+python $PWD/deployment_scripts/55_OBJ_TYPE_DATE_INDEX/add_obj_type_date_index.py $STAGE
+
+if [ $? = 0 ]; then
+    echo "Successfully added obj_type_date index"
+else
+    echo "Adding obj_type_date index failed"
+    exit 1
+fi
+
+echo "Add script number to deployment table"
+cd $PWD/deployment_scripts/common || exit
+python add_script_number_to_deployment_table.py $STAGE $SCRIPT_NUM
+
+if [ $? = 0 ]; then
+    echo "Script number successfully added to deployment table"
+else
+    echo "Script number already exists or deployment table doesn't exist. Exiting..."
+    exit 1
+fi
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+
+INDEX_NAME = 'by_latest_supplier_id_and_obj_type_date'
+
+# obj_type -> date attribute, as in data_dynamodb/extended_data_adapter.py
+OBJ_TYPE_DATE_ATTRIBUTES = {
+    'counts': 'count_date',
+    'production': 'production_date',
+    'adjustments': 'adjustment_date',
+}
+
+
+def obj_type_date(obj_type, date):
+    if isinstance(date, str):
+        return '{OBJ_TYPE}#{DATE}'.format(OBJ_TYPE=obj_type, DATE=date)
+    return '{OBJ_TYPE}#{DATE:012d}'.format(OBJ_TYPE=obj_type, DATE=int(date))
+
+
+def wait_for_index(client, table_name):
+    while True:
+        response = client.describe_table(TableName=table_name)
+        for index in response['Table'].get('GlobalSecondaryIndexes', []):
+            if index['IndexName'] == INDEX_NAME and index['IndexStatus'] == 'ACTIVE':
+                return
+        print('Waiting for {INDEX} to become ACTIVE'.format(INDEX=INDEX_NAME))
+        time.sleep(30)
+
+
+def backfill(table):
+    """
+    Set obj_type_date on the items that carry latest_supplier_id, see 54_LATEST_SUPPLIER_INDEX.
+    A version superseded or deactivated between the scan and its update is left alone
+    """
+    count = 0
+    skipped = 0
+    for obj_type, date_attribute in OBJ_TYPE_DATE_ATTRIBUTES.items():
+        scan_kwargs = {
+            'FilterExpression': Attr('obj_type').eq(obj_type) & Attr('latest_supplier_id').exists() &
+                                Attr(date_attribute).exists(),
+            'ProjectionExpression': 'entity_id, version, #date',
+            'ExpressionAttributeNames': {'#date': date_attribute},
+        }
+        while True:
+            resp = table.scan(**scan_kwargs)
+
+            for item in resp['Items']:
+                try:
+                    table.update_item(
+                        Key={'entity_id': item['entity_id'], 'version': item['version']},
+                        UpdateExpression='SET obj_type_date = :obj_type_date',
+                        ConditionExpression=Attr('latest').eq(True) & Attr('active').eq(True) &
+                                            Attr('latest_supplier_id').exists(),
+                        ExpressionAttributeValues={':obj_type_date': obj_type_date(obj_type, item[date_attribute])},
+                    )
+                    count += 1
+                except table.meta.client.exceptions.ConditionalCheckFailedException:
+                    skipped += 1
+
+            if 'LastEvaluatedKey' not in resp:
+                break
+            scan_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    print('Set obj_type_date on {N} items, {M} superseded since the scan'.format(N=count, M=skipped))
+
+
+def prune(table):
+    """
+    Remove obj_type_date from superseded and inactive versions, and from items without latest_supplier_id,
+    e.g. versions superseded by the previous code after they were backfilled
+    """
+    count = 0
+    scan_kwargs = {
+        'FilterExpression': Attr('obj_type_date').exists() &
+                            (Attr('latest').ne(True) | Attr('active').ne(True) |
+                             Attr('latest_supplier_id').not_exists()),
+        'ProjectionExpression': 'entity_id, version',
+    }
+    while True:
+        resp = table.scan(**scan_kwargs)
+
+        for item in resp['Items']:
+            table.update_item(
+                Key={'entity_id': item['entity_id'], 'version': item['version']},
+                UpdateExpression='REMOVE obj_type_date',
+            )
+            count += 1
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+        scan_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    print('Removed obj_type_date from {N} items'.format(N=count))
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    if len(args) >= 2:
+        stage = args[1]
+
+        config_filename = 'config.' + stage + '.json'
+        parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        config_filepath = os.path.join(parent_dir, config_filename)
+
+        with open(config_filepath, 'r') as fp:
+            config = json.load(fp)
+
+        region = config['REGION']
+        table_name = 'brewoptix-{STAGE}'.format(STAGE=stage)
+
+        try:
+            endpoint = args[2]
+            client = boto3.client('dynamodb', region_name=region, endpoint_url=endpoint)
+            resource = boto3.resource('dynamodb', region_name=region, endpoint_url=endpoint)
+        except IndexError:
+            client = boto3.client('dynamodb', region_name=region)
+            resource = boto3.resource('dynamodb', region_name=region)
+
+        response = client.describe_table(TableName=table_name)
+        global_indexes = response['Table'].get('GlobalSecondaryIndexes', [])
+        index_list = [index['IndexName'] for index in global_indexes]
+        if INDEX_NAME not in index_list:
+            print('Adding Global Secondary index {INDEX} on {TABLE}'.format(INDEX=INDEX_NAME, TABLE=table_name))
+            client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=[
+                    {'AttributeName': 'latest_supplier_id', 'AttributeType': 'S'},
+                    {'AttributeName': 'obj_type_date', 'AttributeType': 'S'}],
+                GlobalSecondaryIndexUpdates=[
+                    {
+                        'Create': {
+                            'IndexName': INDEX_NAME,
+                            'KeySchema': [
+                                {
+                                    'AttributeName': 'latest_supplier_id',
+                                    'KeyType': 'HASH'
+                                },
+                                {
+                                    'AttributeName': 'obj_type_date',
+                                    'KeyType': 'RANGE'
+                                }
+                            ],
+                            'Projection': {
+                                'ProjectionType': 'ALL'
+                            },
+                            'ProvisionedThroughput': {
+                                'ReadCapacityUnits': 4,
+                                'WriteCapacityUnits': 4
+                            }
+                        }
+                    }
+                ],
+            )
+
+        wait_for_index(client, table_name)
+        # versions superseded by the previous code after their backfill, still deployed while it runs,
+        # keep obj_type_date, prune removes it
+        backfill(resource.Table(table_name))
+        prune(resource.Table(table_name))
+    else:
+        print("""FAILED: Running obj_type_date index script.
+                 STAGE needs to be passed as a positional argument
+                 while running the script""")
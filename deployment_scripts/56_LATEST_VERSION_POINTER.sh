@@ -0,0 +1,25 @@
+STAGE=$1
+SCRIPT_NUM=56
+
+# Run after the services are deployed: from then on every save rewrites the latest pointer of its
+# entity. Until it has run, batch_get() reads the entities without a pointer with a query each.
+echo "Add latest version pointers to brewoptix table"
+python $PWD/deployment_scripts/56_LATEST_VERSION_POINTER/add_latest_version_pointers.py $STAGE
+
+if [ $? = 0 ]; then
+    echo "Successfully added latest version pointers"
+else
+    echo "Adding latest version pointers failed"
+    exit 1
+fi
+
+echo "Add script number to deployment table"
+cd $PWD/deployment_scripts/common || exit
+python add_script_number_to_deployment_table.py $STAGE $SCRIPT_NUM
+
+if [ $? = 0 ]; then
+    echo "Script number successfully added to deployment table"
+else
+    echo "Script number already exists or deployment table doesn't exist. Exiting..."
+    exit 1
+fi
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import boto3
+
+
+# sort key of the latest version pointer, see data_dynamodb.extended_data_adapter
+LATEST_POINTER = 'latest'
+LATEST_POINTER_VERSION = 'latest_version'
+
+
+def backfill(client, table_name):
+    """
+    Write the latest pointer of every entity saved before the pointers existed.
+
+    The put is conditional on the pointer not existing: an entity saved since the services were
+    deployed already has a pointer to a newer version, which is not overwritten.
+    """
+    count = 0
+    skipped = 0
+    scan_kwargs = {
+        'TableName': table_name,
+        'FilterExpression': 'latest = :true',
+        'ExpressionAttributeValues': {':true': {'BOOL': True}},
+    }
+    while True:
+        resp = client.scan(**scan_kwargs)
+
+        for item in resp['Items']:
+            try:
+                client.put_item(
+                    TableName=table_name,
+                    Item={
+                        'entity_id': item['entity_id'],
+                        'version': {'S': LATEST_POINTER},
+                        LATEST_POINTER_VERSION: item['version'],
+                    },
+                    ConditionExpression='attribute_not_exists(entity_id)',
+                )
+                count += 1
+            except client.exceptions.ConditionalCheckFailedException:
+                skipped += 1
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+        scan_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    print('Wrote {N} latest pointers, {SKIPPED} entities already had one'.format(N=count, SKIPPED=skipped))
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    if len(args) >= 2:
+        stage = args[1]
+
+        config_filename = 'config.' + stage + '.json'
+        parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        config_filepath = os.path.join(parent_dir, config_filename)
+
+        with open(config_filepath, 'r') as fp:
+            config = json.load(fp)
+
+        region = config['REGION']
+        table_name = 'brewoptix-{STAGE}'.format(STAGE=stage)
+
+        try:
+            endpoint = args[2]
+            client = boto3.client('dynamodb', region_name=region, endpoint_url=endpoint)
+        except IndexError:
+            client = boto3.client('dynamodb', region_name=region)
+
+        backfill(client, table_name)
+    else:
+        print("""FAILED: Running latest version pointer script.
+                 STAGE needs to be passed as a positional argument
+                 while running the script""")
@@ -0,0 +1,49 @@
+"""
+Start a version compaction run by hand. Deploy the service first:
+
+    cd deployment_scripts/version_compaction_service && sls deploy -v --stage STAGE
+
+usage: python compact_versions.py STAGE [--keep-versions N] [--total-segments N]
+                                        [--max-deletes-per-second N] [--no-dry-run]
+
+Runs are dry by default: the segments only print how many versions they would archive and delete.
+"""
+import argparse
+import json
+import os
+
+import boto3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact the version history of the brewoptix table')
+    parser.add_argument('stage')
+    parser.add_argument('--keep-versions', type=int, default=10,
+                        help='versions kept per entity, latest included')
+    parser.add_argument('--total-segments', type=int, default=4)
+    parser.add_argument('--max-deletes-per-second', type=float, default=100,
+                        help='delete throughput of the whole run, 0 for no limit')
+    parser.add_argument('--no-dry-run', dest='dry_run', action='store_false')
+    args = parser.parse_args()
+
+    config_filename = 'config.' + args.stage + '.json'
+    parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    config_filepath = os.path.join(parent_dir, config_filename)
+
+    with open(config_filepath, 'r') as fp:
+        config = json.load(fp)
+
+    lambda_client = boto3.client('lambda', region_name=config['REGION'])
+    response = lambda_client.invoke(
+        FunctionName="{STAGE}-BREWOPTIX-VERSION-COMPACTION-FN-compact-versions".format(STAGE=args.stage),
+        InvocationType='RequestResponse',
+        Payload=json.dumps(
+            {
+                'keep_versions': args.keep_versions,
+                'total_segments': args.total_segments,
+                'max_deletes_per_second': args.max_deletes_per_second,
+                'dry_run': args.dry_run,
+            }
+        )
+    )
+    print(json.loads(response['Payload'].read()))
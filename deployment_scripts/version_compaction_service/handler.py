@@ -0,0 +1,346 @@
+"""
+Version history compaction of the brewoptix-{STAGE} table.
+
+Every save writes a new version item and keeps the previous one. compact_versions() fans a parallel
+segmented scan out over one compact_segment() invocation per segment; each segment archives every version
+of an entity but the `keep_versions` most recent to S3 and deletes them from the table.
+
+Archives are gzipped json lines, one DynamoDB JSON item per line, so they can be written back with
+batch_write_item as they are:
+
+    s3://{bucket}/brewoptix-{STAGE}/{run_id}/segment-{segment:04d}-{part:05d}.jsonl.gz
+
+Deletes still unprocessed after DELETE_MAX_ATTEMPTS calls (the table is throttled) are handed over to
+the next invocation like the scan cursor is, as the archive holding them and the offset of the first one
+not deleted. The next invocation reads them back from the archive and deletes them first.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+import boto3
+
+
+DELETE_CHUNK_SIZE = 25
+ARCHIVE_CHUNK_SIZE = 5000
+SCAN_PAGE_SIZE = 100
+MAX_BACKOFF = 5
+
+# batch_write_item calls per chunk of deletes before handing the rest over
+DELETE_MAX_ATTEMPTS = 8
+
+# invocations in a row handed over with deletes left, the segment gives up after that and
+# leaves the archived versions in the table, the next run archives and deletes them again
+MAX_THROTTLED_HANDOVERS = 5
+
+# sort key of the latest version pointer of an entity (see data_dynamodb.extended_data_adapter),
+# it is not a version and is never compacted
+LATEST_POINTER = 'latest'
+
+# stop and hand over to a new invocation when less time than this is left
+TIME_MARGIN_MILLIS = 120 * 1000
+
+
+class RateLimiter:
+    """Spread `rate` units per second evenly, a rate of 0 (or None) does not limit"""
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+
+    def wait(self, units=1):
+        if not self._interval:
+            return
+
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + units * self._interval
+
+
+def stale_versions(versions, keep_versions):
+    """
+    Versions to archive and delete: all but the `keep_versions` most recent by changed_on.
+    The latest version is always kept and counts towards keep_versions. The latest pointer is not
+    a version, it is left alone.
+
+    `versions` can be a part only of the versions of an entity (a scan handed over between two
+    invocations in the middle of an entity). Every version returned still has at least keep_versions
+    more recent ones, so a partial view never deletes too much.
+
+    :param versions: list of DynamoDB JSON items of the same entity_id
+    """
+    versions = [item for item in versions if item['version']['S'] != LATEST_POINTER]
+    if len(versions) <= keep_versions:
+        return []
+
+    ordered = sorted(versions,
+                     key=lambda item: (item.get('latest', {}).get('BOOL', False),
+                                       item.get('changed_on', {}).get('S', '')),
+                     reverse=True)
+    return [item for item in ordered[max(keep_versions, 1):] if not item.get('latest', {}).get('BOOL', False)]
+
+
+class SegmentCompactor:
+    def __init__(self, dynamo_client, s3_client, table_name, bucket, run_id, segment,
+                 keep_versions, dry_run, max_deletes_per_second, part=0, undeleted=None):
+        self._dynamo_client = dynamo_client
+        self._s3_client = s3_client
+        self._table_name = table_name
+        self._bucket = bucket
+        self._run_id = run_id
+        self._segment = segment
+        self._keep_versions = keep_versions
+        self._dry_run = dry_run
+        self._delete_limiter = RateLimiter(max_deletes_per_second)
+
+        self.part = part
+        self.scanned = 0
+        self.stale = 0
+        self.deleted = 0
+
+        # archives whose versions are not all deleted yet, [{'key': s3 key, 'offset': first not deleted}]
+        self.undeleted = list(undeleted or [])
+
+        self._pending = []
+
+    def add_entity(self, versions):
+        stale = stale_versions(versions, self._keep_versions)
+        self.stale += len(stale)
+
+        if not self._dry_run:
+            self._pending.extend(stale)
+            if len(self._pending) >= ARCHIVE_CHUNK_SIZE:
+                self.flush()
+
+    def flush(self):
+        """
+        Archive the pending versions, and only once they are in S3, delete them. Once deletes are left
+        over, the table is throttled: the next archives are not deleted either, only listed in undeleted.
+        """
+        if not self._pending:
+            return
+
+        key = self._archive(self._pending)
+        offset = self._delete(self._pending) if not self.undeleted else 0
+        if offset < len(self._pending):
+            self.undeleted.append({'key': key, 'offset': offset})
+        self._pending = []
+
+    def retry_undeleted(self):
+        """Delete the versions of the archives handed over, stop at the first that is still left over"""
+        while self.undeleted:
+            key, offset = self.undeleted[0]['key'], self.undeleted[0]['offset']
+            body = self._s3_client.get_object(Bucket=self._bucket, Key=key)['Body'].read()
+            items = [json.loads(line) for line in gzip.decompress(body).decode('utf-8').splitlines()]
+
+            offset = self._delete(items, offset)
+            if offset < len(items):
+                self.undeleted[0] = {'key': key, 'offset': offset}
+                return
+            self.undeleted.pop(0)
+
+    def _archive(self, items):
+        key = '{TABLE}/{RUN_ID}/segment-{SEGMENT:04d}-{PART:05d}.jsonl.gz'.format(
+            TABLE=self._table_name, RUN_ID=self._run_id, SEGMENT=self._segment, PART=self.part)
+
+        body = '\n'.join(json.dumps(item, separators=(',', ':')) for item in items)
+        self._s3_client.put_object(Bucket=self._bucket, Key=key,
+                                   Body=gzip.compress(body.encode('utf-8')),
+                                   ContentType='application/x-ndjson',
+                                   ContentEncoding='gzip')
+        print("Segment %d archived %d versions to s3://%s/%s" % (self._segment, len(items), self._bucket, key))
+        self.part += 1
+        return key
+
+    def _delete(self, items, offset=0):
+        """
+        Delete items[offset:], DELETE_CHUNK_SIZE per call
+
+        :return: offset of the first chunk still unprocessed after DELETE_MAX_ATTEMPTS calls, len(items)
+        when all are deleted
+        """
+        for i in range(offset, len(items), DELETE_CHUNK_SIZE):
+            chunk = items[i:i + DELETE_CHUNK_SIZE]
+            self._delete_limiter.wait(len(chunk))
+
+            request_items = {
+                self._table_name: [
+                    {
+                        'DeleteRequest': {
+                            'Key': {'entity_id': item['entity_id'], 'version': item['version']}
+                        }
+                    } for item in chunk
+                ]
+            }
+
+            backoff = 0.05
+            for _ in range(DELETE_MAX_ATTEMPTS):
+                resp = self._dynamo_client.batch_write_item(RequestItems=request_items)
+                request_items = resp.get('UnprocessedItems')
+                if not request_items:
+                    break
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+            else:
+                # the deleted part of the chunk is deleted again by whoever takes it over, a no-op
+                print("Segment %d deletes throttled, %d versions left over" % (self._segment, len(items) - i))
+                return i
+
+            self.deleted += len(chunk)
+
+        return len(items)
+
+    def stats(self):
+        return {
+            'segment': self._segment,
+            'scanned': self.scanned,
+            'stale': self.stale,
+            'deleted': self.deleted,
+            'undeleted': self.undeleted,
+            'dry_run': self._dry_run,
+        }
+
+
+def hand_over(context, region, event, compactor, **state):
+    """
+    Invoke compact_segment again with the rest of the segment: the scan cursor in `state` and the
+    deletes left over. Handovers with deletes left over are counted, MAX_THROTTLED_HANDOVERS in a row at most.
+
+    :return: the stats of this invocation
+    """
+    throttled_handovers = event.get('throttled_handovers', 0) + 1 if compactor.undeleted else 0
+    if throttled_handovers > MAX_THROTTLED_HANDOVERS:
+        print("Segment %d gave up after %d throttled handovers: %s" % (
+            compactor.stats()['segment'], MAX_THROTTLED_HANDOVERS, compactor.stats()))
+        return compactor.stats()
+
+    boto3.client('lambda', region_name=region).invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps(dict(event,
+                                part=compactor.part,
+                                undeleted=compactor.undeleted,
+                                throttled_handovers=throttled_handovers,
+                                **state))
+    )
+    print("Segment %d handed over: %s" % (compactor.stats()['segment'], compactor.stats()))
+    return compactor.stats()
+
+
+def compact_segment(event, context):
+    """
+    Compact one scan segment. Hands the rest of the segment over to a new invocation of itself
+    when the lambda is about to time out.
+
+    event:
+        segment, total_segments
+        keep_versions: versions kept per entity, latest included
+        dry_run: only count the versions that would be removed
+        max_deletes_per_second: delete throughput of this segment, 0 for no limit
+        run_id: archive prefix, shared by all segments of a run
+        exclusive_start_key, part, undeleted, throttled_handovers, scan_done: set when handed over
+    """
+    print(event)
+    region = os.environ['REGION']
+    table_name = os.environ['TABLE_NAME']
+    bucket = os.environ['ARCHIVE_BUCKET_NAME']
+
+    segment = event['segment']
+    total_segments = event['total_segments']
+
+    dynamo_client = boto3.client('dynamodb', region_name=region)
+    compactor = SegmentCompactor(dynamo_client, boto3.client('s3', region_name=region),
+                                 table_name, bucket, event['run_id'], segment,
+                                 keep_versions=int(event['keep_versions']),
+                                 dry_run=bool(event.get('dry_run', True)),
+                                 max_deletes_per_second=event.get('max_deletes_per_second', 0),
+                                 part=event.get('part', 0),
+                                 undeleted=event.get('undeleted'))
+
+    # deletes left over by the previous invocation first, and no scanning while the table is throttled
+    compactor.retry_undeleted()
+    if compactor.undeleted:
+        return hand_over(context, region, event, compactor)
+
+    if event.get('scan_done'):
+        print("Segment %d done: %s" % (segment, compactor.stats()))
+        return compactor.stats()
+
+    scan_kwargs = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'Limit': event.get('scan_page_size', SCAN_PAGE_SIZE),
+    }
+    if event.get('exclusive_start_key'):
+        scan_kwargs['ExclusiveStartKey'] = event['exclusive_start_key']
+
+    # a scan returns the versions of an entity next to each other
+    entity_id = None
+    versions = []
+
+    while True:
+        resp = dynamo_client.scan(**scan_kwargs)
+
+        for item in resp['Items']:
+            compactor.scanned += 1
+            if item['entity_id']['S'] != entity_id:
+                compactor.add_entity(versions)
+                entity_id = item['entity_id']['S']
+                versions = []
+            versions.append(item)
+
+        if 'LastEvaluatedKey' not in resp:
+            break
+        scan_kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+        if compactor.undeleted or context.get_remaining_time_in_millis() < TIME_MARGIN_MILLIS:
+            compactor.add_entity(versions)
+            compactor.flush()
+            return hand_over(context, region, event, compactor, exclusive_start_key=resp['LastEvaluatedKey'])
+
+    compactor.add_entity(versions)
+    compactor.flush()
+    if compactor.undeleted:
+        return hand_over(context, region, event, compactor, scan_done=True)
+
+    print("Segment %d done: %s" % (segment, compactor.stats()))
+    return compactor.stats()
+
+
+def compact_versions(event, context):
+    """
+    Start a compaction run, one asynchronous compact_segment invocation per segment
+
+    event:
+        total_segments: number of parallel segments
+        keep_versions: versions kept per entity, latest included
+        dry_run: only count the versions that would be removed
+        max_deletes_per_second: delete throughput of the whole run, spread over the segments
+    """
+    print(event)
+    region = os.environ['REGION']
+    total_segments = int(event.get('total_segments', 4))
+    max_deletes_per_second = float(event.get('max_deletes_per_second', 0))
+
+    lambda_client = boto3.client('lambda', region_name=region)
+    run_id = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
+
+    for segment in range(total_segments):
+        lambda_client.invoke(
+            FunctionName=os.environ['COMPACT_SEGMENT_FUNCTION_NAME'],
+            InvocationType='Event',
+            Payload=json.dumps({
+                'run_id': run_id,
+                'segment': segment,
+                'total_segments': total_segments,
+                'keep_versions': int(event['keep_versions']),
+                'dry_run': bool(event.get('dry_run', True)),
+                'max_deletes_per_second': max_deletes_per_second / total_segments,
+            })
+        )
+
+    print("Started compaction run %s with %d segments" % (run_id, total_segments))
+    return {'run_id': run_id, 'total_segments': total_segments}
@@ -3,7 +3,7 @@
 # Metadata associated with all data stored
 base_attributes = ['entity_id', 'version', 'previous_version',
                    'active', 'latest', 'changed_by_id',
-                   'changed_on']
+                   'changed_on', 'latest_supplier_id', 'obj_type_date']
 
 # Attributes used only for tracking and internal use
-private_base_attributes = ['previous_version', 'active', 'latest']
+private_base_attributes = ['previous_version', 'active', 'latest', 'latest_supplier_id', 'obj_type_date']
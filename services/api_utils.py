@@ -34,6 +34,18 @@ def get_query_parameters(event):
     return parameters
 
 
+def get_fields(event):
+    """
+    :return: list of attribute names requested with ?fields=name,brand_id,...
+    or None when every attribute is wanted
+    """
+    fields = get_query_parameters(event).get('fields')
+    if not fields:
+        return None
+
+    return [field.strip() for field in fields.split(',') if field.strip()] or None
+
+
 def get_headers(event):
     try:
         headers = event['headers']
@@ -100,6 +100,69 @@ def add_brand(event, context):
         logger.log_uncaught_exception()
 
 
+@check_auth
+@insert_repo
+@check_supplier
+def add_brands(event, context):
+    """
+    Add many brands at once, the body is a list of brand objects
+    """
+    logger.debug('event: {}'.format(event))
+
+    try:
+        body = get_body(event)
+    except json.JSONDecodeError:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad parameter(s) in request'
+            })
+        }
+    except:
+        logger.log_uncaught_exception()
+
+    if not isinstance(body, list):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad request. Expected a list of brands'
+            })
+        }
+
+    for item in body:
+        item["supplier_id"] = context.supplier_id
+
+    try:
+        items = context.repo.save_brands(body)
+        return {
+            'statusCode': 200,
+            'body': json.dumps(items)
+        }
+    except BadParameters as ex:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad request. The request was Malformed. Wrong type for key-val pair {KEY}'.format(KEY=str(ex))
+            })
+        }
+    except MissingRequiredKey as ex:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad request. Missing required key-val pair {KEY}'.format(KEY=str(ex))
+            })
+        }
+    except CannotModifyEntityStates:
+        return {
+            'statusCode': 409,
+            'body': json.dumps({
+                'error': 'A brand with the same name already exists'
+            })
+        }
+    except:
+        logger.log_uncaught_exception()
+
+
 @check_auth
 @insert_repo
 @check_supplier
@@ -0,0 +1,144 @@
+"""
+Cold start of every service handler, with the eager DynamoRepository and with LazyDynamoRepository.
+
+Every measurement runs in a fresh interpreter laid out like the deployed lambda: the repository root is
+the task root, the handler is imported as services.<service>.handler. It times
+importlib.import_module() of the handler, then what the first request imports on top of it:
+
+- eager: data_dynamodb.dynamodb_repository, the import insert_repo() used to do
+- lazy: data_dynamodb.lazy_repository, lazy_repository.implementation() of every repository method the
+  handler calls, and the storage adapters the sub-repositories loaded that way build on first use
+
+The fastest of --repeat runs is kept. Run it with the lambda runtime (python3.6), requirements.txt
+installed and the deploy-time modules (log_config.py, services/auth.py, ...) in place. A service whose
+handler cannot be imported is reported with the error, the other ones are still measured.
+
+usage: python services/cold_start_benchmark.py [--repeat N] [service ...]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SERVICES_DIR)
+
+# looked up by insert_repo() / get_repo() on every request
+COMMON_METHODS = ['get_user_app_metadata']
+
+# lazy property of LazyDynamoRepository -> module imported on first use
+ADAPTERS = {
+    '_storage': 'extended_data_adapter',
+    '_auth0': 'auth0_adapter',
+    '_aurora_storage': 'extended_aurora_adapter',
+}
+
+MEASURE = '''
+import importlib
+import inspect
+import json
+import re
+import sys
+import time
+
+sys.path.insert(0, {root!r})
+
+start = time.perf_counter()
+importlib.import_module({handler!r})
+handler_seconds = time.perf_counter() - start
+
+# what insert_repo() does before importing the repository
+sys.path.append('data_dynamodb')
+sys.path.append('data_common')
+
+loaded = []
+start = time.perf_counter()
+if {lazy!r}:
+    from data_dynamodb import lazy_repository
+    for name in {methods!r}:
+        cls = lazy_repository.implementation(name, loaded)
+        if cls is not None and cls not in loaded:
+            loaded.append(cls)
+    for cls in loaded:
+        source = inspect.getsource(cls)
+        for prop, adapter in sorted({adapters!r}.items()):
+            if re.search(r'self\\.{{}}\\b'.format(prop), source):
+                importlib.import_module(adapter)
+else:
+    importlib.import_module('data_dynamodb.dynamodb_repository')
+repository_seconds = time.perf_counter() - start
+
+print(json.dumps({{'handler': handler_seconds, 'repository': repository_seconds, 'loaded': len(loaded)}}))
+'''
+
+
+class ImportFailed(Exception):
+    """Raised when a handler or a repository cannot be imported in the measuring interpreter"""
+
+
+def repo_methods(handler_path):
+    """Names of the repository methods a handler module calls"""
+    with open(handler_path, 'r') as fp:
+        source = fp.read()
+    return sorted(set(COMMON_METHODS) | set(re.findall(r'repo\.([a-zA-Z_]\w*)\(', source)))
+
+
+def measure(service, lazy, repeat):
+    """
+    Import times of a service handler in fresh interpreters, the fastest of `repeat` runs
+
+    :return: dict, handler and repository import seconds, number of sub-repositories loaded
+    """
+    code = MEASURE.format(root=ROOT_DIR,
+                          handler='services.{}.handler'.format(service),
+                          lazy=lazy,
+                          methods=repo_methods(os.path.join(SERVICES_DIR, service, 'handler.py')),
+                          adapters=ADAPTERS)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if out.returncode:
+            raise ImportFailed((out.stderr.decode().strip().splitlines() or ['no output'])[-1])
+        runs.append(json.loads(out.stdout.decode().strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run['handler'] + run['repository'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time per service handler, eager vs lazy repository')
+    parser.add_argument('services', nargs='*', help='service directories, default every one with a handler.py')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the fastest is kept')
+    args = parser.parse_args()
+
+    with_handler = sorted(name for name in os.listdir(SERVICES_DIR)
+                          if os.path.isfile(os.path.join(SERVICES_DIR, name, 'handler.py')))
+    services = args.services or with_handler
+    if set(services) - set(with_handler):
+        parser.error('no handler.py in: {}'.format(', '.join(sorted(set(services) - set(with_handler)))))
+
+    print('python {}, best of {}'.format(sys.version.split()[0], args.repeat))
+    print('{:<24}{:>12}{:>12}{:>12}{:>12}'.format('service', 'handler ms', 'eager ms', 'lazy ms', 'sub-repos'))
+
+    errors = {}
+    for service in services:
+        results = {}
+        for variant in ('eager', 'lazy'):
+            try:
+                results[variant] = measure(service, variant == 'lazy', args.repeat)
+            except ImportFailed as ex:
+                errors.setdefault(str(ex), []).append('{} ({})'.format(service, variant))
+        if not results:
+            continue
+
+        columns = [min(result['handler'] for result in results.values()) * 1000]
+        columns.extend(results[variant]['repository'] * 1000 if variant in results else None
+                       for variant in ('eager', 'lazy'))
+        print('{:<24}'.format(service) + ''.join('{:>12}'.format('failed' if column is None else
+                                                               '{:.1f}'.format(column)) for column in columns)
+              + '{:>12}'.format(results['lazy']['loaded'] if 'lazy' in results else '-'))
+
+    for error, failed in sorted(errors.items()):
+        print('{}: {}'.format(error, ', '.join(failed)))
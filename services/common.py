@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 
 from functools import wraps
 
@@ -11,6 +12,41 @@ import json
 AUTH0_CLIENT_ID = os.getenv('AUTH0_CLIENT_ID')
 AUTH0_CLIENT_PUBLIC_KEY = os.getenv('AUTH0_CLIENT_PUBLIC_KEY')
 
+# Optional. Namespaced claim of the id token carrying the user's memberships, e.g.
+# "https://api.brewoptix.com/app_metadata", added by an Auth0 rule:
+#
+#   context.idToken[namespace] = {
+#       v: 2,
+#       memberships_version: user.app_metadata.memberships_version || 0,
+#       suppliers: user.app_metadata.suppliers || {},
+#       distributors: user.app_metadata.distributors || {}
+#   };
+#
+# When set, insert_repo() authorizes from the claim without any read, as long as the token was issued
+# (iat) less than AUTH0_APP_METADATA_CLAIM_MAX_AGE seconds ago: that age is the revocation window of a
+# membership in claim mode. An older token, or one without the claim, is authorized from the profile.
+# Every change of the memberships bumps memberships_version (see bump_memberships_version).
+# With AUTH0_APP_METADATA_CLAIM_CHECK_VERSION set, the claim is also compared with the memberships_version
+# of the profile, read alone from the latest pointer of the profile (see get_memberships_version), and a
+# token issued before a membership was revoked or granted falls back to the profile at once.
+# A membership granted in Auth0 but not yet in the claim is found by refresh_memberships() before refusing.
+AUTH0_APP_METADATA_CLAIM = os.getenv('AUTH0_APP_METADATA_CLAIM')
+
+# seconds a claim is trusted for after the token was issued
+AUTH0_APP_METADATA_CLAIM_MAX_AGE = int(os.getenv('AUTH0_APP_METADATA_CLAIM_MAX_AGE', 300))
+
+AUTH0_APP_METADATA_CLAIM_CHECK_VERSION = bool(os.getenv('AUTH0_APP_METADATA_CLAIM_CHECK_VERSION'))
+
+# format version of the claim understood here, other versions fall back to storage
+APP_METADATA_CLAIM_VERSION = 2
+
+# refresh_memberships() reads the Auth0 app_metadata of a user at most once per interval, an unknown
+# x-supplier-id / x-distributor-id must not spend the management API rate limit of the tenant
+MEMBERSHIPS_REFRESH_INTERVAL_SECONDS = 60
+
+# user_id -> monotonic time of the last refresh_memberships(), for the life of the container
+_memberships_refreshed = {}
+
 
 class TokenError(Exception):
     """Raised when token is invalid, malformed or expired"""
@@ -21,12 +57,12 @@ def insert_repo(handler):
     def wrapper(event, context):
         sys.path.append('data_dynamodb')
         sys.path.append('data_common')
-        from data_dynamodb.dynamodb_repository import DynamoRepository
+        from data_dynamodb.lazy_repository import LazyDynamoRepository
 
         # While developing, dynamodb local is used. So if `DYANMODB_LOCAL_ENDPOINT` is present in env vars
         # dynamodb boto client is patched to use local db
         try:
-            context.repo = DynamoRepository(
+            context.repo = LazyDynamoRepository(
                 region_name=os.environ['REGION'],
                 table='brewoptix-{STAGE}'.format(STAGE=os.environ['STAGE']),
                 user_id=context.user_id,
@@ -38,7 +74,7 @@ def insert_repo(handler):
             )
 
         except KeyError:
-            context.repo = DynamoRepository(
+            context.repo = LazyDynamoRepository(
                 region_name=os.environ['REGION'],
                 table='brewoptix-{STAGE}'.format(STAGE=os.environ['STAGE']),
                 user_id=context.user_id,
@@ -48,30 +84,110 @@ def insert_repo(handler):
                 aurora_db_name=os.environ['AURORA_DB_NAME']
             )
 
-        # pull and insert app_metadata
-        app_metadata = context.repo.get_user_app_metadata()
+        # pull and insert app_metadata, from the token when it carries it
+        app_metadata = get_claimed_app_metadata(context)
+        context.app_metadata_from_claims = app_metadata is not None
 
-        if "suppliers" in app_metadata:
-            context.suppliers = app_metadata["suppliers"]
-        else:
-            context.suppliers = {}
+        if app_metadata is None:
+            app_metadata = context.repo.get_user_app_metadata()
 
-        if "distributors" in app_metadata:
-            context.distributors = app_metadata["distributors"]
-        else:
-            context.distributors = {}
+        set_memberships(context, app_metadata)
 
-        return handler(event, context)
+        # optimistic concurrency of the saves, any handler can hit it
+        from data_dynamodb.exceptions import VersionConflict
+        try:
+            return handler(event, context)
+        except VersionConflict as ex:
+            body = {
+                'error': 'Modified by another request in the meantime, reload and retry',
+                'entity_ids': ex.entity_ids
+            }
+            if ex.saved:
+                # bulk saves write the objects that did not conflict
+                body['saved'] = ex.saved
+
+            return {
+                'statusCode': 409,
+                'body': json.dumps(body)
+            }
 
     return wrapper
 
 
+def get_claimed_app_metadata(context):
+    """
+    Memberships read from the AUTH0_APP_METADATA_CLAIM claim of the token, see check_auth().
+    Staleness is decided from the token alone: the claim is used while the token is younger than
+    AUTH0_APP_METADATA_CLAIM_MAX_AGE. With AUTH0_APP_METADATA_CLAIM_CHECK_VERSION, its memberships_version
+    must also be the one of the profile, read without the profile, see get_memberships_version().
+
+    :return: app_metadata dict, None when the mode is off, the claim is missing or of another version, the
+    token is too old, or the memberships changed since the token was issued
+    """
+    if not AUTH0_APP_METADATA_CLAIM:
+        return None
+
+    claims = getattr(context, 'claims', {})
+    claim = claims.get(AUTH0_APP_METADATA_CLAIM)
+    if not isinstance(claim, dict) or claim.get('v') != APP_METADATA_CLAIM_VERSION:
+        return None
+
+    issued_at = claims.get('iat')
+    if not isinstance(issued_at, (int, float)) or time.time() - issued_at > AUTH0_APP_METADATA_CLAIM_MAX_AGE:
+        logger.debug('Memberships claim of {ID} issued at {IAT} is too old, reading app_metadata'.format(
+            ID=context.user_id, IAT=issued_at))
+        return None
+
+    if AUTH0_APP_METADATA_CLAIM_CHECK_VERSION:
+        stamp = context.repo.get_memberships_version()
+        if stamp is None or claim.get('memberships_version', 0) != stamp:
+            logger.debug('Memberships claim version {CLAIM} of {ID} is not {STAMP}, reading app_metadata'.format(
+                CLAIM=claim.get('memberships_version'), ID=context.user_id, STAMP=stamp))
+            return None
+
+    return claim
+
+
+def set_memberships(context, app_metadata):
+    if "suppliers" in app_metadata:
+        context.suppliers = app_metadata["suppliers"]
+    else:
+        context.suppliers = {}
+
+    if "distributors" in app_metadata:
+        context.distributors = app_metadata["distributors"]
+    else:
+        context.distributors = {}
+
+
+def refresh_memberships(context):
+    """
+    Before refusing a supplier or distributor that is not in the claim, read the Auth0 app_metadata the
+    claim is built from, it may have been granted there and not be on the profile yet. It is read through
+    the cache, and at most once per MEMBERSHIPS_REFRESH_INTERVAL_SECONDS for a user.
+
+    :return: True when the memberships were re-read
+    """
+    if not getattr(context, 'app_metadata_from_claims', False):
+        return False
+
+    now = time.monotonic()
+    refreshed_on = _memberships_refreshed.get(context.user_id)
+    if refreshed_on is not None and now - refreshed_on < MEMBERSHIPS_REFRESH_INTERVAL_SECONDS:
+        return False
+    _memberships_refreshed[context.user_id] = now
+
+    set_memberships(context, context.repo.get_auth0_app_metadata())
+    context.app_metadata_from_claims = False
+    return True
+
+
 def get_repo(record):
     """This is not a decorator"""
     sys.path.append('data_dynamodb')
     sys.path.append('data_common')
     from data_common.exceptions import UserIdNotInObject
-    from data_dynamodb.dynamodb_repository import DynamoRepository
+    from data_dynamodb.lazy_repository import LazyDynamoRepository
     import json
 
     try:
@@ -83,7 +199,7 @@ def get_repo(record):
     # While developing, dynamodb local is used. So if `DYANMODB_LOCAL_ENDPOINT` is present in env vars
     # dynamodb boto client is patched to use local db
     try:
-        repo = DynamoRepository(
+        repo = LazyDynamoRepository(
             region_name=os.environ['REGION'],
             table='brewoptix-{STAGE}'.format(STAGE=os.environ['STAGE']),
             user_id=user_id,
@@ -94,7 +210,7 @@ def get_repo(record):
         )
 
     except KeyError:
-        repo = DynamoRepository(
+        repo = LazyDynamoRepository(
             region_name=os.environ['REGION'],
             table='brewoptix-{STAGE}'.format(STAGE=os.environ['STAGE']),
             user_id=user_id,
@@ -146,7 +262,8 @@ def check_supplier(handler):
                 })
             }
 
-        if supplier_id not in context.suppliers:
+        if supplier_id not in context.suppliers and \
+                not (refresh_memberships(context) and supplier_id in context.suppliers):
             return {
                 'statusCode': 403,
                 'body': json.dumps({
@@ -193,7 +310,8 @@ def check_distributor(handler):
                 })
             }
 
-        if distributor_id not in context.distributors:
+        if distributor_id not in context.distributors and \
+                not (refresh_memberships(context) and distributor_id in context.distributors):
             return {
                 'statusCode': 403,
                 'body': json.dumps({
@@ -268,6 +386,7 @@ def check_auth(handler):
         if 'email' in decoded and 'sub' in decoded:
             context.email = decoded['email']
             context.user_id = decoded['sub'][6:]
+            context.claims = decoded
 
             # App metadata is inserted into context in insert_repo()
         else:
@@ -409,6 +409,5 @@ def process_distributor_save(event, context):
             repo, _ = get_repo(item)
 
             # delete distributor from app metadata of all users belonging to distributor
-            user_ids = (user["user_id"] for user in obj.get("users", []))
-            for user_id in user_ids:
-                repo.remove_distributor_from_app_metadata(obj["entity_id"], user_id)
+            user_ids = [user["user_id"] for user in obj.get("users", [])]
+            repo.remove_distributor_from_users_app_metadata(obj["entity_id"], user_ids)
@@ -5,9 +5,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import json
 
 from common import insert_repo, check_auth, check_supplier, get_repo
-from api_utils import get_body, get_path_parameters
+from api_utils import get_body, get_path_parameters, get_fields
 from data_common.exceptions import NoSuchEntity, \
-    BadParameters, MissingRequiredKey
+    BadParameters, MissingRequiredKey, AquireProjectionLockError
+from data_dynamodb.projections_queue import coalesce, group_request_id
 
 from log_config import logger
 
@@ -17,11 +18,11 @@ from log_config import logger
 @check_supplier
 def get_every_on_hand(event, context):
     """
-    Get all on_hand
+    Get all on_hand, optionally only the attributes listed in ?fields=
     """
     logger.debug('event: {}'.format(event))
 
-    items = context.repo.get_all_on_hands(context.supplier_id)
+    items = context.repo.get_all_on_hands(context.supplier_id, fields=get_fields(event))
 
     return {
         'statusCode': 200,
@@ -213,18 +214,58 @@ def delete_by_id(event, context):
 def process_projections_queue(event, context):
     """
     Process SQS queue projections
+
+    Messages in a batch are coalesced, see data_dynamodb.projections_queue, and every group
+    is recalculated under its own lease owner id.
     """
     logger.debug('event: {}'.format(event))
     logger.debug('event: {}'.format(context))
 
     records = event['Records']
 
-    for record in records:
-        repo, suppliers = get_repo(record)
-        obj = json.loads(record['body'])
-        supplier_id = obj['supplier_id']
-        brand_id = obj['brand_id']
-        package_type_id = obj['package_type_id']
-        start_date = obj['start_date']
-        repo.process_projections_queue(supplier_id, brand_id, package_type_id,
-                                       start_date, context.aws_request_id)
+    supplier_projections, projections = coalesce(records)
+
+    logger.debug('Coalesced {N} projection messages into {M}'.format(
+        N=len(records), M=len(projections) + len(supplier_projections)))
+
+    for supplier_id, projection in supplier_projections.items():
+        repo, suppliers = get_repo(projection['record'])
+
+        products = None
+        if projection['products'] is not None:
+            products = [{'brand_id': brand_id, 'package_type_id': package_type_id}
+                        for brand_id, package_type_id in sorted(projection['products'])]
+
+        # the products whose lease is busy are requeued, the others are projected
+        busy = repo.process_supplier_projections_queue(supplier_id, projection['start_date'],
+                                                       group_request_id(context.aws_request_id, supplier_id),
+                                                       products=products,
+                                                       incremental=not projection['full_rewrite'])
+        if busy:
+            logger.debug('Projections of {N} products of supplier {ID} requeued'.format(N=len(busy), ID=supplier_id))
+            repo.requeue_projections({
+                'user_id': json.loads(projection['record']['body'])['user_id'],
+                'supplier_id': supplier_id,
+                'start_date': projection['start_date'],
+                'products': busy,
+                'full_rewrite': projection['full_rewrite'],
+            }, projection['lock_attempts'])
+
+    for (supplier_id, brand_id, package_type_id), projection in projections.items():
+        repo, suppliers = get_repo(projection['record'])
+
+        try:
+            repo.process_projections_queue(supplier_id, brand_id, package_type_id, projection['start_date'],
+                                           group_request_id(context.aws_request_id,
+                                                            (supplier_id, brand_id, package_type_id)),
+                                           incremental=not projection['full_rewrite'])
+        except AquireProjectionLockError as ex:
+            logger.debug('Projections of {B}/{P} requeued: {ERR}'.format(B=brand_id, P=package_type_id, ERR=str(ex)))
+            repo.requeue_projections({
+                'user_id': json.loads(projection['record']['body'])['user_id'],
+                'supplier_id': supplier_id,
+                'brand_id': brand_id,
+                'package_type_id': package_type_id,
+                'start_date': projection['start_date'],
+                'full_rewrite': projection['full_rewrite'],
+            }, projection['lock_attempts'])
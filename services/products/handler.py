@@ -5,7 +5,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import json
 
 from common import insert_repo, check_auth, check_supplier, check_supplier_or_distributor
-from api_utils import get_body, get_path_parameters
+from api_utils import get_body, get_path_parameters, get_fields
 from data_common.exceptions import NoSuchEntity, \
     BadParameters, CannotModifyEntityStates, MissingRequiredKey
 
@@ -21,7 +21,7 @@ sys.path.append('data_common')
 @check_supplier_or_distributor
 def get_every_product(event, context):
     """
-    Get all product
+    Get all product, optionally only the attributes listed in ?fields=
     """
     logger.debug('event: {}'.format(event))
 
@@ -32,7 +32,7 @@ def get_every_product(event, context):
         supplier_distributors = context.repo.get_all_distributor_suppliers(distributor_id)
         supplier = [item['supplier_id'] for item in supplier_distributors]
 
-    items = context.repo.get_all_products(supplier)
+    items = context.repo.get_all_products(supplier, fields=get_fields(event))
 
     return {
         'statusCode': 200,
@@ -95,6 +95,69 @@ def add_product(event, context):
         logger.log_uncaught_exception()
 
 
+@check_auth
+@insert_repo
+@check_supplier
+def add_products(event, context):
+    """
+    Add many products at once, the body is a list of product objects
+    """
+    logger.debug('event: {}'.format(event))
+
+    try:
+        body = get_body(event)
+    except json.JSONDecodeError:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad parameter(s) in request'
+            })
+        }
+    except:
+        logger.log_uncaught_exception()
+
+    if not isinstance(body, list):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad request. Expected a list of products'
+            })
+        }
+
+    for item in body:
+        item["supplier_id"] = context.supplier_id
+
+    try:
+        items = context.repo.save_products(body)
+        return {
+            'statusCode': 200,
+            'body': json.dumps(items)
+        }
+    except BadParameters as ex:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad request. The request was Malformed. Wrong type for key-val pair {KEY}'.format(KEY=str(ex))
+            })
+        }
+    except MissingRequiredKey as ex:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Bad request. Missing required key-val pair {KEY}'.format(KEY=str(ex))
+            })
+        }
+    except CannotModifyEntityStates:
+        return {
+            'statusCode': 409,
+            'body': json.dumps({
+                'error': 'The request could not be completed due to a conflict with the current state of the resource'
+            })
+        }
+    except:
+        logger.log_uncaught_exception()
+
+
 @check_auth
 @insert_repo
 @check_supplier
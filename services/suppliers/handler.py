@@ -451,6 +451,5 @@ def process_supplier_save(event, context):
             repo, suppliers = get_repo(item)
 
             # delete supplier from app metadata of all users belonging to supplier
-            user_ids = (user["user_id"] for user in obj.get("users", []))
-            for user_id in user_ids:
-                repo.remove_supplier_from_app_metadata(obj["entity_id"], user_id)
+            user_ids = [user["user_id"] for user in obj.get("users", [])]
+            repo.remove_supplier_from_users_app_metadata(obj["entity_id"], user_ids)